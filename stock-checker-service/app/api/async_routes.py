@@ -0,0 +1,131 @@
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.routes import get_cache_stats
+from app.api.etags import conditional_response, status_list_etag, version_etag
+from app.core.config import settings
+from app.db import database
+from app.db.database import get_async_db
+from app.schemas.product import StockResponse, StockStatusResponse, StockBatchRequest, StockBatchResult
+from app.services.stock_service import StockService
+
+# Same endpoints as app.api.routes, served from the event loop with asyncpg sessions
+async_stock_router = APIRouter()
+
+
+@async_stock_router.post("/batch", response_model=List[StockBatchResult])
+async def get_products_stock(
+    batch_request: StockBatchRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get stock information for several products in one request
+    """
+    if len(batch_request.product_ids) > settings.STOCK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many product IDs, maximum is {settings.STOCK_BATCH_MAX_SIZE}"
+        )
+    
+    try:
+        return await StockService.get_products_stock_async(db, batch_request.product_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving stock: {str(e)}")
+
+
+async_stock_router.add_api_route("/cache/stats", get_cache_stats, methods=["GET"])
+
+
+@async_stock_router.get("", response_model=List[StockStatusResponse])
+async def get_stock_status(
+    response: Response,
+    min: Optional[int] = Query(None, description="Minimum stock level to filter by"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.STOCK_PAGE_MAX_SIZE, description="Page size"),
+    after: Optional[UUID] = Query(None, description="Cursor: return products after this product ID"),
+    stream: bool = Query(False, description="Stream every matching product as NDJSON"),
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get stock status for all products, optionally filtering by minimum stock level.
+    
+    With `limit`, results are paginated by product ID and the `X-Next-Cursor` header holds
+    the `after` value for the next page. With `stream`, all products are written as
+    newline-delimited JSON while they are read from the database.
+    
+    Returns 304 when If-None-Match holds the ETag of the same products at the same versions.
+    """
+    if stream:
+        return StreamingResponse(
+            _stream_stock_status(min, after),
+            media_type="application/x-ndjson"
+        )
+    
+    try:
+        result = await StockService.get_all_stock_status_async(db, min, limit, after)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving stock status: {str(e)}")
+    
+    if limit is not None and len(result) == limit:
+        response.headers["X-Next-Cursor"] = str(result[-1].product_id)
+    
+    return conditional_response(if_none_match, status_list_etag(result), response) or result
+
+
+async def _stream_stock_status(min_stock: Optional[int], after: Optional[UUID]):
+    """
+    Yield NDJSON lines in chunks, using a session that lives as long as the stream
+    """
+    chunk_size = settings.STOCK_STREAM_CHUNK_SIZE
+    async with database.AsyncSessionLocal() as db:
+        lines = []
+        async for item in StockService.iter_stock_status_async(db, min_stock, after, chunk_size):
+            lines.append(item.model_dump_json())
+            if len(lines) >= chunk_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+
+@async_stock_router.get("/low", response_model=List[StockStatusResponse])
+async def get_low_stock_products(
+    response: Response,
+    min: int = Query(10, description="Minimum stock threshold"),
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get all products with stock below the specified minimum
+    """
+    try:
+        result = await StockService.get_low_stock_products_async(db, min)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving low stock products: {str(e)}")
+    
+    return conditional_response(if_none_match, status_list_etag(result), response) or result
+
+
+@async_stock_router.get("/{product_id}", response_model=StockResponse)
+async def get_product_stock(
+    product_id: UUID,
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get stock information for a specific product.
+    
+    The ETag is the product version; returns 304 when If-None-Match already holds it.
+    """
+    try:
+        stock = await StockService.get_product_stock_async(db, product_id)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving stock: {str(e)}")
+    
+    return conditional_response(if_none_match, version_etag(stock.version), response) or stock
@@ -0,0 +1,48 @@
+import hashlib
+from typing import List, Optional
+
+from fastapi import Response
+
+from app.schemas.product import StockStatusResponse
+
+
+def version_etag(version: int) -> str:
+    """
+    ETag of a single product: its version, which every stock change bumps
+    """
+    return f'"{version}"'
+
+
+def status_list_etag(statuses: List[StockStatusResponse]) -> str:
+    """
+    Weak ETag of a list of products, from their IDs and versions in order
+    """
+    digest = hashlib.sha1()
+    for status in statuses:
+        digest.update(f"{status.product_id}:{status.version};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+def conditional_response(if_none_match: Optional[str], etag: str, response: Response) -> Optional[Response]:
+    """
+    Set the ETag on the response and, if the client already has it, return a 304
+    carrying the same headers; otherwise return None
+    """
+    response.headers["ETag"] = etag
+    if _matches(if_none_match, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
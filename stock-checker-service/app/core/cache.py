@@ -1,18 +1,58 @@
 import json
-from typing import Any, Optional, TypeVar, Generic, Type
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, TypeVar, Generic, Type
 import redis
+import redis.asyncio
 from uuid import UUID
 
 from app.core.config import settings
 
 T = TypeVar('T')
 
+# Marks a key as invalidated at a version, so only fills at that version or newer replace it
+TOMBSTONE_FIELD = "tombstone"
+
+# Writes each key unless it holds an entry at a newer version, or at the same version that
+# isn't a tombstone. ARGV: expiry, version field, then a value and version per key
+SET_IF_NEWER_SCRIPT = """
+local expiry = ARGV[1]
+local field = ARGV[2]
+local written = {}
+for i, key in ipairs(KEYS) do
+    local value = ARGV[i * 2 + 1]
+    local version = tonumber(ARGV[i * 2 + 2])
+    local write = 1
+    local current = redis.call('GET', key)
+    if current then
+        local ok, entry = pcall(cjson.decode, current)
+        if ok and type(entry) == 'table' then
+            local current_version = tonumber(entry[field])
+            if current_version and (current_version > version or (current_version == version and entry['tombstone'] ~= true)) then
+                write = 0
+            end
+        end
+    end
+    if write == 1 then
+        redis.call('SET', key, value, 'EX', expiry)
+    end
+    written[i] = write
+end
+return written
+"""
+
 
 class RedisCache:
     """Redis cache implementation"""
     
     _instance = None
     _client = None
+    _async_client = None
+    _set_if_newer = None
+    _aset_if_newer = None
+    # Whether stock-updated events are being consumed, i.e. cached entries are kept fresh
+    events_connected = False
     
     def __new__(cls):
         if cls._instance is None:
@@ -20,11 +60,28 @@ class RedisCache:
             if settings.USE_REDIS_CACHE and settings.REDIS_URI:
                 try:
                     cls._client = redis.from_url(str(settings.REDIS_URI))
+                    # Used by the async read API; connects lazily on first use
+                    cls._async_client = redis.asyncio.from_url(str(settings.REDIS_URI))
+                    cls._set_if_newer = cls._client.register_script(SET_IF_NEWER_SCRIPT)
+                    cls._aset_if_newer = cls._async_client.register_script(SET_IF_NEWER_SCRIPT)
                 except Exception as e:
                     print(f"Error connecting to Redis: {e}")
                     cls._client = None
+                    cls._async_client = None
         return cls._instance
     
+    @property
+    def enabled(self) -> bool:
+        """Whether a Redis client is configured"""
+        return self._client is not None
+    
+    @classmethod
+    def default_expiry(cls) -> int:
+        """Expiry of new entries, short while cached entries can't be kept fresh by events"""
+        if cls.events_connected:
+            return settings.REDIS_CACHE_EXPIRY
+        return min(settings.REDIS_CACHE_EXPIRY, settings.REDIS_CACHE_EXPIRY_WITHOUT_EVENTS)
+    
     def get(self, key: str) -> Optional[str]:
         """Get value from cache"""
         if not self._client:
@@ -43,12 +100,63 @@ class RedisCache:
             return False
         
         try:
-            expiry = expiry or settings.REDIS_CACHE_EXPIRY
+            expiry = expiry or self.default_expiry()
             return self._client.set(key, value, ex=expiry)
         except Exception as e:
             print(f"Error setting value in Redis: {e}")
             return False
     
+    def mget(self, keys: List[str]) -> List[Optional[str]]:
+        """Get several values from cache in a single round trip"""
+        if not self._client or not keys:
+            return [None] * len(keys)
+        
+        try:
+            values = self._client.mget(keys)
+            return [value.decode('utf-8') if value else None for value in values]
+        except Exception as e:
+            print(f"Error getting values from Redis: {e}")
+            return [None] * len(keys)
+    
+    def mset(self, mapping: Dict[str, str], expiry: int = None) -> bool:
+        """Set several values in cache through one pipeline, each with the same expiry"""
+        if not self._client or not mapping:
+            return False
+        
+        try:
+            expiry = expiry or self.default_expiry()
+            pipeline = self._client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipeline.set(key, value, ex=expiry)
+            return all(pipeline.execute())
+        except Exception as e:
+            print(f"Error setting values in Redis: {e}")
+            return False
+    
+    @staticmethod
+    def _set_if_newer_args(mapping: Dict[str, tuple], version_field: str, expiry: int) -> list:
+        """Script arguments for (value, version) pairs"""
+        args = [expiry, version_field]
+        for value, version in mapping.values():
+            args.extend([value, version])
+        return args
+    
+    def mset_if_newer(self, mapping: Dict[str, tuple], version_field: str, expiry: int = None) -> Dict[str, bool]:
+        """
+        Set (value, version) pairs atomically, skipping keys whose cached entry is at a newer
+        version. Returns which keys were written.
+        """
+        if not self._client or not mapping:
+            return {key: False for key in mapping}
+        
+        try:
+            args = self._set_if_newer_args(mapping, version_field, expiry or self.default_expiry())
+            written = self._set_if_newer(keys=list(mapping), args=args)
+            return {key: bool(result) for key, result in zip(mapping, written)}
+        except Exception as e:
+            print(f"Error setting values in Redis: {e}")
+            return {key: False for key in mapping}
+    
     def delete(self, key: str) -> bool:
         """Delete value from cache"""
         if not self._client:
@@ -60,6 +168,75 @@ class RedisCache:
             print(f"Error deleting value from Redis: {e}")
             return False
     
+    async def aget(self, key: str) -> Optional[str]:
+        """Get value from cache without blocking the event loop"""
+        if not self._async_client:
+            return None
+        
+        try:
+            value = await self._async_client.get(key)
+            return value.decode('utf-8') if value else None
+        except Exception as e:
+            print(f"Error getting value from Redis: {e}")
+            return None
+    
+    async def amget(self, keys: List[str]) -> List[Optional[str]]:
+        """Get several values from cache in a single round trip without blocking the event loop"""
+        if not self._async_client or not keys:
+            return [None] * len(keys)
+        
+        try:
+            values = await self._async_client.mget(keys)
+            return [value.decode('utf-8') if value else None for value in values]
+        except Exception as e:
+            print(f"Error getting values from Redis: {e}")
+            return [None] * len(keys)
+    
+    async def aset(self, key: str, value: str, expiry: int = None) -> bool:
+        """Set value in cache without blocking the event loop"""
+        if not self._async_client:
+            return False
+        
+        try:
+            expiry = expiry or self.default_expiry()
+            return bool(await self._async_client.set(key, value, ex=expiry))
+        except Exception as e:
+            print(f"Error setting value in Redis: {e}")
+            return False
+    
+    async def amset(self, mapping: Dict[str, str], expiry: int = None) -> bool:
+        """Set several values in cache through one pipeline without blocking the event loop"""
+        if not self._async_client or not mapping:
+            return False
+        
+        try:
+            expiry = expiry or self.default_expiry()
+            pipeline = self._async_client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipeline.set(key, value, ex=expiry)
+            return all(await pipeline.execute())
+        except Exception as e:
+            print(f"Error setting values in Redis: {e}")
+            return False
+    
+    async def amset_if_newer(self, mapping: Dict[str, tuple], version_field: str, expiry: int = None) -> Dict[str, bool]:
+        """Set (value, version) pairs atomically without blocking the event loop"""
+        if not self._async_client or not mapping:
+            return {key: False for key in mapping}
+        
+        try:
+            args = self._set_if_newer_args(mapping, version_field, expiry or self.default_expiry())
+            written = await self._aset_if_newer(keys=list(mapping), args=args)
+            return {key: bool(result) for key, result in zip(mapping, written)}
+        except Exception as e:
+            print(f"Error setting values in Redis: {e}")
+            return {key: False for key in mapping}
+    
+    async def aclose(self) -> None:
+        """Close the async client's connections"""
+        if self._async_client:
+            await self._async_client.close()
+    
     def flush(self) -> bool:
         """Flush all cache"""
         if not self._client:
@@ -72,13 +249,131 @@ class RedisCache:
             return False
 
 
+class LocalCache:
+    """Per-process LRU cache with a bounded entry count and a per-entry TTL"""
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Get value from cache, dropping it if it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            
+            if value is None:
+                # Tombstone
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def _store(self, key: str, value: Any, version: Optional[int]) -> None:
+        """Store an entry, evicting the least recently used entries when full; lock must be held"""
+        self._entries[key] = (time.monotonic() + self.ttl, value, version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def set(self, key: str, value: Any, version: Optional[int] = None) -> None:
+        """Set value in cache, evicting the least recently used entries when full"""
+        with self._lock:
+            self._store(key, value, version)
+    
+    def set_if_newer(self, key: str, value: Optional[Any], version: int) -> bool:
+        """
+        Set value unless the cached entry is at a newer version, or at the same version and
+        not a tombstone. A value of None stores a tombstone at that version.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[2] is not None:
+                _, current, current_version = entry
+                if current_version > version or (current_version == version and current is not None):
+                    return False
+            
+            self._store(key, value, version)
+            return True
+    
+    def delete(self, key: str) -> bool:
+        """Delete value from cache"""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+    
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss and eviction counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
 class JsonCache(Generic[T]):
-    """JSON object cache using Redis"""
+    """JSON object cache using Redis, fronted by an optional in-process LocalCache"""
+    
+    # One local tier per prefix, shared by every JsonCache in this worker
+    _local_caches: Dict[str, LocalCache] = {}
+    _local_caches_lock = threading.Lock()
     
-    def __init__(self, model_class: Type[T], prefix: str = ""):
+    def __init__(self, model_class: Type[T], prefix: str = "", version_field: Optional[str] = None):
         self.cache = RedisCache()
         self.model_class = model_class
         self.prefix = prefix
+        # When set, writes never replace an entry holding a newer value of this field
+        self.version_field = version_field
+        self.local = self._get_local_cache(prefix) if settings.LOCAL_CACHE_ENABLED else None
+    
+    @classmethod
+    def _get_local_cache(cls, prefix: str) -> LocalCache:
+        """Get or create the local tier for a prefix"""
+        with cls._local_caches_lock:
+            if prefix not in cls._local_caches:
+                cls._local_caches[prefix] = LocalCache(
+                    max_entries=settings.LOCAL_CACHE_MAX_ENTRIES,
+                    ttl=settings.LOCAL_CACHE_TTL
+                )
+            return cls._local_caches[prefix]
+    
+    @classmethod
+    def clear_local(cls) -> None:
+        """Empty the local tier of every prefix"""
+        with cls._local_caches_lock:
+            local_caches = list(cls._local_caches.values())
+        for local in local_caches:
+            local.clear()
+    
+    @classmethod
+    def local_stats(cls) -> Dict[str, Dict[str, int]]:
+        """Local tier counters for every prefix"""
+        with cls._local_caches_lock:
+            local_caches = dict(cls._local_caches)
+        return {prefix: local.stats() for prefix, local in local_caches.items()}
     
     def _get_key(self, key: Any) -> str:
         """Format cache key with prefix"""
@@ -86,30 +381,225 @@ class JsonCache(Generic[T]):
             key = str(key)
         return f"{self.prefix}:{key}" if self.prefix else key
     
+    def _get_local(self, keys: List[Any]) -> tuple:
+        """Split keys into objects found in the local tier and keys to ask Redis for"""
+        found = {}
+        remote_keys = []
+        
+        for key in keys:
+            value = self.local.get(self._get_key(key)) if self.local else None
+            if value is not None:
+                found[key] = value
+            else:
+                remote_keys.append(key)
+        
+        return found, remote_keys
+    
+    def _version_of(self, value: Optional[T]) -> Optional[int]:
+        """Version of an object, when this cache is versioned"""
+        if not self.version_field or value is None:
+            return None
+        return getattr(value, self.version_field)
+    
+    def _tombstone(self, version: int) -> str:
+        """Payload marking a key as invalidated at a version"""
+        return json.dumps({TOMBSTONE_FIELD: True, self.version_field: version})
+    
+    def _decode(self, cache_key: str, data: Optional[str]) -> Optional[T]:
+        """Validate a Redis payload and keep the object in the local tier"""
+        if not data:
+            return None
+        
+        # Tombstones are misses
+        if self.version_field and data.startswith(f'{{"{TOMBSTONE_FIELD}"'):
+            return None
+        
+        try:
+            value = self.model_class.model_validate_json(data)
+        except Exception as e:
+            print(f"Error deserializing object from cache: {e}")
+            return None
+        
+        if self.local:
+            self.local.set(cache_key, value, self._version_of(value))
+        return value
+    
+    def _encode(self, values: Dict[Any, T]) -> Optional[Dict[str, str]]:
+        """Keep objects in the local tier and serialize them for Redis"""
+        if self.local:
+            for key, value in values.items():
+                self.local.set(self._get_key(key), value)
+        
+        try:
+            return {self._get_key(key): value.model_dump_json() for key, value in values.items()}
+        except Exception as e:
+            print(f"Error serializing object to cache: {e}")
+            return None
+    
+    def _encode_versioned(self, values: Dict[Any, Optional[T]], versions: Dict[Any, int]) -> Optional[Dict[str, tuple]]:
+        """Serialize objects, or tombstones for None, as (payload, version) pairs for Redis"""
+        try:
+            return {
+                self._get_key(key): (
+                    value.model_dump_json() if value is not None else self._tombstone(versions[key]),
+                    versions[key]
+                )
+                for key, value in values.items()
+            }
+        except Exception as e:
+            print(f"Error serializing object to cache: {e}")
+            return None
+    
+    def _write_local_versioned(
+        self,
+        values: Dict[Any, Optional[T]],
+        versions: Dict[Any, int],
+        written: Optional[Dict[str, bool]]
+    ) -> bool:
+        """
+        Bring the local tier in line with version-checked writes. With Redis disabled
+        (written is None) the local tier does the version check itself; otherwise it keeps
+        only what Redis accepted, since a rejected write means a newer entry exists.
+        """
+        if written is None:
+            if not self.local:
+                return False
+            return all([
+                self.local.set_if_newer(self._get_key(key), value, versions[key])
+                for key, value in values.items()
+            ])
+        
+        if self.local:
+            for key, value in values.items():
+                cache_key = self._get_key(key)
+                if written.get(cache_key) and value is not None:
+                    self.local.set(cache_key, value, versions[key])
+                else:
+                    self.local.delete(cache_key)
+        return all(written.values())
+    
+    def _set_versioned(self, values: Dict[Any, Optional[T]], versions: Dict[Any, int], expiry: int = None) -> bool:
+        """Write objects or tombstones, skipping keys cached at a newer version"""
+        written = None
+        if self.cache.enabled:
+            mapping = self._encode_versioned(values, versions)
+            if mapping is None:
+                return False
+            written = self.cache.mset_if_newer(mapping, self.version_field, expiry)
+        return self._write_local_versioned(values, versions, written)
+    
+    async def _aset_versioned(self, values: Dict[Any, Optional[T]], versions: Dict[Any, int], expiry: int = None) -> bool:
+        """Write objects or tombstones without blocking the event loop"""
+        written = None
+        if self.cache.enabled:
+            mapping = self._encode_versioned(values, versions)
+            if mapping is None:
+                return False
+            written = await self.cache.amset_if_newer(mapping, self.version_field, expiry)
+        return self._write_local_versioned(values, versions, written)
+    
+    def _versions(self, values: Dict[Any, T]) -> Dict[Any, int]:
+        """Version of every object being written"""
+        return {key: self._version_of(value) for key, value in values.items()}
+    
     def get(self, key: Any) -> Optional[T]:
         """Get object from cache"""
+        found, remote_keys = self._get_local([key])
+        if not remote_keys:
+            return found[key]
+        
         cache_key = self._get_key(key)
-        data = self.cache.get(cache_key)
+        return self._decode(cache_key, self.cache.get(cache_key))
+    
+    async def aget(self, key: Any) -> Optional[T]:
+        """Get object from cache without blocking the event loop"""
+        found, remote_keys = self._get_local([key])
+        if not remote_keys:
+            return found[key]
         
-        if data:
-            try:
-                return self.model_class.model_validate_json(data)
-            except Exception as e:
-                print(f"Error deserializing object from cache: {e}")
+        cache_key = self._get_key(key)
+        return self._decode(cache_key, await self.cache.aget(cache_key))
+    
+    def get_many(self, keys: List[Any]) -> Dict[Any, T]:
+        """Get several objects from cache, returning only the keys that were found"""
+        found, remote_keys = self._get_local(keys)
+        if not remote_keys:
+            return found
         
-        return None
+        cache_keys = [self._get_key(key) for key in remote_keys]
+        for key, cache_key, data in zip(remote_keys, cache_keys, self.cache.mget(cache_keys)):
+            value = self._decode(cache_key, data)
+            if value is not None:
+                found[key] = value
+        
+        return found
+    
+    async def aget_many(self, keys: List[Any]) -> Dict[Any, T]:
+        """Get several objects from cache without blocking the event loop"""
+        found, remote_keys = self._get_local(keys)
+        if not remote_keys:
+            return found
+        
+        cache_keys = [self._get_key(key) for key in remote_keys]
+        for key, cache_key, data in zip(remote_keys, cache_keys, await self.cache.amget(cache_keys)):
+            value = self._decode(cache_key, data)
+            if value is not None:
+                found[key] = value
+        
+        return found
     
     def set(self, key: Any, value: T, expiry: int = None) -> bool:
         """Set object in cache"""
+        if self.version_field:
+            return self._set_versioned({key: value}, self._versions({key: value}), expiry)
+        
         cache_key = self._get_key(key)
-        try:
-            json_data = value.model_dump_json()
-            return self.cache.set(cache_key, json_data, expiry)
-        except Exception as e:
-            print(f"Error serializing object to cache: {e}")
+        mapping = self._encode({key: value})
+        if mapping is None:
+            return False
+        return self.cache.set(cache_key, mapping[cache_key], expiry)
+    
+    async def aset(self, key: Any, value: T, expiry: int = None) -> bool:
+        """Set object in cache without blocking the event loop"""
+        if self.version_field:
+            return await self._aset_versioned({key: value}, self._versions({key: value}), expiry)
+        
+        cache_key = self._get_key(key)
+        mapping = self._encode({key: value})
+        if mapping is None:
             return False
+        return await self.cache.aset(cache_key, mapping[cache_key], expiry)
+    
+    def set_many(self, values: Dict[Any, T], expiry: int = None) -> bool:
+        """Set several objects in cache"""
+        if self.version_field:
+            return self._set_versioned(values, self._versions(values), expiry)
+        
+        mapping = self._encode(values)
+        if mapping is None:
+            return False
+        return self.cache.mset(mapping, expiry)
+    
+    async def aset_many(self, values: Dict[Any, T], expiry: int = None) -> bool:
+        """Set several objects in cache without blocking the event loop"""
+        if self.version_field:
+            return await self._aset_versioned(values, self._versions(values), expiry)
+        
+        mapping = self._encode(values)
+        if mapping is None:
+            return False
+        return await self.cache.amset(mapping, expiry)
     
     def delete(self, key: Any) -> bool:
         """Delete object from cache"""
         cache_key = self._get_key(key)
+        if self.local:
+            self.local.delete(cache_key)
         return self.cache.delete(cache_key)
+    
+    def invalidate(self, key: Any, version: int, expiry: int = None) -> bool:
+        """
+        Replace the entry with a tombstone at a version, unless it is already newer, so a
+        fill racing the invalidation can't store an older object afterwards
+        """
+        return self._set_versioned({key: None}, {key: version}, expiry)
@@ -35,6 +35,26 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
     
+    # Async database access (asyncpg) for the read API
+    USE_ASYNC_DB: bool = os.getenv("USE_ASYNC_DB", "False").lower() == "true"
+    ASYNC_DB_POOL_SIZE: int = int(os.getenv("ASYNC_DB_POOL_SIZE", "20"))
+    ASYNC_DB_MAX_OVERFLOW: int = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))
+    
+    # RabbitMQ (stock change events used to keep the cache fresh)
+    RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "localhost")
+    RABBITMQ_PORT: int = int(os.getenv("RABBITMQ_PORT", "5672"))
+    RABBITMQ_USER: str = os.getenv("RABBITMQ_USER", "guest")
+    RABBITMQ_PASSWORD: str = os.getenv("RABBITMQ_PASSWORD", "guest")
+    RABBITMQ_VHOST: str = os.getenv("RABBITMQ_VHOST", "/")
+    
+    # Reconnect delay of the cache invalidation consumer doubles from min to max while RabbitMQ is unreachable
+    INVALIDATION_RECONNECT_MIN_DELAY_MS: int = int(os.getenv("INVALIDATION_RECONNECT_MIN_DELAY_MS", "500"))
+    INVALIDATION_RECONNECT_MAX_DELAY_MS: int = int(os.getenv("INVALIDATION_RECONNECT_MAX_DELAY_MS", "30000"))
+    
+    # Event topics
+    EVENTS_EXCHANGE: str = "inventory_events"
+    STOCK_UPDATED_TOPIC: str = "stock-updated"
+    
     # Redis (optional)
     USE_REDIS_CACHE: bool = os.getenv("USE_REDIS_CACHE", "False").lower() == "true"
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
@@ -43,6 +63,20 @@ class Settings(BaseSettings):
     REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
     REDIS_URI: Optional[RedisDsn] = None
     REDIS_CACHE_EXPIRY: int = int(os.getenv("REDIS_CACHE_EXPIRY", "3600"))  # 1 hour default
+    # Expiry used instead while stock-updated events aren't being consumed
+    REDIS_CACHE_EXPIRY_WITHOUT_EVENTS: int = int(os.getenv("REDIS_CACHE_EXPIRY_WITHOUT_EVENTS", "30"))
+    
+    # In-process cache in front of Redis (per worker)
+    LOCAL_CACHE_ENABLED: bool = os.getenv("LOCAL_CACHE_ENABLED", "False").lower() == "true"
+    LOCAL_CACHE_MAX_ENTRIES: int = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "10000"))
+    LOCAL_CACHE_TTL: float = float(os.getenv("LOCAL_CACHE_TTL", "5"))  # seconds
+    
+    # Batch lookups
+    STOCK_BATCH_MAX_SIZE: int = int(os.getenv("STOCK_BATCH_MAX_SIZE", "500"))
+    
+    # Full inventory scans
+    STOCK_PAGE_MAX_SIZE: int = int(os.getenv("STOCK_PAGE_MAX_SIZE", "5000"))
+    STOCK_STREAM_CHUNK_SIZE: int = int(os.getenv("STOCK_STREAM_CHUNK_SIZE", "1000"))
     
     @validator("REDIS_URI", pre=True)
     def assemble_redis_connection(cls, v: Optional[str], values: dict) -> Optional[str]:
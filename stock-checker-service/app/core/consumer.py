@@ -0,0 +1,162 @@
+import json
+import logging
+import threading
+from typing import Optional
+from uuid import UUID
+
+import pika
+
+from app.core.cache import JsonCache, RedisCache
+from app.core.config import settings
+from app.services.stock_service import StockService
+
+logger = logging.getLogger(__name__)
+
+
+def get_connection_parameters() -> pika.ConnectionParameters:
+    """
+    RabbitMQ connection parameters
+    """
+    credentials = pika.PlainCredentials(
+        username=settings.RABBITMQ_USER,
+        password=settings.RABBITMQ_PASSWORD
+    )
+    return pika.ConnectionParameters(
+        host=settings.RABBITMQ_HOST,
+        port=settings.RABBITMQ_PORT,
+        virtual_host=settings.RABBITMQ_VHOST,
+        credentials=credentials
+    )
+
+
+class CacheInvalidationConsumer:
+    """
+    Keeps cached stock in sync with the stock-updated events of stock-updater and supplier-sync.
+    
+    Runs in a background thread and reconnects with a doubling delay whenever
+    RabbitMQ is unreachable or the connection drops. While it is not consuming,
+    Redis entries are written with the short REDIS_CACHE_EXPIRY_WITHOUT_EVENTS
+    and the service reports itself as not ready.
+    """
+    
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel = None
+    
+    @property
+    def connected(self) -> bool:
+        return RedisCache.events_connected
+    
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        connection, channel = self._connection, self._channel
+        if connection is not None and channel is not None:
+            try:
+                connection.add_callback_threadsafe(channel.stop_consuming)
+            except Exception as e:
+                logger.warning(f"Error stopping cache invalidation consumer: {e}")
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def run(self) -> None:
+        delay_ms = settings.INVALIDATION_RECONNECT_MIN_DELAY_MS
+        
+        while not self._stop.is_set():
+            try:
+                self._connection = pika.BlockingConnection(get_connection_parameters())
+                self._channel = self._setup(self._connection)
+                
+                # Events may have been missed while disconnected; this worker's local tier can't tell which
+                JsonCache.clear_local()
+                self._set_connected(True)
+                delay_ms = settings.INVALIDATION_RECONNECT_MIN_DELAY_MS
+                logger.info("Cache invalidation consumer connected")
+                
+                self._channel.start_consuming()
+            except Exception as e:
+                logger.error(f"Cache invalidation consumer error: {e}")
+            finally:
+                self._set_connected(False)
+                self._close()
+            
+            if self._stop.wait(delay_ms / 1000):
+                break
+            delay_ms = min(delay_ms * 2, settings.INVALIDATION_RECONNECT_MAX_DELAY_MS)
+    
+    def _setup(self, connection: pika.BlockingConnection):
+        channel = connection.channel()
+        
+        channel.exchange_declare(
+            exchange=settings.EVENTS_EXCHANGE,
+            exchange_type='topic',
+            durable=True
+        )
+        
+        # Every worker process gets its own exclusive queue, so that each
+        # worker's in-process cache sees every stock change
+        result = channel.queue_declare(queue='', exclusive=True)
+        queue_name = result.method.queue
+        channel.queue_bind(
+            exchange=settings.EVENTS_EXCHANGE,
+            queue=queue_name,
+            routing_key=settings.STOCK_UPDATED_TOPIC
+        )
+        
+        channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=handle_stock_updated,
+            auto_ack=False
+        )
+        return channel
+    
+    def _set_connected(self, connected: bool) -> None:
+        if RedisCache.events_connected and not connected:
+            logger.warning("Cache invalidation consumer disconnected, caching with a short expiry")
+        RedisCache.events_connected = connected
+    
+    def _close(self) -> None:
+        connection = self._connection
+        self._connection = None
+        self._channel = None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def handle_stock_updated(ch, method, properties, body):
+    """
+    Handle stock updated event
+    """
+    try:
+        payload = json.loads(body)
+        product_id = UUID(payload['product_id'])
+    except Exception as e:
+        logger.error(f"Invalid stock updated event payload: {e}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+    
+    try:
+        StockService.handle_stock_updated_event(
+            product_id,
+            version=payload.get('version'),
+            stock=payload.get('new_stock'),
+            reserved_stock=payload.get('reserved_stock'),
+            name=payload.get('name'),
+            is_active=payload.get('is_active', True)
+        )
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception as e:
+        logger.error(f"Error handling stock updated event: {e}")
+        ch.basic_nack(delivery_tag=method.delivery_tag)
+
+
+cache_invalidation_consumer = CacheInvalidationConsumer()
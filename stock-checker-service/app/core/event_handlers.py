@@ -5,8 +5,9 @@ from fastapi import FastAPI
 from sqlalchemy import text
 
 from app.core.config import settings
-from app.db.database import engine, Base
+from app.db.database import engine, async_engine, Base
 from app.core.cache import RedisCache
+from app.core.consumer import cache_invalidation_consumer
 
 
 logger = logging.getLogger(__name__)
@@ -45,6 +46,10 @@ def start_app_handler(app: FastAPI) -> Callable:
                     logger.warning("Redis connection failed, cache will be disabled")
             except Exception as e:
                 logger.error(f"Redis connection error: {e}")
+        
+        # Keep cached stock in sync with stock-updater; connects (and reconnects) in the background
+        if settings.USE_REDIS_CACHE or settings.LOCAL_CACHE_ENABLED:
+            cache_invalidation_consumer.start()
     
     return startup
 
@@ -55,6 +60,9 @@ def stop_app_handler(app: FastAPI) -> Callable:
     """
     async def shutdown() -> None:
         logger.info("Running app shutdown handler.")
-        # Add cleanup tasks here
+        cache_invalidation_consumer.stop()
+        await RedisCache().aclose()
+        if async_engine is not None:
+            await async_engine.dispose()
     
     return shutdown
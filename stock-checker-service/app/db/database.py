@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -10,6 +11,17 @@ engine = create_engine(str(settings.DATABASE_URI))
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Create async engine (asyncpg) when the async read API is enabled
+async_engine = None
+AsyncSessionLocal = None
+if settings.USE_ASYNC_DB:
+    async_engine = create_async_engine(
+        str(settings.DATABASE_URI).replace("postgresql://", "postgresql+asyncpg://", 1),
+        pool_size=settings.ASYNC_DB_POOL_SIZE,
+        max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class for models
 Base = declarative_base()
 
@@ -21,3 +33,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency to get async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,8 +1,10 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 
 from app.api.routes import stock_router
+from app.api.async_routes import async_stock_router
+from app.core.cache import RedisCache
 from app.core.config import settings
 from app.core.event_handlers import start_app_handler, stop_app_handler
 
@@ -24,7 +26,11 @@ app.add_middleware(
 )
 
 # Include routers
-app.include_router(stock_router, prefix="/stock", tags=["stock"])
+app.include_router(
+    async_stock_router if settings.USE_ASYNC_DB else stock_router,
+    prefix="/stock",
+    tags=["stock"]
+)
 
 # Add event handlers
 app.add_event_handler("startup", start_app_handler(app))
@@ -42,6 +48,16 @@ async def custom_swagger_ui_html():
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/ready", tags=["health"])
+async def readiness_check(response: Response):
+    """
+    Not ready (503) while cached stock can't be kept fresh because stock-updated events aren't being consumed
+    """
+    if (settings.USE_REDIS_CACHE or settings.LOCAL_CACHE_ENABLED) and not RedisCache.events_connected:
+        response.status_code = 503
+        return {"status": "cache invalidation disconnected"}
+    return {"status": "ok"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8001, reload=True)
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -8,12 +8,18 @@ from app.db.database import Base
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Partial index for low stock queries over active products
+        Index("idx_products_active_stock", "stock", postgresql_where=text("is_active")),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     stock = Column(Integer, nullable=False, default=0)
+    reserved_stock = Column(Integer, nullable=False, default=0)  # Held by stock-updater reservations
     supplier_id = Column(UUID(as_uuid=True), ForeignKey("suppliers.id"))
     is_active = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every stock change, used as ETag
 
     # Relationship
     supplier = relationship("Supplier", back_populates="products")
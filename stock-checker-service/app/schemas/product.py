@@ -1,5 +1,5 @@
 from uuid import UUID
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -20,8 +20,11 @@ class ProductResponse(ProductBase):
 class StockResponse(BaseModel):
     product_id: UUID
     name: str
-    stock: int
-    is_available: bool = Field(description="True if stock > 0")
+    stock: int = Field(description="Stock on hand")
+    reserved_stock: int = Field(default=0, description="Stock held by active reservations")
+    available_stock: int = Field(description="Stock on hand minus reserved stock")
+    is_available: bool = Field(description="True if available stock > 0")
+    version: int = Field(description="Product version, bumped on every stock change")
     
     class Config:
         from_attributes = True
@@ -30,8 +33,20 @@ class StockResponse(BaseModel):
 class StockStatusResponse(BaseModel):
     product_id: UUID
     name: str
-    stock: int
+    stock: int = Field(description="Stock on hand")
+    available_stock: int = Field(description="Stock on hand minus reserved stock")
     status: str = Field(description="Status of stock level: 'low', 'ok', 'out_of_stock'")
+    version: int = Field(description="Product version, bumped on every stock change")
     
     class Config:
         from_attributes = True
+
+
+class StockBatchRequest(BaseModel):
+    product_ids: List[UUID] = Field(min_length=1, description="Product IDs to look up")
+
+
+class StockBatchResult(BaseModel):
+    product_id: UUID
+    found: bool = Field(description="False if the product does not exist or is inactive")
+    stock: Optional[StockResponse] = None
@@ -1,13 +1,119 @@
-from typing import List, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 from uuid import UUID
+from sqlalchemy import case, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 
 from app.models.product import Product
-from app.schemas.product import StockResponse, StockStatusResponse
+from app.schemas.product import StockResponse, StockStatusResponse, StockBatchResult
 from app.core.cache import JsonCache
 
 
+# Stock level below which a product is reported as 'low' in the general status
+LOW_STOCK_THRESHOLD = 10
+
+
+def _stock_cache() -> JsonCache[StockResponse]:
+    # Versioned, so a fill from a slow database read can't replace a newer entry
+    return JsonCache(StockResponse, prefix="product_stock", version_field="version")
+
+
+def _stock_status(low_threshold: int):
+    """SQL expression classifying a product's stock level as 'out_of_stock', 'low' or 'ok'"""
+    return case(
+        (Product.stock == 0, "out_of_stock"),
+        (Product.stock < low_threshold, "low"),
+        else_="ok"
+    ).label("status")
+
+
+def _product_stock_statement(product_ids: List[UUID]):
+    """Select the stock of the given active products"""
+    return select(Product.id, Product.name, Product.stock, Product.reserved_stock, Product.version).where(
+        Product.id.in_(product_ids),
+        Product.is_active == True
+    )
+
+
+def _low_stock_statement(min_stock: int):
+    """Select and classify active products below min_stock (served by idx_products_active_stock)"""
+    # Out of stock products are always included, even for thresholds below 1
+    threshold = max(min_stock, 1)
+    
+    return select(
+        Product.id,
+        Product.name,
+        Product.stock,
+        Product.reserved_stock,
+        Product.version,
+        _stock_status(min_stock)
+    ).where(
+        Product.is_active == True,
+        Product.stock < threshold
+    ).order_by(Product.stock)
+
+
+def _stock_status_statement(min_stock: Optional[int], after: Optional[UUID], limit: Optional[int] = None):
+    """Select active products' stock status, in keyset (product ID) order"""
+    statement = select(
+        Product.id,
+        Product.name,
+        Product.stock,
+        Product.reserved_stock,
+        Product.version,
+        _stock_status(LOW_STOCK_THRESHOLD)
+    ).where(Product.is_active == True)
+    
+    if min_stock is not None:
+        statement = statement.where(Product.stock < min_stock)
+    
+    if after is not None:
+        statement = statement.where(Product.id > after)
+    
+    statement = statement.order_by(Product.id)
+    
+    if limit is not None:
+        statement = statement.limit(limit)
+    
+    return statement
+
+
+def _to_stock_response(product) -> StockResponse:
+    available_stock = product.stock - product.reserved_stock
+    return StockResponse(
+        product_id=product.id,
+        name=product.name,
+        stock=product.stock,
+        reserved_stock=product.reserved_stock,
+        available_stock=available_stock,
+        is_available=available_stock > 0,
+        version=product.version
+    )
+
+
+def _to_stock_status_response(row) -> StockStatusResponse:
+    return StockStatusResponse(
+        product_id=row.id,
+        name=row.name,
+        stock=row.stock,
+        available_stock=row.stock - row.reserved_stock,
+        status=row.status,
+        version=row.version
+    )
+
+
+def _to_batch_results(product_ids: List[UUID], found: Dict[UUID, StockResponse]) -> List[StockBatchResult]:
+    return [
+        StockBatchResult(
+            product_id=product_id,
+            found=product_id in found,
+            stock=found.get(product_id)
+        )
+        for product_id in product_ids
+    ]
+
+
 class StockService:
     @staticmethod
     def get_product_stock(db: Session, product_id: UUID) -> StockResponse:
@@ -15,72 +121,205 @@ class StockService:
         Get stock information for a specific product
         """
         # Try to get from cache first if Redis is enabled
-        cache = JsonCache[StockResponse](StockResponse, prefix="product_stock")
+        cache = _stock_cache()
         cached_stock = cache.get(product_id)
         
         if cached_stock:
             return cached_stock
         
         # If not in cache or cache disabled, get from database
-        product = db.query(Product).filter(Product.id == product_id, Product.is_active == True).first()
+        product = db.execute(_product_stock_statement([product_id])).first()
         if not product:
             raise HTTPException(status_code=404, detail="Product not found or inactive")
         
         # Create response
-        stock_response = StockResponse(
-            product_id=product.id,
-            name=product.name,
-            stock=product.stock,
-            is_available=product.stock > 0
-        )
+        stock_response = _to_stock_response(product)
         
         # Cache the result
         cache.set(product_id, stock_response)
         
         return stock_response
     
+    @staticmethod
+    def get_products_stock(db: Session, product_ids: List[UUID]) -> List[StockBatchResult]:
+        """
+        Get stock information for several products at once, in request order
+        """
+        unique_ids = list(dict.fromkeys(product_ids))
+        
+        # One MGET for every requested product
+        cache = _stock_cache()
+        found = cache.get_many(unique_ids)
+        
+        # One query for the cache misses only
+        missing_ids = [product_id for product_id in unique_ids if product_id not in found]
+        if missing_ids:
+            products = db.execute(_product_stock_statement(missing_ids)).all()
+            
+            fetched = {product.id: _to_stock_response(product) for product in products}
+            if fetched:
+                cache.set_many(fetched)
+            found.update(fetched)
+        
+        return _to_batch_results(product_ids, found)
+    
     @staticmethod
     def get_low_stock_products(db: Session, min_stock: int = 10) -> List[StockStatusResponse]:
         """
         Get all products with stock below the specified minimum
         """
-        products = db.query(Product).filter(Product.is_active == True).all()
+        rows = db.execute(_low_stock_statement(min_stock)).all()
+        return [_to_stock_status_response(row) for row in rows]
+    
+    @staticmethod
+    def get_all_stock_status(
+        db: Session,
+        min_stock: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[UUID] = None
+    ) -> List[StockStatusResponse]:
+        """
+        Get stock status for all products, optionally filtering by minimum stock level.
+        Results are ordered by product ID; pass the last ID of a page as `after` to get the next one.
+        """
+        rows = db.execute(_stock_status_statement(min_stock, after, limit)).all()
+        return [_to_stock_status_response(row) for row in rows]
+    
+    @staticmethod
+    def iter_stock_status(
+        db: Session,
+        min_stock: Optional[int] = None,
+        after: Optional[UUID] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[StockStatusResponse]:
+        """
+        Stream stock status for all products from a server-side cursor, fetching chunk_size rows at a time
+        """
+        statement = _stock_status_statement(min_stock, after).execution_options(yield_per=chunk_size)
         
-        result = []
-        for product in products:
-            status = "out_of_stock" if product.stock == 0 else "low" if product.stock < min_stock else "ok"
-            
-            # Only include products that are out of stock or have low stock
-            if status != "ok":
-                result.append(StockStatusResponse(
-                    product_id=product.id,
-                    name=product.name,
-                    stock=product.stock,
-                    status=status
-                ))
+        for row in db.execute(statement):
+            yield _to_stock_status_response(row)
+    
+    # Async variants, used by the read API when USE_ASYNC_DB is enabled
+    
+    @staticmethod
+    async def get_product_stock_async(db: AsyncSession, product_id: UUID) -> StockResponse:
+        """
+        Get stock information for a specific product
+        """
+        cache = _stock_cache()
+        cached_stock = await cache.aget(product_id)
+        
+        if cached_stock:
+            return cached_stock
+        
+        result = await db.execute(_product_stock_statement([product_id]))
+        product = result.first()
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found or inactive")
+        
+        stock_response = _to_stock_response(product)
+        await cache.aset(product_id, stock_response)
         
-        return result
+        return stock_response
     
     @staticmethod
-    def get_all_stock_status(db: Session, min_stock: Optional[int] = None) -> List[StockStatusResponse]:
+    async def get_products_stock_async(db: AsyncSession, product_ids: List[UUID]) -> List[StockBatchResult]:
         """
-        Get stock status for all products, optionally filtering by minimum stock level
+        Get stock information for several products at once, in request order
         """
-        query = db.query(Product).filter(Product.is_active == True)
+        unique_ids = list(dict.fromkeys(product_ids))
+        
+        cache = _stock_cache()
+        found = await cache.aget_many(unique_ids)
         
-        if min_stock is not None:
-            query = query.filter(Product.stock < min_stock)
+        missing_ids = [product_id for product_id in unique_ids if product_id not in found]
+        if missing_ids:
+            result = await db.execute(_product_stock_statement(missing_ids))
             
-        products = query.all()
-        
-        result = []
-        for product in products:
-            status = "out_of_stock" if product.stock == 0 else "low" if product.stock < 10 else "ok"
-            result.append(StockStatusResponse(
-                product_id=product.id,
-                name=product.name,
-                stock=product.stock,
-                status=status
-            ))
-        
-        return result
+            fetched = {product.id: _to_stock_response(product) for product in result.all()}
+            if fetched:
+                await cache.aset_many(fetched)
+            found.update(fetched)
+        
+        return _to_batch_results(product_ids, found)
+    
+    @staticmethod
+    async def get_low_stock_products_async(db: AsyncSession, min_stock: int = 10) -> List[StockStatusResponse]:
+        """
+        Get all products with stock below the specified minimum
+        """
+        result = await db.execute(_low_stock_statement(min_stock))
+        return [_to_stock_status_response(row) for row in result.all()]
+    
+    @staticmethod
+    async def get_all_stock_status_async(
+        db: AsyncSession,
+        min_stock: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[UUID] = None
+    ) -> List[StockStatusResponse]:
+        """
+        Get stock status for all products, in product ID order
+        """
+        result = await db.execute(_stock_status_statement(min_stock, after, limit))
+        return [_to_stock_status_response(row) for row in result.all()]
+    
+    @staticmethod
+    async def iter_stock_status_async(
+        db: AsyncSession,
+        min_stock: Optional[int] = None,
+        after: Optional[UUID] = None,
+        chunk_size: int = 1000
+    ) -> AsyncIterator[StockStatusResponse]:
+        """
+        Stream stock status for all products from a server-side cursor
+        """
+        statement = _stock_status_statement(min_stock, after).execution_options(yield_per=chunk_size)
+        
+        result = await db.stream(statement)
+        async for row in result:
+            yield _to_stock_status_response(row)
+    
+    @staticmethod
+    def handle_stock_updated_event(
+        product_id: UUID,
+        version: Optional[int] = None,
+        stock: Optional[int] = None,
+        reserved_stock: Optional[int] = None,
+        name: Optional[str] = None,
+        is_active: bool = True
+    ) -> None:
+        """
+        Handle stock updated event from stock-updater or supplier-sync.
+        
+        A cached entry older than the event is updated in place when the event carries
+        the new levels, and dropped otherwise. Entries already at the event's version
+        or newer are kept, so redelivered or late events can't roll the cache back.
+        Without a cached entry, or when the product was deactivated, a tombstone at the
+        event's version is written, so a read that loaded the older row before the
+        event can't fill it afterwards. Both writes are version-checked in Redis, not
+        just against the entry read here.
+        """
+        cache = _stock_cache()
+        if version is None or stock is None or reserved_stock is None:
+            cache.delete(product_id)
+            return
+        
+        cached = cache.get(product_id)
+        if cached is None or not is_active:
+            cache.invalidate(product_id, version)
+            return
+        
+        if cached.version >= version:
+            return
+        
+        available_stock = stock - reserved_stock
+        cache.set(product_id, cached.model_copy(update={
+            "name": cached.name if name is None else name,
+            "stock": stock,
+            "reserved_stock": reserved_stock,
+            "available_stock": available_stock,
+            "is_available": available_stock > 0,
+            "version": version
+        }))
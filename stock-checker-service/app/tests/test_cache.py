@@ -0,0 +1,174 @@
+import uuid
+from unittest.mock import MagicMock, patch
+
+from app.core.cache import LocalCache, JsonCache
+from app.schemas.product import StockResponse
+
+
+class TestLocalCache:
+    def test_get_and_counters(self):
+        cache = LocalCache(max_entries=10, ttl=60)
+        cache.set("a", 1)
+        
+        # Assertions
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+    
+    def test_lru_eviction(self):
+        cache = LocalCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        
+        # Touch "a" so that "b" becomes the least recently used entry
+        cache.get("a")
+        cache.set("c", 3)
+        
+        # Assertions
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+    
+    def test_ttl_expiry(self):
+        with patch('app.core.cache.time') as mock_time:
+            mock_time.monotonic.return_value = 100.0
+            cache = LocalCache(max_entries=10, ttl=5)
+            cache.set("a", 1)
+            
+            mock_time.monotonic.return_value = 104.0
+            assert cache.get("a") == 1
+            
+            mock_time.monotonic.return_value = 105.0
+            assert cache.get("a") is None
+            assert cache.stats()["entries"] == 0
+    
+    def test_set_if_newer(self):
+        cache = LocalCache(max_entries=10, ttl=60)
+        assert cache.set_if_newer("a", "v2", 2) is True
+        
+        # Older and same-version writes are rejected
+        assert cache.set_if_newer("a", "v1", 1) is False
+        assert cache.set_if_newer("a", "v2-again", 2) is False
+        assert cache.get("a") == "v2"
+        
+        # A tombstone is a miss, and only gives way to a write at its version or newer
+        assert cache.set_if_newer("a", None, 3) is True
+        assert cache.get("a") is None
+        assert cache.set_if_newer("a", "v2", 2) is False
+        assert cache.set_if_newer("a", "v3", 3) is True
+        assert cache.get("a") == "v3"
+
+
+class TestJsonCacheLocalTier:
+    def _make_cache(self, redis_cache, version_field=None):
+        with patch('app.core.cache.RedisCache', return_value=redis_cache), \
+                patch('app.core.cache.settings') as mock_settings:
+            mock_settings.LOCAL_CACHE_ENABLED = True
+            mock_settings.LOCAL_CACHE_MAX_ENTRIES = 100
+            mock_settings.LOCAL_CACHE_TTL = 60
+            cache = JsonCache(StockResponse, prefix=f"test_{uuid.uuid4()}", version_field=version_field)
+        return cache
+    
+    def test_redis_hit_populates_local_tier(self):
+        response = StockResponse(product_id=uuid.uuid4(), name="Product", stock=3, available_stock=3, is_available=True, version=1)
+        
+        # Mock Redis
+        redis_cache = MagicMock()
+        redis_cache.get.return_value = response.model_dump_json()
+        cache = self._make_cache(redis_cache)
+        
+        # Assertions
+        assert cache.get(response.product_id) == response
+        assert cache.get(response.product_id) == response
+        redis_cache.get.assert_called_once()
+    
+    def test_get_many_only_asks_redis_for_local_misses(self):
+        local_hit = StockResponse(product_id=uuid.uuid4(), name="Local", stock=1, available_stock=1, is_available=True, version=1)
+        remote_hit = StockResponse(product_id=uuid.uuid4(), name="Remote", stock=2, available_stock=2, is_available=True, version=1)
+        
+        # Mock Redis
+        redis_cache = MagicMock()
+        redis_cache.mget.return_value = [remote_hit.model_dump_json()]
+        cache = self._make_cache(redis_cache)
+        cache.local.set(cache._get_key(local_hit.product_id), local_hit)
+        
+        result = cache.get_many([local_hit.product_id, remote_hit.product_id])
+        
+        # Assertions
+        assert result == {local_hit.product_id: local_hit, remote_hit.product_id: remote_hit}
+        redis_cache.mget.assert_called_once_with([cache._get_key(remote_hit.product_id)])
+    
+    def test_delete_clears_both_tiers(self):
+        response = StockResponse(product_id=uuid.uuid4(), name="Product", stock=3, available_stock=3, is_available=True, version=1)
+        
+        # Mock Redis
+        redis_cache = MagicMock()
+        redis_cache.get.return_value = None
+        cache = self._make_cache(redis_cache)
+        cache.set(response.product_id, response)
+        cache.delete(response.product_id)
+        
+        # Assertions
+        assert cache.get(response.product_id) is None
+        redis_cache.delete.assert_called_once_with(cache._get_key(response.product_id))
+    
+    def test_versioned_set_keeps_only_accepted_writes_locally(self):
+        accepted = StockResponse(product_id=uuid.uuid4(), name="Accepted", stock=3, available_stock=3, is_available=True, version=2)
+        rejected = StockResponse(product_id=uuid.uuid4(), name="Rejected", stock=1, available_stock=1, is_available=True, version=1)
+        
+        # Mock Redis, which already holds a newer entry for the second product
+        redis_cache = MagicMock()
+        redis_cache.enabled = True
+        redis_cache.get.return_value = None
+        cache = self._make_cache(redis_cache, version_field="version")
+        redis_cache.mset_if_newer.return_value = {
+            cache._get_key(accepted.product_id): True,
+            cache._get_key(rejected.product_id): False,
+        }
+        cache.local.set(cache._get_key(rejected.product_id), rejected, 1)
+        
+        result = cache.set_many({accepted.product_id: accepted, rejected.product_id: rejected})
+        
+        # Assertions
+        assert result is False
+        mapping, version_field, _ = redis_cache.mset_if_newer.call_args[0]
+        assert version_field == "version"
+        assert mapping[cache._get_key(accepted.product_id)] == (accepted.model_dump_json(), 2)
+        assert cache.get(accepted.product_id) == accepted
+        assert cache.get(rejected.product_id) is None
+    
+    def test_invalidate_writes_tombstone_read_as_miss(self):
+        product_id = uuid.uuid4()
+        
+        # Mock Redis
+        redis_cache = MagicMock()
+        redis_cache.enabled = True
+        cache = self._make_cache(redis_cache, version_field="version")
+        cache_key = cache._get_key(product_id)
+        redis_cache.mset_if_newer.return_value = {cache_key: True}
+        
+        assert cache.invalidate(product_id, 5) is True
+        
+        # Assertions
+        tombstone, version = redis_cache.mset_if_newer.call_args[0][0][cache_key]
+        assert version == 5
+        redis_cache.get.return_value = tombstone
+        assert cache.get(product_id) is None
+    
+    def test_versioned_set_without_redis_checks_local_tier(self):
+        newer = StockResponse(product_id=uuid.uuid4(), name="Product", stock=3, available_stock=3, is_available=True, version=2)
+        older = newer.model_copy(update={"stock": 9, "available_stock": 9, "version": 1})
+        
+        # Mock a disabled Redis
+        redis_cache = MagicMock()
+        redis_cache.enabled = False
+        redis_cache.get.return_value = None
+        cache = self._make_cache(redis_cache, version_field="version")
+        
+        # Assertions
+        assert cache.set(newer.product_id, newer) is True
+        assert cache.set(older.product_id, older) is False
+        assert cache.get(newer.product_id) == newer
+        redis_cache.mset_if_newer.assert_not_called()
@@ -0,0 +1,51 @@
+from unittest.mock import MagicMock, patch
+
+from app.core.cache import RedisCache
+from app.core.consumer import CacheInvalidationConsumer
+
+
+class TestCacheInvalidationConsumer:
+    @patch('app.core.consumer.JsonCache')
+    @patch('app.core.consumer.pika')
+    def test_reconnects_after_connection_failure(self, mock_pika, mock_json_cache):
+        consumer = CacheInvalidationConsumer()
+        
+        # Mock connection: the first attempt fails, the second consumes until the connection drops
+        mock_connection = MagicMock()
+        mock_channel = mock_connection.channel.return_value
+        connected_while_consuming = []
+        
+        def start_consuming():
+            connected_while_consuming.append(RedisCache.events_connected)
+            consumer._stop.set()
+            raise Exception("Connection reset")
+        
+        mock_channel.start_consuming.side_effect = start_consuming
+        mock_pika.BlockingConnection.side_effect = [Exception("Connection refused"), mock_connection]
+        
+        with patch('app.core.consumer.settings') as mock_settings:
+            mock_settings.INVALIDATION_RECONNECT_MIN_DELAY_MS = 1
+            mock_settings.INVALIDATION_RECONNECT_MAX_DELAY_MS = 2
+            consumer.run()
+        
+        # Assertions
+        assert mock_pika.BlockingConnection.call_count == 2
+        assert connected_while_consuming == [True]
+        assert RedisCache.events_connected is False
+        mock_json_cache.clear_local.assert_called_once()
+        mock_connection.close.assert_called_once()
+    
+    def test_short_expiry_while_disconnected(self):
+        with patch('app.core.cache.settings') as mock_settings:
+            mock_settings.REDIS_CACHE_EXPIRY = 86400
+            mock_settings.REDIS_CACHE_EXPIRY_WITHOUT_EVENTS = 30
+            
+            RedisCache.events_connected = False
+            disconnected_expiry = RedisCache.default_expiry()
+            RedisCache.events_connected = True
+            connected_expiry = RedisCache.default_expiry()
+            RedisCache.events_connected = False
+        
+        # Assertions
+        assert disconnected_expiry == 30
+        assert connected_expiry == 86400
@@ -0,0 +1,40 @@
+import uuid
+
+from fastapi import Response
+
+from app.api.etags import conditional_response, status_list_etag, version_etag
+from app.schemas.product import StockStatusResponse
+
+
+def _status(product_id, version):
+    return StockStatusResponse(
+        product_id=product_id, name="Product", stock=5, available_stock=5, status="LOW", version=version
+    )
+
+
+class TestEtags:
+    def test_matching_etag_returns_not_modified(self):
+        response = Response()
+        
+        not_modified = conditional_response('"4", W/"5"', version_etag(5), response)
+        
+        # Assertions
+        assert not_modified.status_code == 304
+        assert not_modified.headers["ETag"] == '"5"'
+    
+    def test_stale_etag_sets_header(self):
+        response = Response()
+        
+        not_modified = conditional_response('"4"', version_etag(5), response)
+        
+        # Assertions
+        assert not_modified is None
+        assert response.headers["ETag"] == '"5"'
+    
+    def test_status_list_etag_changes_with_versions(self):
+        product_id = uuid.uuid4()
+        
+        # Assertions
+        assert status_list_etag([_status(product_id, 1)]) == status_list_etag([_status(product_id, 1)])
+        assert status_list_etag([_status(product_id, 1)]) != status_list_etag([_status(product_id, 2)])
+        assert status_list_etag([_status(product_id, 1)]).startswith('W/"')
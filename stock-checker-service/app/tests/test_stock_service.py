@@ -1,8 +1,12 @@
+import asyncio
 import pytest
 import uuid
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy.dialects import postgresql
 
 from fastapi import HTTPException
+from app.models.supplier import Supplier  # registers the mapper used by Product.supplier
 from app.services.stock_service import StockService
 from app.schemas.product import StockResponse, StockStatusResponse
 
@@ -17,10 +21,12 @@ class TestStockService:
         mock_product.id = uuid.uuid4()
         mock_product.name = "Test Product"
         mock_product.stock = 10
+        mock_product.reserved_stock = 0
+        mock_product.version = 1
         mock_product.is_active = True
         
         # Mock query result
-        mock_db.query().filter().first.return_value = mock_product
+        mock_db.execute().first.return_value = mock_product
         
         # Mock cache
         with patch('app.services.stock_service.JsonCache') as mock_cache_class:
@@ -38,6 +44,31 @@ class TestStockService:
             assert result.is_available == True
             mock_cache.set.assert_called_once()
     
+    def test_get_product_stock_reports_available_stock(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        # Mock product with all its stock reserved
+        mock_product = MagicMock()
+        mock_product.id = uuid.uuid4()
+        mock_product.name = "Reserved Product"
+        mock_product.stock = 4
+        mock_product.reserved_stock = 4
+        mock_product.version = 1
+        mock_db.execute().first.return_value = mock_product
+        
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache_class.return_value.get.return_value = None
+            
+            # Call the service
+            result = StockService.get_product_stock(mock_db, mock_product.id)
+        
+        # Assertions: on hand but not available
+        assert result.stock == 4
+        assert result.reserved_stock == 4
+        assert result.available_stock == 0
+        assert result.is_available == False
+    
     def test_get_product_stock_from_cache(self):
         # Mock DB session
         mock_db = MagicMock()
@@ -47,7 +78,9 @@ class TestStockService:
             product_id=uuid.uuid4(),
             name="Cached Product",
             stock=5,
-            is_available=True
+            available_stock=5,
+            is_available=True,
+            version=1
         )
         
         # Mock cache
@@ -61,7 +94,7 @@ class TestStockService:
             
             # Assertions
             assert result == cached_response
-            mock_db.query.assert_not_called()  # Database should not be queried
+            mock_db.execute.assert_not_called()  # Database should not be queried
             mock_cache.set.assert_not_called()  # Cache should not be updated
     
     def test_get_product_stock_not_found(self):
@@ -69,7 +102,7 @@ class TestStockService:
         mock_db = MagicMock()
         
         # Mock query result - product not found
-        mock_db.query().filter().first.return_value = None
+        mock_db.execute().first.return_value = None
         
         # Mock cache
         with patch('app.services.stock_service.JsonCache') as mock_cache_class:
@@ -90,83 +123,374 @@ class TestStockService:
         # Mock DB session
         mock_db = MagicMock()
         
-        # Mock products
-        mock_product1 = MagicMock()
-        mock_product1.id = uuid.uuid4()
-        mock_product1.name = "Low Stock Product"
-        mock_product1.stock = 5
-        mock_product1.is_active = True
-        
-        mock_product2 = MagicMock()
-        mock_product2.id = uuid.uuid4()
-        mock_product2.name = "Out of Stock Product"
-        mock_product2.stock = 0
-        mock_product2.is_active = True
-        
-        mock_product3 = MagicMock()
-        mock_product3.id = uuid.uuid4()
-        mock_product3.name = "Normal Stock Product"
-        mock_product3.stock = 20
-        mock_product3.is_active = True
+        # Mock rows, already filtered and classified by the query
+        mock_row1 = MagicMock()
+        mock_row1.id = uuid.uuid4()
+        mock_row1.name = "Out of Stock Product"
+        mock_row1.stock = 0
+        mock_row1.reserved_stock = 0
+        mock_row1.version = 1
+        mock_row1.status = "out_of_stock"
+        
+        mock_row2 = MagicMock()
+        mock_row2.id = uuid.uuid4()
+        mock_row2.name = "Low Stock Product"
+        mock_row2.stock = 5
+        mock_row2.reserved_stock = 0
+        mock_row2.version = 1
+        mock_row2.status = "low"
         
         # Mock query result
-        mock_db.query().filter().all.return_value = [mock_product1, mock_product2, mock_product3]
+        mock_db.execute().all.return_value = [mock_row1, mock_row2]
         
         # Call the service
         result = StockService.get_low_stock_products(mock_db, min_stock=10)
         
         # Assertions
-        assert len(result) == 2  # Only low and out of stock products
-        assert any(p.product_id == mock_product1.id and p.status == "low" for p in result)
-        assert any(p.product_id == mock_product2.id and p.status == "out_of_stock" for p in result)
-        assert not any(p.product_id == mock_product3.id for p in result)
+        assert len(result) == 2
+        assert result[0].product_id == mock_row1.id and result[0].status == "out_of_stock"
+        assert result[1].product_id == mock_row2.id and result[1].status == "low"
+    
+    def test_get_low_stock_products_filters_in_query(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.execute().all.return_value = []
+        
+        # Call the service
+        StockService.get_low_stock_products(mock_db, min_stock=10)
+        
+        # The threshold is applied by the database, not in Python
+        statement = mock_db.execute.call_args[0][0]
+        compiled = str(statement.compile(dialect=postgresql.dialect()))
+        assert "products.stock <" in compiled
+        assert "products.is_active" in compiled
     
     def test_get_all_stock_status(self):
         # Mock DB session
         mock_db = MagicMock()
         
-        # Mock products
-        mock_product1 = MagicMock()
-        mock_product1.id = uuid.uuid4()
-        mock_product1.name = "Low Stock Product"
-        mock_product1.stock = 5
-        mock_product1.is_active = True
+        # Mock rows, classified by the query
+        mock_row1 = MagicMock()
+        mock_row1.id = uuid.uuid4()
+        mock_row1.name = "Low Stock Product"
+        mock_row1.stock = 5
+        mock_row1.reserved_stock = 0
+        mock_row1.version = 1
+        mock_row1.status = "low"
         
-        mock_product2 = MagicMock()
-        mock_product2.id = uuid.uuid4()
-        mock_product2.name = "Normal Stock Product"
-        mock_product2.stock = 20
-        mock_product2.is_active = True
+        mock_row2 = MagicMock()
+        mock_row2.id = uuid.uuid4()
+        mock_row2.name = "Normal Stock Product"
+        mock_row2.stock = 20
+        mock_row2.reserved_stock = 0
+        mock_row2.version = 1
+        mock_row2.status = "ok"
         
         # Mock query result
-        mock_db.query().filter().all.return_value = [mock_product1, mock_product2]
+        mock_db.execute().all.return_value = [mock_row1, mock_row2]
         
         # Call the service
         result = StockService.get_all_stock_status(mock_db)
         
         # Assertions
         assert len(result) == 2
-        assert any(p.product_id == mock_product1.id and p.status == "low" for p in result)
-        assert any(p.product_id == mock_product2.id and p.status == "ok" for p in result)
+        assert any(p.product_id == mock_row1.id and p.status == "low" for p in result)
+        assert any(p.product_id == mock_row2.id and p.status == "ok" for p in result)
     
     def test_get_all_stock_status_with_min(self):
         # Mock DB session
         mock_db = MagicMock()
         
-        # Mock products
-        mock_product1 = MagicMock()
-        mock_product1.id = uuid.uuid4()
-        mock_product1.name = "Low Stock Product"
-        mock_product1.stock = 5
-        mock_product1.is_active = True
+        # Mock row
+        mock_row1 = MagicMock()
+        mock_row1.id = uuid.uuid4()
+        mock_row1.name = "Low Stock Product"
+        mock_row1.stock = 5
+        mock_row1.reserved_stock = 0
+        mock_row1.version = 1
+        mock_row1.status = "low"
         
         # Mock query result with filter
-        mock_db.query().filter().filter().all.return_value = [mock_product1]
+        mock_db.execute().all.return_value = [mock_row1]
         
         # Call the service
         result = StockService.get_all_stock_status(mock_db, min_stock=10)
         
         # Assertions
         assert len(result) == 1
-        assert result[0].product_id == mock_product1.id
+        assert result[0].product_id == mock_row1.id
         assert result[0].status == "low"
+    
+    def test_get_all_stock_status_page(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        mock_row1 = MagicMock()
+        mock_row1.id = uuid.uuid4()
+        mock_row1.name = "Next Product"
+        mock_row1.stock = 20
+        mock_row1.reserved_stock = 0
+        mock_row1.version = 1
+        mock_row1.status = "ok"
+        
+        # Mock query result for a page after a cursor
+        mock_db.execute().all.return_value = [mock_row1]
+        
+        # Call the service
+        cursor = uuid.uuid4()
+        result = StockService.get_all_stock_status(mock_db, limit=1, after=cursor)
+        
+        # Assertions
+        assert [r.product_id for r in result] == [mock_row1.id]
+        statement = mock_db.execute.call_args[0][0]
+        compiled = str(statement.compile(dialect=postgresql.dialect()))
+        assert "products.id >" in compiled
+        assert "ORDER BY products.id" in compiled
+        assert "LIMIT" in compiled
+    
+    def test_iter_stock_status(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        mock_row1 = MagicMock()
+        mock_row1.id = uuid.uuid4()
+        mock_row1.name = "Streamed Product"
+        mock_row1.stock = 0
+        mock_row1.reserved_stock = 0
+        mock_row1.version = 1
+        mock_row1.status = "out_of_stock"
+        
+        # Mock server-side cursor iteration
+        mock_db.execute.return_value = iter([mock_row1])
+        
+        # Call the service
+        result = list(StockService.iter_stock_status(mock_db, chunk_size=500))
+        
+        # Assertions
+        assert [r.product_id for r in result] == [mock_row1.id]
+        statement = mock_db.execute.call_args[0][0]
+        assert statement.get_execution_options()["yield_per"] == 500
+    
+    def test_get_products_stock_batch(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        # One product cached, one in the database, one missing
+        cached_response = StockResponse(
+            product_id=uuid.uuid4(),
+            name="Cached Product",
+            stock=5,
+            available_stock=5,
+            is_available=True,
+            version=1
+        )
+        
+        mock_product = MagicMock()
+        mock_product.id = uuid.uuid4()
+        mock_product.name = "Database Product"
+        mock_product.stock = 0
+        mock_product.reserved_stock = 0
+        mock_product.version = 1
+        
+        missing_id = uuid.uuid4()
+        
+        # Mock query result for the cache misses
+        mock_db.execute().all.return_value = [mock_product]
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache.get_many.return_value = {cached_response.product_id: cached_response}
+            mock_cache_class.return_value = mock_cache
+            
+            # Call the service
+            product_ids = [missing_id, mock_product.id, cached_response.product_id]
+            result = StockService.get_products_stock(mock_db, product_ids)
+            
+            # Assertions
+            assert [r.product_id for r in result] == product_ids
+            assert result[0].found == False
+            assert result[0].stock is None
+            assert result[1].found == True
+            assert result[1].stock.is_available == False
+            assert result[2].stock == cached_response
+            mock_cache.get_many.assert_called_once()
+            
+            # Only the product loaded from the database is written back
+            written = mock_cache.set_many.call_args[0][0]
+            assert list(written.keys()) == [mock_product.id]
+    
+    def test_get_products_stock_batch_all_cached(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        cached_response = StockResponse(
+            product_id=uuid.uuid4(),
+            name="Cached Product",
+            stock=5,
+            available_stock=5,
+            is_available=True,
+            version=1
+        )
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache.get_many.return_value = {cached_response.product_id: cached_response}
+            mock_cache_class.return_value = mock_cache
+            
+            # Duplicate IDs are answered once per request position
+            product_ids = [cached_response.product_id, cached_response.product_id]
+            result = StockService.get_products_stock(mock_db, product_ids)
+            
+            # Assertions
+            assert len(result) == 2
+            assert all(r.found for r in result)
+            mock_cache.get_many.assert_called_once_with([cached_response.product_id])
+            mock_db.execute.assert_not_called()
+            mock_cache.set_many.assert_not_called()
+    
+    def test_handle_stock_updated_event(self):
+        product_id = uuid.uuid4()
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache_class.return_value = mock_cache
+            
+            # Call the service
+            StockService.handle_stock_updated_event(product_id)
+            
+            # Assertions
+            mock_cache.delete.assert_called_once_with(product_id)
+    
+    def test_handle_stock_updated_event_updates_older_cached_entry(self):
+        product_id = uuid.uuid4()
+        cached = StockResponse(
+            product_id=product_id, name="Test Product", stock=10, reserved_stock=0,
+            available_stock=10, is_available=True, version=3
+        )
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache.get.return_value = cached
+            mock_cache_class.return_value = mock_cache
+            
+            # A late event for an older version leaves the entry alone
+            StockService.handle_stock_updated_event(product_id, version=2, stock=12, reserved_stock=0)
+            mock_cache.set.assert_not_called()
+            
+            StockService.handle_stock_updated_event(product_id, version=4, stock=6, reserved_stock=6)
+            
+            # Assertions
+            mock_cache.delete.assert_not_called()
+            updated = mock_cache.set.call_args[0][1]
+            assert updated.version == 4
+            assert updated.stock == 6
+            assert updated.available_stock == 0
+            assert updated.is_available is False
+            assert updated.name == "Test Product"
+    
+    def test_handle_stock_updated_event_invalidates_missing_entry(self):
+        product_id = uuid.uuid4()
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache.get.return_value = None
+            mock_cache_class.return_value = mock_cache
+            
+            # Call the service
+            StockService.handle_stock_updated_event(product_id, version=4, stock=6, reserved_stock=0)
+            
+            # Assertions
+            mock_cache.invalidate.assert_called_once_with(product_id, 4)
+            mock_cache.set.assert_not_called()
+    
+    def test_handle_stock_updated_event_from_supplier_sync(self):
+        product_id = uuid.uuid4()
+        cached = StockResponse(
+            product_id=product_id, name="Old Name", stock=10, reserved_stock=0,
+            available_stock=10, is_available=True, version=3
+        )
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache.get.return_value = cached
+            mock_cache_class.return_value = mock_cache
+            
+            # A renamed product is updated in place
+            StockService.handle_stock_updated_event(product_id, version=4, stock=10, reserved_stock=0, name="New Name")
+            assert mock_cache.set.call_args[0][1].name == "New Name"
+            
+            # A deactivated product is no longer served from the cache
+            StockService.handle_stock_updated_event(product_id, version=5, stock=10, reserved_stock=0, is_active=False)
+            
+            # Assertions
+            mock_cache.set.assert_called_once()
+            mock_cache.invalidate.assert_called_once_with(product_id, 5)
+    
+    def test_get_product_stock_async(self):
+        # Mock async DB session
+        mock_db = MagicMock()
+        mock_result = MagicMock()
+        mock_db.execute = AsyncMock(return_value=mock_result)
+        
+        # Mock product row
+        mock_product = MagicMock()
+        mock_product.id = uuid.uuid4()
+        mock_product.name = "Test Product"
+        mock_product.stock = 3
+        mock_product.reserved_stock = 0
+        mock_product.version = 1
+        mock_result.first.return_value = mock_product
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache.aget = AsyncMock(return_value=None)
+            mock_cache.aset = AsyncMock(return_value=True)
+            mock_cache_class.return_value = mock_cache
+            
+            # Run test with async handling
+            loop = asyncio.new_event_loop()
+            try:
+                result = loop.run_until_complete(
+                    StockService.get_product_stock_async(mock_db, mock_product.id)
+                )
+            finally:
+                loop.close()
+            
+            # Assertions
+            assert result.product_id == mock_product.id
+            assert result.stock == 3
+            mock_db.execute.assert_awaited_once()
+            mock_cache.aset.assert_awaited_once()
+    
+    def test_get_product_stock_async_not_found(self):
+        # Mock async DB session
+        mock_db = MagicMock()
+        mock_result = MagicMock()
+        mock_result.first.return_value = None
+        mock_db.execute = AsyncMock(return_value=mock_result)
+        
+        # Mock cache
+        with patch('app.services.stock_service.JsonCache') as mock_cache_class:
+            mock_cache = MagicMock()
+            mock_cache.aget = AsyncMock(return_value=None)
+            mock_cache_class.return_value = mock_cache
+            
+            # Run test with async handling
+            loop = asyncio.new_event_loop()
+            try:
+                with pytest.raises(HTTPException) as excinfo:
+                    loop.run_until_complete(
+                        StockService.get_product_stock_async(mock_db, uuid.uuid4())
+                    )
+            finally:
+                loop.close()
+            
+            # Assertions
+            assert excinfo.value.status_code == 404
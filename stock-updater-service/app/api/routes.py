@@ -1,27 +1,192 @@
+import re
+from typing import List, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
+from app.core.coalescer import stock_coalescer
+from app.core.config import settings
 from app.db.database import get_db
-from app.schemas.product import StockUpdate, ProductResponse
+from app.schemas.dead_letter import DeadLetterListResponse, DeadLetterReplayRequest, DeadLetterReplayResponse
+from app.schemas.product import StockUpdate, ProductResponse, BulkStockUpdateRequest, BulkStockUpdateResponse
+from app.schemas.reservation import ReservationCreate, ReservationResponse
+from app.services.dead_letter_service import DeadLetterService
+from app.services.reservation_service import ReservationService
 from app.services.stock_service import StockService
 
 stock_router = APIRouter()
+events_router = APIRouter()
+
+
+# An entity tag: optional weakness indicator and a quoted opaque tag
+_ENTITY_TAG = re.compile(r'(W/)?"([^"]*)"')
+
+
+def _etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _parse_if_match(if_match: Optional[str]) -> Optional[List[int]]:
+    """
+    Product versions accepted by an If-Match header (a list of entity tags), None when
+    absent or "*"
+    
+    If-Match uses strong comparison, so weak tags (W/"3") and tags that aren't product
+    versions never match; a header with only those gets an empty list, failing with 412.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    
+    versions = []
+    for tag in if_match.split(","):
+        match = _ENTITY_TAG.fullmatch(tag.strip())
+        if not match:
+            raise HTTPException(status_code=400, detail='If-Match must list ETags of product versions, e.g. "3"')
+        weak, opaque_tag = match.groups()
+        if not weak and opaque_tag.isascii() and opaque_tag.isdigit():
+            versions.append(int(opaque_tag))
+    return versions
+
+
+@stock_router.post("/update/bulk", response_model=BulkStockUpdateResponse)
+def bulk_update_stock(
+    bulk_update: BulkStockUpdateRequest,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Apply many stock adjustments in one transaction.
+    
+    In all_or_nothing mode nothing is committed if any item fails (409); in
+    best_effort mode the items that can be applied are committed.
+    """
+    if len(bulk_update.items) > settings.BULK_UPDATE_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items, maximum is {settings.BULK_UPDATE_MAX_ITEMS}"
+        )
+    
+    try:
+        result = StockService.bulk_update_stock(db, bulk_update)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating stock: {str(e)}")
+    
+    if not result.committed:
+        response.status_code = 409
+    return result
 
 
 @stock_router.post("/update/{product_id}", response_model=ProductResponse)
 def update_stock(
     product_id: UUID,
     stock_update: StockUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(default=None, description="Only update if the product is still at this version"),
     db: Session = Depends(get_db)
 ):
     """
-    Update product stock by adding or removing quantity
+    Update product stock by adding or removing quantity.
+    
+    With If-Match, the update is only applied if the product version still matches
+    (412 otherwise). The ETag response header holds the new version.
     """
+    expected_versions = _parse_if_match(if_match)
+    
     try:
-        updated_product = StockService.update_stock(db, product_id, stock_update)
-        return updated_product
+        # Unconditional updates of hot products are applied in coalesced batches; the response waits for their commit
+        if expected_versions is None and settings.COALESCE_HOT_PRODUCTS and stock_coalescer.is_hot(product_id):
+            future = stock_coalescer.submit(product_id, stock_update)
+            updated_product = future.result(timeout=settings.COALESCE_RESULT_TIMEOUT_S)
+        else:
+            updated_product = StockService.update_stock(
+                db, product_id, stock_update, expected_versions=expected_versions
+            )
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating stock: {str(e)}")
+    
+    response.headers["ETag"] = _etag(updated_product.version)
+    return updated_product
+
+
+@stock_router.post("/reservations", response_model=ReservationResponse, status_code=201)
+def reserve_stock(
+    reservation_create: ReservationCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Hold stock for a product, e.g. during checkout, until committed, released or expired
+    """
+    try:
+        return ReservationService.reserve(db, reservation_create)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reserving stock: {str(e)}")
+
+
+@stock_router.post("/reservations/{reservation_id}/commit", response_model=ReservationResponse)
+def commit_reservation(
+    reservation_id: UUID,
+    db: Session = Depends(get_db)
+):
+    """
+    Remove the reserved quantity from stock for good
+    """
+    try:
+        return ReservationService.commit(db, reservation_id)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error committing reservation: {str(e)}")
+
+
+@stock_router.post("/reservations/{reservation_id}/release", response_model=ReservationResponse)
+def release_reservation(
+    reservation_id: UUID,
+    db: Session = Depends(get_db)
+):
+    """
+    Give the reserved quantity back to available stock
+    """
+    try:
+        return ReservationService.release(db, reservation_id)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error releasing reservation: {str(e)}")
+
+
+@events_router.get("/dead-letters", response_model=DeadLetterListResponse)
+def list_dead_letters(limit: int = Query(100, ge=1)):
+    """
+    Inspect the events at the head of the dead-letter queue without removing them
+    """
+    if limit > settings.DEAD_LETTER_REPLAY_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Limit too high, maximum is {settings.DEAD_LETTER_REPLAY_MAX}"
+        )
+    
+    try:
+        return DeadLetterService.list_messages(limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading dead-letter queue: {str(e)}")
+
+
+@events_router.post("/dead-letters/replay", response_model=DeadLetterReplayResponse)
+def replay_dead_letters(replay_request: DeadLetterReplayRequest):
+    """
+    Send dead-lettered events back for processing, oldest first
+    """
+    if replay_request.limit > settings.DEAD_LETTER_REPLAY_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Limit too high, maximum is {settings.DEAD_LETTER_REPLAY_MAX}"
+        )
+    
+    try:
+        return DeadLetterService.replay(replay_request.limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error replaying dead-letter queue: {str(e)}")
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.schemas.product import StockUpdate
+from app.services.stock_service import StockService
+
+
+logger = logging.getLogger(__name__)
+
+
+class HotProductDetector:
+    """
+    Flags products whose update rate reaches threshold_per_s, and keeps them
+    flagged for hot_ttl_s after the rate was last reached
+    """
+
+    def __init__(self, threshold_per_s: int, hot_ttl_s: float, window_s: float = 1.0, max_tracked: int = 10000):
+        self.threshold = max(1, int(threshold_per_s * window_s))
+        self.hot_ttl_s = hot_ttl_s
+        self.window_s = window_s
+        self.max_tracked = max_tracked
+        # product ID -> [window start, updates in window]
+        self._windows: Dict[UUID, List] = {}
+        self._hot_until: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, product_id: UUID) -> bool:
+        """
+        Count an update for the product and return whether it is hot
+        """
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(product_id)
+            if window is None or now - window[0] >= self.window_s:
+                if len(self._windows) >= self.max_tracked:
+                    self._prune(now)
+                window = [now, 0]
+                self._windows[product_id] = window
+            window[1] += 1
+
+            if window[1] >= self.threshold:
+                self._hot_until[product_id] = now + self.hot_ttl_s
+
+            return self._hot_until.get(product_id, 0) > now
+
+    def _prune(self, now: float) -> None:
+        self._windows = {
+            product_id: window for product_id, window in self._windows.items()
+            if now - window[0] < self.window_s
+        }
+        self._hot_until = {
+            product_id: until for product_id, until in self._hot_until.items()
+            if until > now
+        }
+
+
+class StockWriteCoalescer:
+    """
+    Gathers stock updates for hot products and applies them every
+    COALESCE_FLUSH_INTERVAL_MS with one UPDATE per product, instead of one
+    transaction per update fighting over the same row lock.
+
+    Callers wait on the Future returned by submit, which only completes once
+    the flush that contains their update has committed (or failed).
+    """
+
+    def __init__(self):
+        self.detector = HotProductDetector(settings.HOT_PRODUCT_THRESHOLD_PER_S, settings.HOT_PRODUCT_TTL_S)
+        self._pending: List[Tuple[UUID, StockUpdate, Future]] = []
+        self._lock = threading.Lock()
+        self._has_pending = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def is_hot(self, product_id: UUID) -> bool:
+        return self.detector.record(product_id)
+
+    def submit(self, product_id: UUID, stock_update: StockUpdate) -> Future:
+        """
+        Queue an update for the next flush
+        """
+        future = Future()
+        with self._lock:
+            if self._stop.is_set():
+                raise RuntimeError("Stock write coalescer is stopped")
+            self._pending.append((product_id, stock_update, future))
+        self._has_pending.set()
+        return future
+
+    def start(self) -> None:
+        """
+        Start flushing in a daemon thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stop accepting updates and wait for the pending ones to be flushed
+        """
+        with self._lock:
+            self._stop.set()
+        self._has_pending.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self) -> None:
+        while True:
+            self._has_pending.wait()
+            if not self._stop.is_set():
+                # Let concurrent updates gather before flushing
+                time.sleep(settings.COALESCE_FLUSH_INTERVAL_MS / 1000)
+            self._has_pending.clear()
+            self.flush()
+
+            if self._stop.is_set():
+                self.flush()
+                return
+
+    def flush(self) -> None:
+        """
+        Apply every pending update in one transaction and complete their futures
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        db = SessionLocal()
+        try:
+            results = StockService.apply_coalesced_updates(
+                db, [(product_id, stock_update) for product_id, stock_update, _ in batch]
+            )
+        except Exception as e:
+            logger.error(f"Error flushing coalesced stock updates: {e}")
+            db.rollback()
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        for (_, _, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        logger.debug(f"Flushed {len(batch)} coalesced stock updates")
+
+
+stock_coalescer = StockWriteCoalescer()
@@ -35,6 +35,9 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
     
+    # Bulk stock adjustments
+    BULK_UPDATE_MAX_ITEMS: int = int(os.getenv("BULK_UPDATE_MAX_ITEMS", "10000"))
+    
     # RabbitMQ
     RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "localhost")
     RABBITMQ_PORT: int = int(os.getenv("RABBITMQ_PORT", "5672"))
@@ -42,9 +45,62 @@ class Settings(BaseSettings):
     RABBITMQ_PASSWORD: str = os.getenv("RABBITMQ_PASSWORD", "guest")
     RABBITMQ_VHOST: str = os.getenv("RABBITMQ_VHOST", "/")
     
+    # Event consumer batching
+    CONSUMER_PREFETCH_COUNT: int = int(os.getenv("CONSUMER_PREFETCH_COUNT", "500"))
+    CONSUMER_BATCH_SIZE: int = int(os.getenv("CONSUMER_BATCH_SIZE", "200"))
+    CONSUMER_BATCH_MAX_WAIT_MS: int = int(os.getenv("CONSUMER_BATCH_MAX_WAIT_MS", "50"))
+    # Number of partition queues / worker threads events are spread across by product ID
+    CONSUMER_WORKERS: int = int(os.getenv("CONSUMER_WORKERS", "4"))
+    # Reconnect delay doubles from min to max while RabbitMQ is unreachable
+    CONSUMER_RECONNECT_MIN_DELAY_MS: int = int(os.getenv("CONSUMER_RECONNECT_MIN_DELAY_MS", "500"))
+    CONSUMER_RECONNECT_MAX_DELAY_MS: int = int(os.getenv("CONSUMER_RECONNECT_MAX_DELAY_MS", "30000"))
+    # Time allowed on shutdown to apply and ack the events already received
+    CONSUMER_SHUTDOWN_TIMEOUT_S: int = int(os.getenv("CONSUMER_SHUTDOWN_TIMEOUT_S", "20"))
+    # Recently processed event IDs kept in memory to skip duplicates without a DB lookup
+    PROCESSED_EVENTS_CACHE_SIZE: int = int(os.getenv("PROCESSED_EVENTS_CACHE_SIZE", "100000"))
+    # Processed event IDs older than this are purged; keep it above the longest redelivery
+    # or dead-letter replay window, or replayed events are applied twice
+    PROCESSED_EVENTS_RETENTION_HOURS: int = int(os.getenv("PROCESSED_EVENTS_RETENTION_HOURS", "168"))
+    PROCESSED_EVENTS_PURGE_BATCH_SIZE: int = int(os.getenv("PROCESSED_EVENTS_PURGE_BATCH_SIZE", "10000"))
+    # Delay before each retry of a failed event; once exhausted the event is dead-lettered
+    CONSUMER_RETRY_DELAYS_MS: str = os.getenv("CONSUMER_RETRY_DELAYS_MS", "1000,5000,30000")
+    DEAD_LETTER_QUEUE: str = os.getenv("DEAD_LETTER_QUEUE", "stock_events.dead_letter")
+    DEAD_LETTER_REPLAY_MAX: int = int(os.getenv("DEAD_LETTER_REPLAY_MAX", "1000"))
+    
+    # Outbox relay
+    OUTBOX_RELAY_BATCH_SIZE: int = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", "500"))
+    OUTBOX_RELAY_POLL_INTERVAL_MS: int = int(os.getenv("OUTBOX_RELAY_POLL_INTERVAL_MS", "200"))
+    # Time allowed for the broker to confirm a published event
+    OUTBOX_RELAY_CONFIRM_TIMEOUT_S: int = int(os.getenv("OUTBOX_RELAY_CONFIRM_TIMEOUT_S", "10"))
+    
+    # Write coalescing for hot products (stock updates through the API)
+    COALESCE_HOT_PRODUCTS: bool = os.getenv("COALESCE_HOT_PRODUCTS", "False").lower() == "true"
+    HOT_PRODUCT_THRESHOLD_PER_S: int = int(os.getenv("HOT_PRODUCT_THRESHOLD_PER_S", "200"))
+    HOT_PRODUCT_TTL_S: int = int(os.getenv("HOT_PRODUCT_TTL_S", "10"))
+    COALESCE_FLUSH_INTERVAL_MS: int = int(os.getenv("COALESCE_FLUSH_INTERVAL_MS", "5"))
+    COALESCE_RESULT_TIMEOUT_S: int = int(os.getenv("COALESCE_RESULT_TIMEOUT_S", "10"))
+    
+    # Stock reservations
+    RESERVATION_DEFAULT_TTL_S: int = int(os.getenv("RESERVATION_DEFAULT_TTL_S", "900"))
+    RESERVATION_MAX_TTL_S: int = int(os.getenv("RESERVATION_MAX_TTL_S", "3600"))
+    RESERVATION_SWEEP_INTERVAL_MS: int = int(os.getenv("RESERVATION_SWEEP_INTERVAL_MS", "1000"))
+    RESERVATION_SWEEP_BATCH_SIZE: int = int(os.getenv("RESERVATION_SWEEP_BATCH_SIZE", "500"))
+    
+    # Stock movements ledger (monthly partitions)
+    STOCK_MOVEMENTS_PARTITIONS_AHEAD: int = int(os.getenv("STOCK_MOVEMENTS_PARTITIONS_AHEAD", "2"))
+    STOCK_MOVEMENTS_RETENTION_MONTHS: int = int(os.getenv("STOCK_MOVEMENTS_RETENTION_MONTHS", "12"))
+    STOCK_MOVEMENTS_MAINTENANCE_INTERVAL_S: int = int(os.getenv("STOCK_MOVEMENTS_MAINTENANCE_INTERVAL_S", "3600"))
+    
     # Event topics
+    EVENTS_EXCHANGE: str = "inventory_events"
+    STOCK_EVENTS_PARTITION_EXCHANGE: str = "stock_events_partitions"
     PRODUCT_RECEIVED_TOPIC: str = "product-received"
     PRODUCT_SOLD_TOPIC: str = "product-sold"
+    STOCK_UPDATED_TOPIC: str = "stock-updated"
+    
+    @property
+    def consumer_retry_delays(self) -> List[int]:
+        return [int(delay) for delay in self.CONSUMER_RETRY_DELAYS_MS.split(",") if delay.strip()]
     
     class Config:
         case_sensitive = True
@@ -0,0 +1,693 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+from uuid import UUID
+
+import aio_pika
+import msgspec
+from aio_pika.abc import AbstractChannel, AbstractConnection, AbstractIncomingMessage, AbstractQueue
+
+from app.core.config import settings
+from app.core.metrics import (
+    BATCH_SIZE,
+    EVENT_AGE,
+    EVENT_OUTCOMES,
+    EVENTS_CONSUMED,
+    EVENTS_NACKED,
+    EVENTS_REDELIVERED,
+    QUEUE_DEPTH,
+    STAGE_LATENCY,
+)
+from app.db.database import SessionLocal
+from app.schemas.events import decode_event, decode_event_key
+from app.schemas.product import StockEvent
+from app.services.stock_service import StockService
+
+
+logger = logging.getLogger(__name__)
+
+
+# Sign and reason of the stock change carried by each event type
+EVENT_TYPES = {
+    settings.PRODUCT_RECEIVED_TOPIC: (1, "Product received from supplier"),
+    settings.PRODUCT_SOLD_TOPIC: (-1, "Product sold"),
+}
+
+# Queue each event type is published to
+SOURCE_QUEUES = {
+    settings.PRODUCT_RECEIVED_TOPIC: 'product_received_queue',
+    settings.PRODUCT_SOLD_TOPIC: 'product_sold_queue',
+}
+
+
+async def connect() -> AbstractConnection:
+    """
+    Open a RabbitMQ connection
+    """
+    return await aio_pika.connect(
+        host=settings.RABBITMQ_HOST,
+        port=settings.RABBITMQ_PORT,
+        login=settings.RABBITMQ_USER,
+        password=settings.RABBITMQ_PASSWORD,
+        virtualhost=settings.RABBITMQ_VHOST
+    )
+
+
+async def declare_source_queues(channel: AbstractChannel) -> List[AbstractQueue]:
+    """
+    Declare the events exchange and the product received/sold queues
+    """
+    exchange = await channel.declare_exchange(
+        settings.EVENTS_EXCHANGE,
+        aio_pika.ExchangeType.TOPIC,
+        durable=True
+    )
+    
+    # Product received and product sold queues
+    queues = []
+    for topic, queue_name in SOURCE_QUEUES.items():
+        queue = await channel.declare_queue(queue_name, durable=True)
+        await queue.bind(exchange, routing_key=topic)
+        queues.append(queue)
+    
+    return queues
+
+
+def partition_queue(partition: int) -> str:
+    return f"stock_events.partition.{partition}"
+
+
+async def declare_partition_queue(channel: AbstractChannel, partition: int) -> AbstractQueue:
+    """
+    Declare one partition queue and bind it to the partition exchange.
+
+    Only one consumer at a time is served from a partition queue, across all
+    processes, so its events are applied in the order they were routed.
+    """
+    exchange = await channel.declare_exchange(
+        settings.STOCK_EVENTS_PARTITION_EXCHANGE,
+        aio_pika.ExchangeType.DIRECT,
+        durable=True
+    )
+    queue = await channel.declare_queue(
+        partition_queue(partition),
+        durable=True,
+        arguments={'x-single-active-consumer': True}
+    )
+    await queue.bind(exchange, routing_key=partition_queue(partition))
+    return queue
+
+
+def retry_queue(partition: int, delay_ms: int) -> str:
+    return f"{partition_queue(partition)}.retry.{delay_ms}ms"
+
+
+async def declare_retry_queues(channel: AbstractChannel, partition: int) -> None:
+    """
+    Declare the retry queues of a partition, one per retry delay, and the dead-letter queue.
+
+    Messages wait in a retry queue for its TTL and are then dead-lettered back
+    to the partition queue.
+    """
+    for delay_ms in settings.consumer_retry_delays:
+        await channel.declare_queue(
+            retry_queue(partition, delay_ms),
+            durable=True,
+            arguments={
+                'x-message-ttl': delay_ms,
+                'x-dead-letter-exchange': settings.STOCK_EVENTS_PARTITION_EXCHANGE,
+                'x-dead-letter-routing-key': partition_queue(partition),
+            }
+        )
+
+    await channel.declare_queue(settings.DEAD_LETTER_QUEUE, durable=True)
+
+
+def partition_for(product_id: Optional[str], partitions: int) -> int:
+    """
+    Stable partition of a product ID, so all events for a product land in the same queue
+    """
+    try:
+        key = str(UUID(str(product_id)))
+    except ValueError:
+        key = str(product_id)
+    return zlib.crc32(key.encode()) % partitions
+
+
+def event_type(message: AbstractIncomingMessage) -> str:
+    """
+    Original topic of an event; routed events carry it in the event_type header
+    """
+    headers = message.headers or {}
+    return headers.get('event_type', message.routing_key)
+
+
+def event_product_id(body: bytes, content_type: Optional[str] = None) -> Optional[str]:
+    """
+    Product ID of an event, or None if the body can't be read
+    """
+    try:
+        return decode_event_key(body, content_type).product_id
+    except msgspec.DecodeError:
+        return None
+
+
+def retry_count(message) -> int:
+    return int((message.headers or {}).get('x-retry-count', 0))
+
+
+def persistent_copy(message: AbstractIncomingMessage, headers: dict) -> aio_pika.Message:
+    """
+    Persistent copy of a received message with new headers.
+
+    Messages published without a timestamp get the current time, so the age
+    of the event can be measured from here on.
+    """
+    return aio_pika.Message(
+        body=message.body,
+        content_type=message.content_type,
+        message_id=message.message_id,
+        timestamp=message.timestamp or datetime.now(timezone.utc),
+        headers=headers,
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+    )
+
+
+def decode_stock_event(routing_key: str, body: bytes, content_type: Optional[str] = None) -> StockEvent:
+    """
+    Turn a product received/sold message into a signed stock change
+    """
+    sign, reason = EVENT_TYPES[routing_key]
+    event = decode_event(routing_key, body, content_type)
+    # Already validated by the event schema
+    return StockEvent.model_construct(
+        event_id=event.event_id,
+        product_id=event.product_id,
+        quantity=sign * event.quantity,
+        reason=reason
+    )
+
+
+class RecentEventIds:
+    """
+    Bounded, thread-safe set of the most recently processed event IDs
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, event_id: str) -> bool:
+        with self._lock:
+            if event_id in self._ids:
+                self._ids.move_to_end(event_id)
+                return True
+            return False
+
+    def add(self, event_id: str) -> None:
+        with self._lock:
+            self._ids[event_id] = None
+            self._ids.move_to_end(event_id)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+
+
+# Shared by all workers; processed_events in the database remains the source of truth
+recent_event_ids = RecentEventIds(settings.PROCESSED_EVENTS_CACHE_SIZE)
+
+
+class StockEventRouter:
+    """
+    Moves product received/sold events from their source queues to the
+    partition queue of their product, preserving their order per product
+    """
+
+    def __init__(self, partitions: int):
+        self.partitions = partitions
+        self.channel = None
+        self.exchange = None
+        self._consumers = []
+        self._in_flight: Set[asyncio.Task] = set()
+
+    async def start(self, connection: AbstractConnection) -> None:
+        """
+        Declare the topology and start routing
+        """
+        # Publishes wait until the broker has taken the message, and raise if it can't be routed
+        self.channel = await connection.channel(on_return_raises=True)
+        await self.channel.set_qos(prefetch_count=settings.CONSUMER_PREFETCH_COUNT)
+
+        source_queues = await declare_source_queues(self.channel)
+        for partition in range(self.partitions):
+            await declare_partition_queue(self.channel, partition)
+        self.exchange = await self.channel.get_exchange(settings.STOCK_EVENTS_PARTITION_EXCHANGE)
+
+        for queue in source_queues:
+            self._consumers.append((queue, await queue.consume(self._on_message)))
+
+    async def stop(self) -> None:
+        """
+        Stop consuming and wait for the events being routed to be acked
+        """
+        for queue, consumer_tag in self._consumers:
+            await queue.cancel(consumer_tag)
+        self._consumers = []
+
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _on_message(self, message: AbstractIncomingMessage) -> None:
+        task = asyncio.current_task()
+        self._in_flight.add(task)
+        try:
+            headers = dict(message.headers or {})
+            headers['event_type'] = message.routing_key
+            queue = SOURCE_QUEUES.get(message.routing_key, message.routing_key)
+            EVENTS_CONSUMED.labels(queue=queue).inc()
+            if message.redelivered:
+                EVENTS_REDELIVERED.labels(queue=queue).inc()
+
+            started = time.perf_counter()
+            try:
+                await self.exchange.publish(
+                    persistent_copy(message, headers),
+                    routing_key=partition_queue(partition_for(
+                        event_product_id(message.body, message.content_type), self.partitions
+                    )),
+                    mandatory=True
+                )
+            except Exception as e:
+                logger.error(f"Error routing {message.routing_key} event: {e}")
+                await message.nack()
+                EVENTS_NACKED.labels(queue=queue).inc()
+                return
+
+            await message.ack()
+            STAGE_LATENCY.labels(stage="route").observe(time.perf_counter() - started)
+        finally:
+            self._in_flight.discard(task)
+
+
+class StockEventConsumer:
+    """
+    Consumes the product received/sold events of one partition in micro-batches.
+
+    Messages are buffered until CONSUMER_BATCH_SIZE are pending or
+    CONSUMER_BATCH_MAX_WAIT_MS have passed since the first one, then applied
+    in one transaction and acknowledged together. Batches of a partition are
+    applied one at a time, in a worker thread so the event loop stays free.
+
+    Failed messages are moved to a retry queue with a growing delay, or to the
+    dead-letter queue when they can never succeed or have run out of retries.
+    """
+
+    def __init__(self, partition: int):
+        self.partition = partition
+        self.queue_name = partition_queue(partition)
+        self.channel = None
+        self.queue = None
+        self._consumer_tag = None
+        self._buffer: List[AbstractIncomingMessage] = []
+        self._timer = None
+        self._flush_lock = asyncio.Lock()
+        self._flushes: Set[asyncio.Task] = set()
+        # Delivery tags received but not yet acked or nacked, in order
+        self._outstanding: List[int] = []
+
+    async def start(self, connection: AbstractConnection) -> None:
+        """
+        Declare the topology and start consuming
+        """
+        # Retried/dead-lettered messages are only acked once the broker has taken their copy
+        self.channel = await connection.channel(on_return_raises=True)
+        await self.channel.set_qos(prefetch_count=settings.CONSUMER_PREFETCH_COUNT)
+
+        self.queue = await declare_partition_queue(self.channel, self.partition)
+        await declare_retry_queues(self.channel, self.partition)
+
+        self._consumer_tag = await self.queue.consume(self._on_message)
+
+    async def stop(self) -> None:
+        """
+        Stop consuming, then apply and ack the messages already received.
+
+        Anything still unacked when the channel closes is redelivered, and
+        skipped then if it had been applied.
+        """
+        if self._consumer_tag is not None:
+            await self.queue.cancel(self._consumer_tag)
+            self._consumer_tag = None
+
+        # Let deliveries that arrived before the cancel reach the buffer
+        await asyncio.sleep(0)
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def _on_message(self, message: AbstractIncomingMessage) -> None:
+        self._outstanding.append(message.delivery_tag)
+        self._buffer.append(message)
+        EVENTS_CONSUMED.labels(queue=self.queue_name).inc()
+        if message.redelivered:
+            EVENTS_REDELIVERED.labels(queue=self.queue_name).inc()
+
+        if len(self._buffer) == settings.CONSUMER_BATCH_SIZE:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                settings.CONSUMER_BATCH_MAX_WAIT_MS / 1000,
+                self._on_timer
+            )
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task: asyncio.Task) -> None:
+        self._flushes.discard(task)
+        # e.g. the channel closed before the batch could be acked; it will be redelivered
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error flushing stock events batch: {task.exception()}")
+
+    async def flush(self) -> None:
+        """
+        Apply the buffered messages in one transaction, move the ones that failed
+        to a retry or the dead-letter queue, then ack the batch
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._flush_lock:
+            batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            BATCH_SIZE.observe(len(batch))
+
+            # (message, error, permanent) for every failed message
+            failures = []
+            changes = []
+            change_messages = []
+            started = time.perf_counter()
+            for message in batch:
+                try:
+                    change = decode_stock_event(event_type(message), message.body, message.content_type)
+                except Exception as e:
+                    logger.error(f"Invalid {event_type(message)} event payload: {e}")
+                    failures.append((message, f"Invalid payload: {e}", True))
+                    continue
+
+                # Redelivery of an event applied recently: just ack it
+                if change.event_id in recent_event_ids:
+                    logger.debug(f"Skipping already processed event {change.event_id}")
+                    EVENT_OUTCOMES.labels(queue=self.queue_name, outcome="duplicate").inc()
+                    continue
+
+                changes.append(change)
+                change_messages.append(message)
+            STAGE_LATENCY.labels(stage="decode").observe(time.perf_counter() - started)
+
+            if changes:
+                started = time.perf_counter()
+                failures.extend(await asyncio.to_thread(self._apply_changes, changes, change_messages))
+                STAGE_LATENCY.labels(stage="db").observe(time.perf_counter() - started)
+
+            # Messages whose retry/dead-letter copy couldn't be published are requeued instead
+            started = time.perf_counter()
+            requeued = set()
+            for message, error, permanent in failures:
+                if permanent:
+                    moved = await self.dead_letter(message, error)
+                else:
+                    moved = await self.retry(message, error)
+                if not moved:
+                    await self.nack(message)
+                    requeued.add(message.delivery_tag)
+            if failures:
+                STAGE_LATENCY.labels(stage="handoff").observe(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await self.ack([message for message in batch if message.delivery_tag not in requeued])
+            STAGE_LATENCY.labels(stage="ack").observe(time.perf_counter() - started)
+            logger.debug(f"Stock events batch processed: {len(batch)} messages, {len(failures)} failed")
+
+    def _apply_changes(self, changes: List[StockEvent], messages: List[AbstractIncomingMessage]) -> list:
+        """
+        Apply stock changes in one transaction, returning the failures
+        """
+        failures = []
+        db = SessionLocal()
+        try:
+            errors = StockService.apply_stock_changes(db, changes)
+            committed_at = time.time()
+            for message, change, error in zip(messages, changes, errors):
+                if error is not None:
+                    logger.error(f"Error processing stock event for {change.product_id}: {error.detail}")
+                    # A missing product won't appear by retrying; insufficient stock might
+                    failures.append((message, str(error.detail), error.status_code == 404))
+                else:
+                    recent_event_ids.add(change.event_id)
+                    EVENT_OUTCOMES.labels(queue=self.queue_name, outcome="applied").inc()
+                    if message.timestamp is not None:
+                        EVENT_AGE.observe(committed_at - message.timestamp.timestamp())
+        except Exception as e:
+            logger.error(f"Error processing stock events batch: {e}")
+            db.rollback()
+            failures.extend((message, str(e), False) for message in messages)
+        finally:
+            db.close()
+        return failures
+
+    async def retry(self, message: AbstractIncomingMessage, error: str) -> bool:
+        """
+        Publish a failed message to the retry queue of its next attempt,
+        or to the dead-letter queue once every retry has been used
+        """
+        delays = settings.consumer_retry_delays
+        attempt = retry_count(message)
+        if attempt >= len(delays):
+            return await self.dead_letter(message, f"Retries exhausted: {error}")
+
+        headers = dict(message.headers or {})
+        headers['x-retry-count'] = attempt + 1
+        headers['x-last-error'] = error
+        moved = await self._publish(retry_queue(self.partition, delays[attempt]), message, headers)
+        if moved:
+            EVENT_OUTCOMES.labels(queue=self.queue_name, outcome="retried").inc()
+        return moved
+
+    async def dead_letter(self, message: AbstractIncomingMessage, error: str) -> bool:
+        """
+        Publish a message that won't be retried to the dead-letter queue
+        """
+        headers = dict(message.headers or {})
+        headers['x-last-error'] = error
+        headers['x-source-queue'] = self.queue_name
+        moved = await self._publish(settings.DEAD_LETTER_QUEUE, message, headers)
+        if moved:
+            EVENT_OUTCOMES.labels(queue=self.queue_name, outcome="dead_lettered").inc()
+        return moved
+
+    async def _publish(self, queue: str, message: AbstractIncomingMessage, headers: dict) -> bool:
+        try:
+            await self.channel.default_exchange.publish(
+                persistent_copy(message, headers),
+                routing_key=queue,
+                mandatory=True
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error publishing event to {queue}: {e}")
+            return False
+
+    async def ack(self, messages: List[AbstractIncomingMessage]) -> None:
+        """
+        Ack messages, using a single multiple=True ack for the longest run
+        of outstanding delivery tags they cover
+        """
+        if not messages:
+            return
+
+        to_ack = {message.delivery_tag: message for message in messages}
+
+        # Highest tag such that every outstanding tag up to it is being acked
+        covered = None
+        for tag in self._outstanding:
+            if tag not in to_ack:
+                break
+            covered = tag
+
+        if covered is not None:
+            await to_ack[covered].ack(multiple=True)
+            del self._outstanding[:bisect.bisect_right(self._outstanding, covered)]
+
+        for tag in sorted(to_ack):
+            if covered is None or tag > covered:
+                await to_ack[tag].ack()
+                self._forget(tag)
+
+    async def nack(self, message: AbstractIncomingMessage, requeue: bool = True) -> None:
+        """
+        Nack a single message
+        """
+        await message.nack(requeue=requeue)
+        self._forget(message.delivery_tag)
+        EVENTS_NACKED.labels(queue=self.queue_name).inc()
+
+    def _forget(self, tag: int) -> None:
+        index = bisect.bisect_left(self._outstanding, tag)
+        if index < len(self._outstanding) and self._outstanding[index] == tag:
+            del self._outstanding[index]
+
+
+class ConsumerSupervisor:
+    """
+    Runs the router and one consumer per partition on the application's event
+    loop, over a single RabbitMQ connection.
+
+    When the connection can't be opened or is lost, it is reopened after a
+    delay that doubles from CONSUMER_RECONNECT_MIN_DELAY_MS up to
+    CONSUMER_RECONNECT_MAX_DELAY_MS. Messages that were not acked are
+    redelivered by the broker on the new connection.
+    """
+
+    def __init__(self, partitions: int):
+        self.partitions = partitions
+        self.connection = None
+        self.router = None
+        self.consumers: List[StockEventConsumer] = []
+        self._stopping = None
+        self._connection_lost = None
+        self._task = None
+
+    def start(self) -> None:
+        """
+        Start consuming in a background task
+        """
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self, timeout: float = None) -> None:
+        """
+        Stop consuming, finish and ack the batches in flight, then close the connection
+        """
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+        if self.connection is not None and not self.connection.is_closed:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out draining stock event consumers, unacked events will be redelivered")
+            except Exception as e:
+                logger.error(f"Error draining stock event consumers: {e}")
+        await self._close()
+
+    def queue_names(self) -> List[str]:
+        """
+        Every queue stock events go through
+        """
+        names = list(SOURCE_QUEUES.values())
+        for partition in range(self.partitions):
+            names.append(partition_queue(partition))
+            names.extend(retry_queue(partition, delay_ms) for delay_ms in settings.consumer_retry_delays)
+        names.append(settings.DEAD_LETTER_QUEUE)
+        return names
+
+    async def update_queue_depths(self) -> None:
+        """
+        Read the number of ready messages of every queue into QUEUE_DEPTH
+        """
+        if self.connection is None or self.connection.is_closed:
+            return
+        channel = None
+        try:
+            for name in self.queue_names():
+                if channel is None or channel.is_closed:
+                    channel = await self.connection.channel()
+                try:
+                    queue = await channel.declare_queue(name, passive=True)
+                except aio_pika.exceptions.ChannelNotFoundEntity:
+                    # The broker closes the channel on a missing queue; the next one reopens it
+                    logger.warning(f"Stock event queue {name} does not exist")
+                    continue
+                QUEUE_DEPTH.labels(queue=name).set(queue.declaration_result.message_count)
+        except Exception as e:
+            logger.warning(f"Error reading stock event queue depths: {e}")
+        finally:
+            if channel is not None and not channel.is_closed:
+                await channel.close()
+
+    async def run(self) -> None:
+        delay = settings.CONSUMER_RECONNECT_MIN_DELAY_MS / 1000
+        while not self._stopping.is_set():
+            try:
+                await self._connect()
+                logger.info("RabbitMQ consumers connected")
+                delay = settings.CONSUMER_RECONNECT_MIN_DELAY_MS / 1000
+
+                # Consume until the connection is lost or shutdown starts
+                stopping = asyncio.create_task(self._stopping.wait())
+                lost = asyncio.create_task(self._connection_lost.wait())
+                await asyncio.wait({stopping, lost}, return_when=asyncio.FIRST_COMPLETED)
+                stopping.cancel()
+                lost.cancel()
+                if self._stopping.is_set():
+                    return
+                logger.warning("RabbitMQ connection lost")
+            except Exception as e:
+                logger.error(f"RabbitMQ consumer connection error: {e}")
+            await self._close()
+
+            logger.info(f"Reconnecting to RabbitMQ in {delay:.1f}s")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, settings.CONSUMER_RECONNECT_MAX_DELAY_MS / 1000)
+
+    async def _connect(self) -> None:
+        self._connection_lost = asyncio.Event()
+        self.connection = await connect()
+        self.connection.close_callbacks.add(self._on_connection_closed)
+
+        # Events are spread by product ID over one partition queue per consumer
+        self.router = StockEventRouter(partitions=self.partitions)
+        self.consumers = [StockEventConsumer(partition) for partition in range(self.partitions)]
+        await self.router.start(self.connection)
+        for consumer in self.consumers:
+            await consumer.start(self.connection)
+
+    def _on_connection_closed(self, *args) -> None:
+        self._connection_lost.set()
+
+    async def _drain(self) -> None:
+        # Stop routing first, so the consumers don't receive new events while draining
+        await self.router.stop()
+        await asyncio.gather(*(consumer.stop() for consumer in self.consumers))
+
+    async def _close(self) -> None:
+        connection, self.connection = self.connection, None
+        if connection is not None and not connection.is_closed:
+            try:
+                await connection.close()
+            except Exception as e:
+                logger.error(f"Error closing RabbitMQ connection: {e}")
+
+
+consumer_supervisor = ConsumerSupervisor(partitions=settings.CONSUMER_WORKERS)
@@ -1,14 +1,17 @@
-import json
 import logging
-from typing import Callable
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
 
-import pika
 from fastapi import FastAPI
 from sqlalchemy import text
 
+from app.core.coalescer import stock_coalescer
 from app.core.config import settings
-from app.db.database import engine, SessionLocal
-from app.services.stock_service import StockService
+from app.core.consumer import consumer_supervisor
+from app.core.ledger import ledger_maintenance
+from app.core.outbox import outbox_relay
+from app.core.reservations import reservation_sweeper
+from app.db.database import engine
 
 
 logger = logging.getLogger(__name__)
@@ -23,6 +26,10 @@ def start_app_handler(app: FastAPI) -> Callable:
         # Initialize database tables
         from app.models.product import Product
         from app.models.supplier import Supplier
+        from app.models.processed_event import ProcessedEvent
+        from app.models.outbox_event import OutboxEvent
+        from app.models.stock_movement import StockMovement
+        from app.models.reservation import StockReservation
         
         # Create tables
         try:
@@ -34,15 +41,27 @@ def start_app_handler(app: FastAPI) -> Callable:
             # Create tables
             Base.metadata.create_all(bind=engine)
             logger.info("Database tables created")
+            
+            # Stock movements need a partition for the current month before any write
+            ledger_maintenance.run_once()
+            logger.info("Stock movements partitions ready")
         except Exception as e:
             logger.error(f"Database initialization error: {e}")
         
-        # Setup RabbitMQ consumer
-        try:
-            setup_rabbitmq_consumer()
-            logger.info("RabbitMQ consumer setup completed")
-        except Exception as e:
-            logger.error(f"RabbitMQ consumer setup error: {e}")
+        # Consume product events on the app's event loop; connection errors are retried in the background
+        consumer_supervisor.start()
+        logger.info("RabbitMQ consumer started")
+        
+        # Publish committed stock events
+        outbox_relay.start()
+        logger.info("Outbox relay started")
+        
+        ledger_maintenance.start()
+        reservation_sweeper.start()
+        
+        if settings.COALESCE_HOT_PRODUCTS:
+            stock_coalescer.start()
+            logger.info("Hot product write coalescing enabled")
     
     return startup
 
@@ -53,132 +72,29 @@ def stop_app_handler(app: FastAPI) -> Callable:
     """
     async def shutdown() -> None:
         logger.info("Running app shutdown handler.")
-        # Add cleanup tasks here
+        # Apply and ack the events already received before closing the connection
+        await consumer_supervisor.stop(timeout=settings.CONSUMER_SHUTDOWN_TIMEOUT_S)
+        # Flush the coalesced updates callers are still waiting on
+        if settings.COALESCE_HOT_PRODUCTS:
+            stock_coalescer.stop()
+        # Also closes the relay's publisher connection
+        outbox_relay.stop()
+        ledger_maintenance.stop()
+        reservation_sweeper.stop()
     
     return shutdown
 
 
-def setup_rabbitmq_consumer():
-    """
-    Setup RabbitMQ consumer to listen for product events
-    """
-    # RabbitMQ connection parameters
-    credentials = pika.PlainCredentials(
-        username=settings.RABBITMQ_USER,
-        password=settings.RABBITMQ_PASSWORD
-    )
-    parameters = pika.ConnectionParameters(
-        host=settings.RABBITMQ_HOST,
-        port=settings.RABBITMQ_PORT,
-        virtual_host=settings.RABBITMQ_VHOST,
-        credentials=credentials
-    )
-    
-    # Create connection and channel
-    connection = pika.BlockingConnection(parameters)
-    channel = connection.channel()
-    
-    # Declare exchanges and queues
-    channel.exchange_declare(
-        exchange='inventory_events',
-        exchange_type='topic',
-        durable=True
-    )
-    
-    # Product received queue
-    channel.queue_declare(queue='product_received_queue', durable=True)
-    channel.queue_bind(
-        exchange='inventory_events',
-        queue='product_received_queue',
-        routing_key=settings.PRODUCT_RECEIVED_TOPIC
-    )
-    
-    # Product sold queue
-    channel.queue_declare(queue='product_sold_queue', durable=True)
-    channel.queue_bind(
-        exchange='inventory_events',
-        queue='product_sold_queue',
-        routing_key=settings.PRODUCT_SOLD_TOPIC
-    )
-    
-    # Set up consumers
-    channel.basic_consume(
-        queue='product_received_queue',
-        on_message_callback=handle_product_received,
-        auto_ack=False
-    )
-    
-    channel.basic_consume(
-        queue='product_sold_queue',
-        on_message_callback=handle_product_sold,
-        auto_ack=False
-    )
-    
-    # Start consuming in a separate thread
-    import threading
-    thread = threading.Thread(target=channel.start_consuming)
-    thread.daemon = True
-    thread.start()
-
-
-def handle_product_received(ch, method, properties, body):
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     """
-    Handle product received event
+    FastAPI lifespan: run the startup handler, then the shutdown handler when the app stops
     """
+    await start_app_handler(app)()
     try:
-        payload = json.loads(body)
-        product_id = payload.get('product_id')
-        quantity = payload.get('quantity')
-        
-        if not product_id or not quantity:
-            logger.error("Invalid product received event payload")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-            return
-        
-        # Process the event
-        db = SessionLocal()
-        try:
-            StockService.handle_product_received_event(db, product_id, quantity)
-            logger.info(f"Product received event processed: {product_id}, quantity: {quantity}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            logger.error(f"Error processing product received event: {e}")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-        finally:
-            db.close()
-    except Exception as e:
-        logger.error(f"Error handling product received event: {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag)
-
-
-def handle_product_sold(ch, method, properties, body):
-    """
-    Handle product sold event
-    """
-    try:
-        payload = json.loads(body)
-        product_id = payload.get('product_id')
-        quantity = payload.get('quantity')
-        
-        if not product_id or not quantity:
-            logger.error("Invalid product sold event payload")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-            return
-        
-        # Process the event
-        db = SessionLocal()
-        try:
-            StockService.handle_product_sold_event(db, product_id, quantity)
-            logger.info(f"Product sold event processed: {product_id}, quantity: {quantity}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            logger.error(f"Error processing product sold event: {e}")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-        finally:
-            db.close()
-    except Exception as e:
-        logger.error(f"Error handling product sold event: {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag)
+        yield
+    finally:
+        await stop_app_handler(app)()
 
 
 # Import Base here to avoid circular imports
@@ -0,0 +1,64 @@
+import logging
+import threading
+from typing import Optional
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services.ledger_service import LedgerService
+from app.services.stock_service import StockService
+
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerMaintenance:
+    """
+    Keeps the stock movements ledger partitioned: creates the upcoming monthly
+    partitions ahead of time and drops the ones past the retention window.
+    Also purges processed event IDs past their retention window.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Run maintenance periodically in a daemon thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self) -> None:
+        while not self._stop.wait(settings.STOCK_MOVEMENTS_MAINTENANCE_INTERVAL_S):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error running ledger maintenance: {e}")
+
+    def run_once(self) -> None:
+        db = SessionLocal()
+        try:
+            LedgerService.ensure_partitions(db, settings.STOCK_MOVEMENTS_PARTITIONS_AHEAD)
+            LedgerService.drop_expired_partitions(db, settings.STOCK_MOVEMENTS_RETENTION_MONTHS)
+            deleted = StockService.purge_processed_events(
+                db, settings.PROCESSED_EVENTS_RETENTION_HOURS, settings.PROCESSED_EVENTS_PURGE_BATCH_SIZE
+            )
+            if deleted:
+                logger.info(f"Purged {deleted} processed event IDs")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+ledger_maintenance = LedgerMaintenance()
@@ -0,0 +1,47 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# Stock event consumption, labelled by the queue the events were read from
+EVENTS_CONSUMED = Counter(
+    "stock_events_consumed_total",
+    "Stock events received from a queue",
+    ["queue"]
+)
+EVENTS_REDELIVERED = Counter(
+    "stock_events_redelivered_total",
+    "Stock events received again after being requeued or left unacked on a lost connection",
+    ["queue"]
+)
+EVENTS_NACKED = Counter(
+    "stock_events_nacked_total",
+    "Stock events nacked back to their queue",
+    ["queue"]
+)
+EVENT_OUTCOMES = Counter(
+    "stock_events_processed_total",
+    "Stock events by outcome: applied, duplicate, retried or dead_lettered",
+    ["queue", "outcome"]
+)
+
+EVENT_AGE = Histogram(
+    "stock_event_age_seconds",
+    "Time from an event's publish timestamp to the commit of its stock change",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+)
+STAGE_LATENCY = Histogram(
+    "stock_event_stage_seconds",
+    "Time spent per batch (or per message for route) in each consumer stage",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+BATCH_SIZE = Histogram(
+    "stock_event_batch_size",
+    "Messages per consumer batch",
+    buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000)
+)
+
+QUEUE_DEPTH = Gauge(
+    "stock_events_queue_messages",
+    "Messages ready in a queue, read when metrics are scraped",
+    ["queue"]
+)
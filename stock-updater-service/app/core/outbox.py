@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import threading
+from typing import Coroutine, Optional
+
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.core.publisher import event_publisher
+from app.db.database import SessionLocal
+from app.models.outbox_event import OutboxEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """
+    Publishes committed outbox events to the events exchange in batches, in
+    insertion order, and deletes them once the broker has confirmed them. A
+    batch is published without waiting in between and its confirms are awaited
+    together, on an event loop owned by the relay thread.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so several service instances
+    can relay at once without publishing the same event twice in normal
+    operation. Delivery is at least once, and an unconfirmed event is retried
+    in a later batch, after newer ones: consumers order stock events by their
+    version.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        """
+        Start relaying in a daemon thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Ask the relay thread to stop after its current batch and wait for it
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                try:
+                    relayed = self.relay_batch()
+                except Exception as e:
+                    logger.error(f"Error relaying outbox events: {e}")
+                    relayed = 0
+
+                # Keep draining while there is a backlog, otherwise poll
+                if relayed < settings.OUTBOX_RELAY_BATCH_SIZE:
+                    self._stop.wait(settings.OUTBOX_RELAY_POLL_INTERVAL_MS / 1000)
+        finally:
+            self._run_async(event_publisher.close())
+            self._loop.close()
+            self._loop = None
+
+    def _run_async(self, coroutine: Coroutine):
+        """
+        Run a coroutine on the relay's event loop, created on first use
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coroutine)
+
+    def relay_batch(self) -> int:
+        """
+        Publish and delete the oldest batch of outbox events. Returns how many were published.
+        """
+        db = SessionLocal()
+        try:
+            events = db.execute(
+                select(OutboxEvent)
+                .order_by(OutboxEvent.id)
+                .limit(settings.OUTBOX_RELAY_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+
+            confirmed = []
+            if events:
+                confirmed = self._run_async(
+                    event_publisher.publish_batch([(event.routing_key, event.payload) for event in events])
+                )
+
+            # Only confirmed events are deleted; the others stay claimed until commit and are retried
+            published_ids = [event.id for event, is_confirmed in zip(events, confirmed) if is_confirmed]
+
+            if published_ids:
+                db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(published_ids)))
+            db.commit()
+
+            return len(published_ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+outbox_relay = OutboxRelay()
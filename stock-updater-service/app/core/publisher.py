@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractConnection, AbstractExchange
+from pamqp.commands import Basic
+
+from app.core.config import settings
+from app.core.consumer import connect
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventPublisher:
+    """
+    Publishes events to the events exchange over one reused connection with publisher
+    confirms. Not thread safe: use it from a single event loop.
+    """
+    
+    def __init__(self):
+        self._connection: Optional[AbstractConnection] = None
+        self._channel: Optional[AbstractChannel] = None
+        self._exchange: Optional[AbstractExchange] = None
+    
+    async def _get_exchange(self) -> AbstractExchange:
+        """Open the connection and declare the exchange on first use"""
+        if self._channel is None or self._channel.is_closed:
+            await self._close()
+            self._connection = await connect()
+            self._channel = await self._connection.channel(publisher_confirms=True)
+            self._exchange = await self._channel.declare_exchange(
+                settings.EVENTS_EXCHANGE,
+                aio_pika.ExchangeType.TOPIC,
+                durable=True
+            )
+        return self._exchange
+    
+    async def publish_batch(self, messages: List[Tuple[str, Dict[str, Any]]]) -> List[bool]:
+        """
+        Publish persistent JSON messages, given as (routing key, message) pairs, without
+        waiting for each confirm, then wait for all their confirms at once.
+        
+        Returns whether each message was confirmed by the broker; never raises.
+        """
+        if not messages:
+            return []
+        
+        try:
+            exchange = await self._get_exchange()
+        except Exception as e:
+            logger.error(f"Error connecting event publisher: {e}")
+            await self._close()
+            return [False] * len(messages)
+        
+        confirmations = await asyncio.gather(*[
+            exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(message).encode(),
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                ),
+                routing_key=routing_key,
+                timeout=settings.OUTBOX_RELAY_CONFIRM_TIMEOUT_S
+            )
+            for routing_key, message in messages
+        ], return_exceptions=True)
+        
+        confirmed = []
+        for (routing_key, _), confirmation in zip(messages, confirmations):
+            if isinstance(confirmation, Basic.Ack):
+                confirmed.append(True)
+            else:
+                logger.error(f"Error publishing {routing_key} event: {confirmation!r}")
+                confirmed.append(False)
+        return confirmed
+    
+    async def close(self) -> None:
+        """Close the underlying connection"""
+        await self._close()
+    
+    async def _close(self) -> None:
+        try:
+            if self._connection is not None and not self._connection.is_closed:
+                await self._connection.close()
+        except Exception as e:
+            logger.error(f"Error closing publisher connection: {e}")
+        finally:
+            self._connection = None
+            self._channel = None
+            self._exchange = None
+
+
+event_publisher = EventPublisher()
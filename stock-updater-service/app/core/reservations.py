@@ -0,0 +1,67 @@
+import logging
+import threading
+from typing import Optional
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services.reservation_service import ReservationService
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReservationSweeper:
+    """
+    Expires reservations past their expiry time and gives their stock back.
+
+    Each sweep reads only due reservations through the partial index on
+    expires_at for active reservations, so its cost depends on how many
+    reservations expire, not on the size of the table.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Start sweeping in a daemon thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                expired = self.sweep()
+            except Exception as e:
+                logger.error(f"Error expiring stock reservations: {e}")
+                expired = 0
+
+            # Keep going while there is a backlog of due reservations
+            if expired < settings.RESERVATION_SWEEP_BATCH_SIZE:
+                self._stop.wait(settings.RESERVATION_SWEEP_INTERVAL_MS / 1000)
+
+    def sweep(self) -> int:
+        db = SessionLocal()
+        try:
+            expired = ReservationService.expire_reservations(db, settings.RESERVATION_SWEEP_BATCH_SIZE)
+            if expired:
+                logger.info(f"Expired {expired} stock reservations")
+            return expired
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+reservation_sweeper = ReservationSweeper()
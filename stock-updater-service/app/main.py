@@ -1,10 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from app.api.routes import stock_router
+from app.api.routes import stock_router, events_router
 from app.core.config import settings
-from app.core.event_handlers import start_app_handler, stop_app_handler
+from app.core.consumer import consumer_supervisor
+from app.core.event_handlers import lifespan
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -12,6 +14,7 @@ app = FastAPI(
     version=settings.PROJECT_VERSION,
     docs_url=None,
     redoc_url=None,
+    lifespan=lifespan,
 )
 
 # Set up CORS middleware
@@ -25,10 +28,7 @@ app.add_middleware(
 
 # Include routers
 app.include_router(stock_router, prefix="/stock", tags=["stock"])
-
-# Add event handlers
-app.add_event_handler("startup", start_app_handler(app))
-app.add_event_handler("shutdown", stop_app_handler(app))
+app.include_router(events_router, prefix="/events", tags=["events"])
 
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
@@ -42,6 +42,14 @@ async def custom_swagger_ui_html():
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics, including the current depth of the stock event queues
+    """
+    await consumer_supervisor.update_queue_depths()
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
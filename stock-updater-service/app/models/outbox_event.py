@@ -0,0 +1,17 @@
+from sqlalchemy import Column, BigInteger, String, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.database import Base
+
+
+class OutboxEvent(Base):
+    """Event written in the same transaction as the change it describes, published later by the outbox relay"""
+    __tablename__ = "outbox_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    routing_key = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<OutboxEvent {self.id} {self.routing_key}>"
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, DateTime, func
+
+from app.db.database import Base
+
+
+class ProcessedEvent(Base):
+    __tablename__ = "processed_events"
+
+    event_id = Column(String, primary_key=True)
+    processed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return f"<ProcessedEvent {self.event_id}>"
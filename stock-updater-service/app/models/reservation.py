@@ -0,0 +1,23 @@
+import uuid
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index, func, text
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.database import Base
+
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        # Partial index for the expiry sweeper, which only looks at active reservations
+        Index("idx_stock_reservations_active_expires", "expires_at", postgresql_where=text("status = 'active'")),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="active")  # active, committed, released, expired
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<StockReservation {self.id} {self.status}>"
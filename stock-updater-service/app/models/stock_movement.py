@@ -0,0 +1,24 @@
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, Index, func
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.database import Base
+
+
+class StockMovement(Base):
+    """Append-only ledger of stock changes, partitioned by month on created_at"""
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("idx_stock_movements_product_created", "product_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    product_id = Column(UUID(as_uuid=True), nullable=False)
+    delta = Column(Integer, nullable=False)
+    resulting_stock = Column(Integer, nullable=False)
+    reason = Column(String)
+    event_id = Column(String)
+
+    def __repr__(self):
+        return f"<StockMovement {self.product_id} {self.delta:+d}>"
@@ -0,0 +1,25 @@
+from typing import Any, List, Optional
+from pydantic import BaseModel, Field
+
+
+class DeadLetterMessage(BaseModel):
+    event_type: Optional[str] = None
+    message_id: Optional[str] = None
+    retry_count: int = 0
+    error: Optional[str] = Field(default=None, description="Last error processing the event")
+    source_queue: Optional[str] = None
+    body: Any = Field(description="Decoded JSON or MessagePack body, or the raw text if it can't be decoded")
+
+
+class DeadLetterListResponse(BaseModel):
+    total: int = Field(description="Number of messages in the dead-letter queue")
+    messages: List[DeadLetterMessage]
+
+
+class DeadLetterReplayRequest(BaseModel):
+    limit: int = Field(default=100, ge=1, description="Maximum number of messages to replay")
+
+
+class DeadLetterReplayResponse(BaseModel):
+    replayed: int
+    remaining: int
@@ -0,0 +1,79 @@
+from typing import Annotated, Any, Dict, Optional, Type
+from uuid import UUID
+
+import msgspec
+
+from app.core.config import settings
+
+
+# Content types decoded as MessagePack; anything else is read as JSON
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+EventId = Annotated[str, msgspec.Meta(min_length=1)]
+Quantity = Annotated[int, msgspec.Meta(ge=0)]
+
+
+class ProductStockEvent(msgspec.Struct, frozen=True):
+    event_id: EventId
+    product_id: UUID
+    quantity: Quantity
+
+
+# Each schema version is tagged with its schema_version; messages without
+# one are read as the only version a topic has. A new version gets its own
+# struct and the topic decodes a Union of them.
+class ProductReceivedV1(ProductStockEvent, tag_field="schema_version", tag=1):
+    pass
+
+
+class ProductSoldV1(ProductStockEvent, tag_field="schema_version", tag=1):
+    pass
+
+
+EVENT_SCHEMAS: Dict[str, Type[msgspec.Struct]] = {
+    settings.PRODUCT_RECEIVED_TOPIC: ProductReceivedV1,
+    settings.PRODUCT_SOLD_TOPIC: ProductSoldV1,
+}
+
+
+class EventKey(msgspec.Struct):
+    """
+    Just the product ID of an event, for routing without decoding the rest
+    """
+    product_id: Optional[str] = None
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return content_type in MSGPACK_CONTENT_TYPES
+
+
+# Decoders are built once per schema and format
+_json_decoders = {topic: msgspec.json.Decoder(schema) for topic, schema in EVENT_SCHEMAS.items()}
+_msgpack_decoders = {topic: msgspec.msgpack.Decoder(schema) for topic, schema in EVENT_SCHEMAS.items()}
+_json_key_decoder = msgspec.json.Decoder(EventKey)
+_msgpack_key_decoder = msgspec.msgpack.Decoder(EventKey)
+
+
+def decode_event(event_type: str, body: bytes, content_type: Optional[str] = None) -> msgspec.Struct:
+    """
+    Decode and validate an event body against the schema of its topic.
+
+    Raises KeyError for an unknown topic and msgspec.DecodeError (or its
+    subclass ValidationError) for a body that doesn't match the schema.
+    """
+    decoders = _msgpack_decoders if is_msgpack(content_type) else _json_decoders
+    return decoders[event_type].decode(body)
+
+
+def decode_event_key(body: bytes, content_type: Optional[str] = None) -> EventKey:
+    decoder = _msgpack_key_decoder if is_msgpack(content_type) else _json_key_decoder
+    return decoder.decode(body)
+
+
+def decode_untyped(body: bytes, content_type: Optional[str] = None) -> Any:
+    """
+    Decode a body without a schema, e.g. to show it
+    """
+    if is_msgpack(content_type):
+        return msgspec.msgpack.decode(body)
+    return msgspec.json.decode(body)
@@ -1,5 +1,5 @@
 from uuid import UUID
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -28,6 +28,38 @@ class StockUpdate(BaseModel):
 
 class ProductResponse(ProductBase):
     id: UUID
+    version: int = Field(description="Bumped on every stock change; send it in If-Match for conditional updates")
 
     class Config:
         from_attributes = True
+
+
+class BulkStockUpdateItem(StockUpdate):
+    product_id: UUID
+
+
+class StockEvent(BulkStockUpdateItem):
+    event_id: str = Field(min_length=1, description="Unique ID of the event the change comes from")
+
+
+class BulkStockUpdateRequest(BaseModel):
+    items: List[BulkStockUpdateItem] = Field(min_length=1)
+    mode: Literal["all_or_nothing", "best_effort"] = Field(
+        default="all_or_nothing",
+        description="all_or_nothing rolls back every item if one fails; best_effort commits the items that succeed"
+    )
+
+
+class BulkStockUpdateItemResult(BaseModel):
+    product_id: UUID
+    quantity: int
+    status: str = Field(description="Outcome of the item: 'applied', 'not_found', 'insufficient_stock', 'rolled_back'")
+    stock: Optional[int] = Field(default=None, description="Product stock after the update, if applied")
+    error: Optional[str] = None
+
+
+class BulkStockUpdateResponse(BaseModel):
+    committed: bool
+    applied: int
+    failed: int
+    results: List[BulkStockUpdateItemResult]
@@ -0,0 +1,20 @@
+from uuid import UUID
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class ReservationCreate(BaseModel):
+    product_id: UUID
+    quantity: int = Field(gt=0)
+    ttl_seconds: Optional[int] = Field(default=None, ge=1, description="Seconds until the reservation expires")
+
+
+class ReservationResponse(BaseModel):
+    id: UUID
+    product_id: UUID
+    quantity: int
+    status: str = Field(description="Status of the reservation: 'active', 'committed', 'released', 'expired'")
+    expires_at: datetime
+    stock: int = Field(description="Product stock on hand after the operation")
+    available_stock: int = Field(description="Product stock on hand minus active reservations after the operation")
@@ -0,0 +1,125 @@
+import logging
+
+import msgspec
+import pika
+
+from app.core.config import settings
+from app.core.consumer import (
+    event_product_id,
+    partition_for,
+    partition_queue,
+    retry_count,
+)
+from app.schemas.dead_letter import DeadLetterListResponse, DeadLetterMessage, DeadLetterReplayResponse
+from app.schemas.events import decode_untyped
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_connection_parameters() -> pika.ConnectionParameters:
+    """
+    RabbitMQ connection parameters
+    """
+    credentials = pika.PlainCredentials(
+        username=settings.RABBITMQ_USER,
+        password=settings.RABBITMQ_PASSWORD
+    )
+    return pika.ConnectionParameters(
+        host=settings.RABBITMQ_HOST,
+        port=settings.RABBITMQ_PORT,
+        virtual_host=settings.RABBITMQ_VHOST,
+        credentials=credentials
+    )
+
+
+# Headers added while the event was failing, dropped when it is replayed
+FAILURE_HEADERS = ('x-retry-count', 'x-last-error', 'x-source-queue')
+
+
+def _to_dead_letter_message(properties, body: bytes) -> DeadLetterMessage:
+    headers = properties.headers or {}
+    try:
+        decoded = decode_untyped(body, properties.content_type)
+    except msgspec.DecodeError:
+        decoded = body.decode(errors="replace")
+    
+    return DeadLetterMessage(
+        event_type=headers.get('event_type'),
+        message_id=properties.message_id,
+        retry_count=retry_count(properties),
+        error=headers.get('x-last-error'),
+        source_queue=headers.get('x-source-queue'),
+        body=decoded
+    )
+
+
+class DeadLetterService:
+    @staticmethod
+    def list_messages(limit: int) -> DeadLetterListResponse:
+        """
+        Peek at up to limit messages at the head of the dead-letter queue, leaving them in place
+        """
+        connection = pika.BlockingConnection(get_connection_parameters())
+        try:
+            channel = connection.channel()
+            total = channel.queue_declare(queue=settings.DEAD_LETTER_QUEUE, durable=True).method.message_count
+            
+            messages = []
+            for _ in range(min(limit, total)):
+                method, properties, body = channel.basic_get(queue=settings.DEAD_LETTER_QUEUE, auto_ack=False)
+                if method is None:
+                    break
+                messages.append(_to_dead_letter_message(properties, body))
+        finally:
+            # Unacked messages go back to the queue when the connection closes
+            connection.close()
+        
+        return DeadLetterListResponse(total=total, messages=messages)
+    
+    @staticmethod
+    def replay(limit: int) -> DeadLetterReplayResponse:
+        """
+        Move up to limit messages from the dead-letter queue back to the partition
+        queue of their product, with their retry count reset
+        """
+        connection = pika.BlockingConnection(get_connection_parameters())
+        try:
+            channel = connection.channel()
+            channel.queue_declare(queue=settings.DEAD_LETTER_QUEUE, durable=True)
+            channel.confirm_delivery()
+            
+            replayed = 0
+            while replayed < limit:
+                method, properties, body = channel.basic_get(queue=settings.DEAD_LETTER_QUEUE, auto_ack=False)
+                if method is None:
+                    break
+                
+                headers = {
+                    key: value for key, value in (properties.headers or {}).items()
+                    if key not in FAILURE_HEADERS
+                }
+                partition = partition_for(event_product_id(body, properties.content_type), settings.CONSUMER_WORKERS)
+                channel.basic_publish(
+                    exchange=settings.STOCK_EVENTS_PARTITION_EXCHANGE,
+                    routing_key=partition_queue(partition),
+                    body=body,
+                    properties=pika.BasicProperties(
+                        content_type=properties.content_type,
+                        message_id=properties.message_id,
+                        timestamp=properties.timestamp,
+                        headers=headers,
+                        delivery_mode=2
+                    ),
+                    mandatory=True
+                )
+                # Only drop the dead-lettered copy once the broker has confirmed the replay
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+                replayed += 1
+            
+            remaining = channel.queue_declare(queue=settings.DEAD_LETTER_QUEUE, durable=True).method.message_count
+        finally:
+            connection.close()
+        
+        logger.info(f"Replayed {replayed} dead-lettered events, {remaining} remaining")
+        return DeadLetterReplayResponse(replayed=replayed, remaining=remaining)
@@ -0,0 +1,109 @@
+import io
+import logging
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models.stock_movement import StockMovement
+
+
+logger = logging.getLogger(__name__)
+
+COPY_COLUMNS = ("product_id", "delta", "resulting_stock", "reason", "event_id")
+
+
+def _copy_value(value) -> str:
+    """Format a value for COPY ... FROM STDIN text format"""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _month_start(day: date, months: int = 0) -> date:
+    """First day of the month `months` months after day's month"""
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"stock_movements_{month.year:04d}_{month.month:02d}"
+
+
+class LedgerService:
+    @staticmethod
+    def record_movements(db: Session, movements: List[StockMovement]) -> None:
+        """
+        Append stock movements to the ledger with a single COPY, inside the session's
+        current transaction so they commit or roll back with the stock change
+        """
+        if not movements:
+            return
+        
+        buffer = io.StringIO()
+        for movement in movements:
+            buffer.write("\t".join(_copy_value(getattr(movement, name)) for name in COPY_COLUMNS))
+            buffer.write("\n")
+        buffer.seek(0)
+        
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY stock_movements ({', '.join(COPY_COLUMNS)}) FROM STDIN",
+                buffer
+            )
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def ensure_partitions(db: Session, months_ahead: int, today: Optional[date] = None) -> List[str]:
+        """
+        Create the monthly partitions from the current month to months_ahead months
+        from now if they don't exist yet. Returns the partition names.
+        """
+        today = today or datetime.utcnow().date()
+        
+        names = []
+        for offset in range(months_ahead + 1):
+            start = _month_start(today, offset)
+            end = _month_start(today, offset + 1)
+            name = partition_name(start)
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF stock_movements "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            names.append(name)
+        
+        db.commit()
+        return names
+    
+    @staticmethod
+    def drop_expired_partitions(db: Session, retention_months: int, today: Optional[date] = None) -> List[str]:
+        """
+        Drop the monthly partitions that end before the retention window. Returns the dropped partition names.
+        """
+        today = today or datetime.utcnow().date()
+        oldest_kept = partition_name(_month_start(today, -retention_months))
+        
+        rows = db.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'stock_movements'"
+        )).all()
+        
+        # Partition names sort chronologically
+        expired = sorted(row.relname for row in rows if row.relname < oldest_kept)
+        for name in expired:
+            db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            logger.info(f"Dropped stock movements partition {name}")
+        
+        db.commit()
+        return expired
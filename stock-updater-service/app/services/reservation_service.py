@@ -0,0 +1,237 @@
+import uuid
+from uuid import UUID
+from typing import Dict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Integer, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.models.product import Product
+from app.models.reservation import StockReservation
+from app.models.stock_movement import StockMovement
+from app.schemas.product import StockUpdate
+from app.schemas.reservation import ReservationCreate, ReservationResponse
+from app.services.ledger_service import LedgerService
+from app.services.stock_service import StockService
+
+
+def _to_reservation_response(reservation, status: str, product) -> ReservationResponse:
+    return ReservationResponse(
+        id=reservation.id,
+        product_id=reservation.product_id,
+        quantity=reservation.quantity,
+        status=status,
+        expires_at=reservation.expires_at,
+        stock=product.stock,
+        available_stock=product.stock - product.reserved_stock
+    )
+
+
+class ReservationService:
+    @staticmethod
+    def reserve(db: Session, reservation_create: ReservationCreate) -> ReservationResponse:
+        """
+        Hold stock for a product until the reservation is committed, released or expires
+        """
+        ttl_seconds = reservation_create.ttl_seconds or settings.RESERVATION_DEFAULT_TTL_S
+        if ttl_seconds > settings.RESERVATION_MAX_TTL_S:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Reservation TTL too long, maximum is {settings.RESERVATION_MAX_TTL_S} seconds"
+            )
+        
+        quantity = reservation_create.quantity
+        product = db.execute(
+            update(Product)
+            .where(
+                Product.id == reservation_create.product_id,
+                Product.stock - Product.reserved_stock >= quantity
+            )
+            .values(reserved_stock=Product.reserved_stock + quantity, version=Product.version + 1)
+            .returning(Product.id, Product.stock, Product.reserved_stock, Product.version)
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        if not product:
+            db.rollback()
+            current = db.query(Product.stock, Product.reserved_stock).filter(
+                Product.id == reservation_create.product_id
+            ).first()
+            if not current:
+                raise HTTPException(status_code=404, detail="Product not found")
+            raise HTTPException(
+                status_code=409,
+                detail=f"Insufficient available stock. Available: {current.stock - current.reserved_stock}, Requested: {quantity}"
+            )
+        
+        reservation = StockReservation(
+            id=uuid.uuid4(),
+            product_id=reservation_create.product_id,
+            quantity=quantity,
+            status="active",
+            expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        )
+        db.add(reservation)
+        StockService._add_stock_updated_event(db, product, product.stock, StockUpdate(quantity=0, reason="Stock reserved"))
+        db.commit()
+        
+        return _to_reservation_response(reservation, "active", product)
+    
+    @staticmethod
+    def commit(db: Session, reservation_id: UUID) -> ReservationResponse:
+        """
+        Turn an active reservation into a sale: remove its quantity from both the stock and the reserved stock
+        """
+        reservation = ReservationService._close(db, reservation_id, "committed")
+        
+        # Guarded like update_stock, in case the stock was changed outside the reservation
+        product = db.execute(
+            update(Product)
+            .where(
+                Product.id == reservation.product_id,
+                Product.stock >= reservation.quantity,
+                Product.reserved_stock >= reservation.quantity
+            )
+            .values(
+                stock=Product.stock - reservation.quantity,
+                reserved_stock=Product.reserved_stock - reservation.quantity,
+                version=Product.version + 1
+            )
+            .returning(Product.id, Product.stock, Product.reserved_stock, Product.version)
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        if not product:
+            # Nothing was updated, the reservation stays active
+            db.rollback()
+            current = db.query(Product.stock, Product.reserved_stock).filter(Product.id == reservation.product_id).first()
+            if not current:
+                raise HTTPException(status_code=404, detail="Product not found")
+            if current.stock < reservation.quantity:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Cannot reduce stock below zero. Current stock: {current.stock}, Requested reduction: {reservation.quantity}"
+                )
+            raise HTTPException(
+                status_code=400,
+                detail=f"Cannot reduce reserved stock below zero. Reserved: {current.reserved_stock}, Requested reduction: {reservation.quantity}"
+            )
+        
+        stock_update = StockUpdate(quantity=-reservation.quantity, reason="Reservation committed")
+        LedgerService.record_movements(db, [StockMovement(
+            product_id=product.id,
+            delta=stock_update.quantity,
+            resulting_stock=product.stock,
+            reason=stock_update.reason
+        )])
+        StockService._add_stock_updated_event(db, product, product.stock + reservation.quantity, stock_update)
+        db.commit()
+        
+        return _to_reservation_response(reservation, "committed", product)
+    
+    @staticmethod
+    def release(db: Session, reservation_id: UUID) -> ReservationResponse:
+        """
+        Give the stock held by an active reservation back
+        """
+        reservation = ReservationService._close(db, reservation_id, "released")
+        
+        product = db.execute(
+            update(Product)
+            .where(Product.id == reservation.product_id)
+            .values(reserved_stock=Product.reserved_stock - reservation.quantity, version=Product.version + 1)
+            .returning(Product.id, Product.stock, Product.reserved_stock, Product.version)
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        StockService._add_stock_updated_event(db, product, product.stock, StockUpdate(quantity=0, reason="Reservation released"))
+        db.commit()
+        
+        return _to_reservation_response(reservation, "released", product)
+    
+    @staticmethod
+    def expire_reservations(db: Session, limit: int) -> int:
+        """
+        Expire up to limit active reservations past their expiry, oldest first, and
+        give their stock back. Returns how many reservations were expired.
+        """
+        # Served by the partial expiry index; SKIP LOCKED leaves rows being committed/released alone
+        due = (
+            select(StockReservation.id)
+            .where(StockReservation.status == "active", StockReservation.expires_at <= func.now())
+            .order_by(StockReservation.expires_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        expired = db.execute(
+            update(StockReservation)
+            .where(StockReservation.id.in_(due))
+            .values(status="expired")
+            .returning(StockReservation.product_id, StockReservation.quantity)
+            .execution_options(synchronize_session=False)
+        ).all()
+        
+        if not expired:
+            db.commit()
+            return 0
+        
+        released: Dict[UUID, int] = {}
+        for reservation in expired:
+            released[reservation.product_id] = released.get(reservation.product_id, 0) + reservation.quantity
+        
+        StockService.lock_products(db, list(released))
+        
+        released_values = values(
+            column("product_id", PG_UUID(as_uuid=True)),
+            column("quantity", Integer),
+            name="released"
+        ).data(list(released.items()))
+        
+        products = db.execute(
+            update(Product)
+            .where(Product.id == released_values.c.product_id)
+            .values(reserved_stock=Product.reserved_stock - released_values.c.quantity, version=Product.version + 1)
+            .returning(Product.id, Product.stock, Product.reserved_stock, Product.version)
+            .execution_options(synchronize_session=False)
+        ).all()
+        
+        for product in products:
+            StockService._add_stock_updated_event(db, product, product.stock, StockUpdate(quantity=0, reason="Reservation expired"))
+        db.commit()
+        
+        return len(expired)
+    
+    @staticmethod
+    def _close(db: Session, reservation_id: UUID, status: str):
+        """
+        Move an active, unexpired reservation to its final status. Does not commit.
+        """
+        reservation = db.execute(
+            update(StockReservation)
+            .where(
+                StockReservation.id == reservation_id,
+                StockReservation.status == "active",
+                StockReservation.expires_at > func.now()
+            )
+            .values(status=status)
+            .returning(
+                StockReservation.id,
+                StockReservation.product_id,
+                StockReservation.quantity,
+                StockReservation.expires_at
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        if not reservation:
+            db.rollback()
+            current = db.query(StockReservation.status).filter(StockReservation.id == reservation_id).first()
+            if not current:
+                raise HTTPException(status_code=404, detail="Reservation not found")
+            # Still active means it expired and the sweeper hasn't got to it yet
+            current_status = "expired" if current.status == "active" else current.status
+            raise HTTPException(status_code=409, detail=f"Reservation is {current_status}")
+        
+        return reservation
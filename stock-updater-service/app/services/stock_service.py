@@ -1,39 +1,426 @@
 from uuid import UUID
-from typing import Optional, List
+from typing import Dict, Optional, List, Set, Tuple, Union
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Integer, column, delete, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, insert
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 
+from app.core.config import settings
+from app.models.outbox_event import OutboxEvent
+from app.models.processed_event import ProcessedEvent
 from app.models.product import Product
-from app.schemas.product import StockUpdate
+from app.models.stock_movement import StockMovement
+from app.schemas.product import (
+    StockUpdate,
+    StockEvent,
+    BulkStockUpdateRequest,
+    BulkStockUpdateResponse,
+    BulkStockUpdateItemResult,
+)
+from app.services.ledger_service import LedgerService
+
+
+def _ledger_movements(changes: List[StockUpdate], updated: Dict[UUID, object], deltas: Dict[UUID, int]) -> List[StockMovement]:
+    """
+    Ledger movements for changes applied netted per product, with the stock
+    each change left in the order the changes were given
+    """
+    running = {product_id: row.stock - deltas[product_id] for product_id, row in updated.items()}
+    
+    movements = []
+    for change in changes:
+        if change.product_id not in running:
+            continue
+        running[change.product_id] += change.quantity
+        movements.append(StockMovement(
+            product_id=change.product_id,
+            delta=change.quantity,
+            resulting_stock=running[change.product_id],
+            reason=change.reason,
+            event_id=getattr(change, "event_id", None)
+        ))
+    return movements
 
 
 class StockService:
     @staticmethod
-    def update_stock(db: Session, product_id: UUID, stock_update: StockUpdate) -> Product:
+    def update_stock(
+        db: Session,
+        product_id: UUID,
+        stock_update: StockUpdate,
+        event_id: Optional[str] = None,
+        expected_versions: Optional[List[int]] = None
+    ) -> Product:
         """
-        Update product stock by adding or removing quantity
+        Update product stock by adding or removing quantity.
+        When event_id is given, it is recorded as processed in the same transaction.
+        When expected_versions is given, the update only applies if the product is still
+        at one of those versions (412 otherwise).
         """
-        product = db.query(Product).filter(Product.id == product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
+        if event_id is not None and not StockService.record_processed_events(db, [event_id]):
+            db.rollback()
+            raise HTTPException(status_code=409, detail=f"Event already processed: {event_id}")
+        
+        # Apply the change in one conditional statement, so concurrent updates can't be lost
+        # and the stock check and the write happen atomically. Reserved stock can't be removed.
+        statement = update(Product).where(
+            Product.id == product_id,
+            Product.stock + stock_update.quantity >= Product.reserved_stock
+        )
+        if expected_versions is not None:
+            statement = statement.where(Product.version.in_(expected_versions))
         
-        # Calculate new stock level
-        new_stock = product.stock + stock_update.quantity
+        product = db.execute(
+            statement
+            .values(stock=Product.stock + stock_update.quantity, version=Product.version + 1)
+            .returning(Product)
+            .execution_options(synchronize_session=False)
+        ).scalars().first()
         
-        # Ensure stock doesn't go negative
-        if new_stock < 0:
+        if not product:
+            # Nothing was updated: the product doesn't exist, has changed or the stock is insufficient
+            db.rollback()
+            current = db.query(Product.stock, Product.reserved_stock, Product.version).filter(Product.id == product_id).first()
+            if not current:
+                raise HTTPException(status_code=404, detail="Product not found")
+            if expected_versions is not None and current.version not in expected_versions:
+                expected = ", ".join(str(version) for version in expected_versions) or "none"
+                raise HTTPException(
+                    status_code=412,
+                    detail=f"Product has been modified. Current version: {current.version}, Expected: {expected}"
+                )
+            if current.stock + stock_update.quantity >= 0:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Cannot reduce stock below reserved stock. Current stock: {current.stock}, Reserved: {current.reserved_stock}, Requested reduction: {abs(stock_update.quantity)}"
+                )
             raise HTTPException(
                 status_code=400, 
-                detail=f"Cannot reduce stock below zero. Current stock: {product.stock}, Requested reduction: {abs(stock_update.quantity)}"
+                detail=f"Cannot reduce stock below zero. Current stock: {current.stock}, Requested reduction: {abs(stock_update.quantity)}"
             )
         
-        # Update stock
-        product.stock = new_stock
+        # Keep the values returned by the UPDATE instead of reloading them after the commit
+        db.expunge(product)
+        
+        LedgerService.record_movements(db, [StockMovement(
+            product_id=product.id,
+            delta=stock_update.quantity,
+            resulting_stock=product.stock,
+            reason=stock_update.reason,
+            event_id=event_id
+        )])
+        
+        # Let readers (stock-checker cache) know about the new level, once committed
+        previous_stock = product.stock - stock_update.quantity
+        StockService._add_stock_updated_event(db, product, previous_stock, stock_update)
         db.commit()
-        db.refresh(product)
         
         return product
     
+    @staticmethod
+    def record_processed_events(db: Session, event_ids: List[str]) -> Set[str]:
+        """
+        Record event IDs as processed, skipping the ones already recorded. Does not commit.
+        
+        Returns the IDs that were not processed before.
+        """
+        if not event_ids:
+            return set()
+        
+        rows = db.execute(
+            insert(ProcessedEvent)
+            .values([{"event_id": event_id} for event_id in dict.fromkeys(event_ids)])
+            .on_conflict_do_nothing(index_elements=[ProcessedEvent.event_id])
+            .returning(ProcessedEvent.event_id)
+        ).all()
+        
+        return {row.event_id for row in rows}
+    
+    @staticmethod
+    def purge_processed_events(db: Session, retention_hours: int, batch_size: int) -> int:
+        """
+        Delete processed event IDs recorded more than retention_hours ago, batch_size rows
+        per transaction so the purge never holds many row locks at once
+        
+        Returns the number of IDs deleted.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=retention_hours)
+        deleted = 0
+        while True:
+            expired = (
+                select(ProcessedEvent.event_id)
+                .where(ProcessedEvent.processed_at < cutoff)
+                .limit(batch_size)
+            )
+            count = db.execute(delete(ProcessedEvent).where(ProcessedEvent.event_id.in_(expired))).rowcount
+            db.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+    
+    @staticmethod
+    def lock_products(db: Session, product_ids: List[UUID]) -> List[UUID]:
+        """
+        Lock the rows of the given products in product ID order. Does not commit.
+        
+        A multi-row UPDATE locks its rows in whatever order the plan visits them, so two
+        of them sharing products can deadlock; taking the locks in one fixed order first
+        makes concurrent batches wait for each other instead.
+        
+        Returns the IDs of the products found.
+        """
+        return db.execute(
+            select(Product.id)
+            .where(Product.id.in_(product_ids))
+            .order_by(Product.id)
+            .with_for_update()
+        ).scalars().all()
+    
+    @staticmethod
+    def apply_stock_deltas(db: Session, deltas: Dict[UUID, int]) -> Dict[UUID, object]:
+        """
+        Add a net delta to each product's stock with one set-based UPDATE, skipping
+        products whose stock would go below their reserved stock. Does not commit.
+        
+        Returns the updated rows (id, stock, reserved_stock, version) by product ID; products
+        missing from the result were not found or had insufficient stock.
+        """
+        if not deltas:
+            return {}
+        
+        StockService.lock_products(db, list(deltas))
+        
+        delta_values = values(
+            column("product_id", PG_UUID(as_uuid=True)),
+            column("delta", Integer),
+            name="deltas"
+        ).data(list(deltas.items()))
+        
+        rows = db.execute(
+            update(Product)
+            .where(
+                Product.id == delta_values.c.product_id,
+                Product.stock + delta_values.c.delta >= Product.reserved_stock
+            )
+            .values(stock=Product.stock + delta_values.c.delta, version=Product.version + 1)
+            .returning(Product.id, Product.stock, Product.reserved_stock, Product.version)
+            .execution_options(synchronize_session=False)
+        ).all()
+        
+        return {row.id: row for row in rows}
+    
+    @staticmethod
+    def bulk_update_stock(db: Session, bulk_update: BulkStockUpdateRequest) -> BulkStockUpdateResponse:
+        """
+        Apply many stock adjustments in one transaction. Items for the same product
+        are netted and succeed or fail together.
+        """
+        deltas: Dict[UUID, int] = {}
+        for item in bulk_update.items:
+            deltas[item.product_id] = deltas.get(item.product_id, 0) + item.quantity
+        
+        updated = StockService.apply_stock_deltas(db, deltas)
+        
+        # Tell missing products apart from insufficient stock, and name the limit that was hit
+        failed_ids = [product_id for product_id in deltas if product_id not in updated]
+        stock_errors: Dict[UUID, str] = {}
+        if failed_ids:
+            for row in db.query(Product.id, Product.stock, Product.reserved_stock).filter(Product.id.in_(failed_ids)).all():
+                if row.stock + deltas[row.id] >= 0:
+                    stock_errors[row.id] = (
+                        f"Cannot reduce stock below reserved stock. Current stock: {row.stock}, "
+                        f"Reserved: {row.reserved_stock}, Requested change: {deltas[row.id]}"
+                    )
+                else:
+                    stock_errors[row.id] = (
+                        f"Cannot reduce stock below zero. Current stock: {row.stock}, "
+                        f"Requested change: {deltas[row.id]}"
+                    )
+        
+        committed = not failed_ids or bulk_update.mode == "best_effort"
+        if committed:
+            LedgerService.record_movements(db, _ledger_movements(bulk_update.items, updated, deltas))
+            for product_id, row in updated.items():
+                stock_update = StockUpdate(quantity=deltas[product_id], reason="Bulk stock adjustment")
+                StockService._add_stock_updated_event(db, row, row.stock - deltas[product_id], stock_update)
+            db.commit()
+        else:
+            db.rollback()
+        
+        results = []
+        for item in bulk_update.items:
+            if item.product_id in updated:
+                if committed:
+                    results.append(BulkStockUpdateItemResult(
+                        product_id=item.product_id,
+                        quantity=item.quantity,
+                        status="applied",
+                        stock=updated[item.product_id].stock
+                    ))
+                else:
+                    results.append(BulkStockUpdateItemResult(
+                        product_id=item.product_id,
+                        quantity=item.quantity,
+                        status="rolled_back",
+                        error="Another item in the request failed"
+                    ))
+            elif item.product_id in stock_errors:
+                results.append(BulkStockUpdateItemResult(
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                    status="insufficient_stock",
+                    error=stock_errors[item.product_id]
+                ))
+            else:
+                results.append(BulkStockUpdateItemResult(
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                    status="not_found",
+                    error="Product not found"
+                ))
+        
+        applied = sum(1 for result in results if result.status == "applied")
+        return BulkStockUpdateResponse(
+            committed=committed,
+            applied=applied,
+            failed=len(results) - applied,
+            results=results
+        )
+    
+    @staticmethod
+    def apply_stock_changes(db: Session, changes: List[StockEvent]) -> List[Optional[HTTPException]]:
+        """
+        Apply stock changes coming from events in one transaction, netted per product.
+        
+        Each event is recorded in processed_events in the same transaction as its
+        change, and events already recorded are skipped, so redelivered events are
+        applied only once. Products whose net change can't be applied fall back to
+        applying their changes one by one in order, so only the changes that really
+        fail are reported. Returns, for each change, None if it was applied (or
+        already had been) or the error.
+        """
+        new_ids = StockService.record_processed_events(db, [change.event_id for change in changes])
+        
+        # Only the first delivery of a new event ID is applied
+        pending = []
+        for index, change in enumerate(changes):
+            if change.event_id in new_ids:
+                new_ids.discard(change.event_id)
+                pending.append((index, change))
+        
+        deltas: Dict[UUID, int] = {}
+        for _, change in pending:
+            deltas[change.product_id] = deltas.get(change.product_id, 0) + change.quantity
+        
+        updated = StockService.apply_stock_deltas(db, deltas)
+        
+        # Events replayed one by one below are recorded again together with their own change
+        retry_ids = [change.event_id for _, change in pending if change.product_id not in updated]
+        if retry_ids:
+            db.execute(delete(ProcessedEvent).where(ProcessedEvent.event_id.in_(retry_ids)))
+        
+        LedgerService.record_movements(db, _ledger_movements([change for _, change in pending], updated, deltas))
+        for product_id, row in updated.items():
+            stock_update = StockUpdate(quantity=deltas[product_id], reason="Stock events batch")
+            StockService._add_stock_updated_event(db, row, row.stock - deltas[product_id], stock_update)
+        db.commit()
+        
+        errors: List[Optional[HTTPException]] = [None] * len(changes)
+        for index, change in pending:
+            if change.product_id in updated:
+                continue
+            try:
+                StockService.update_stock(db, change.product_id, change, event_id=change.event_id)
+            except HTTPException as e:
+                if e.status_code != 409:
+                    errors[index] = e
+        
+        return errors
+    
+    @staticmethod
+    def apply_coalesced_updates(
+        db: Session,
+        updates: List[Tuple[UUID, StockUpdate]]
+    ) -> List[Union[Product, HTTPException]]:
+        """
+        Apply many concurrent stock updates with one UPDATE per product, in one transaction.
+        
+        The products are locked first, in product ID order (see lock_products), so each
+        update can be accepted or rejected on its own: additions are applied before removals, and a removal is rejected when it
+        would take the stock below the reserved stock. Returns, for each update, the
+        product after the whole flush or the error.
+        """
+        product_ids = list(dict.fromkeys(product_id for product_id, _ in updates))
+        current = {
+            row.id: row for row in db.execute(
+                select(Product.id, Product.stock, Product.reserved_stock)
+                .where(Product.id.in_(product_ids))
+                .order_by(Product.id)
+                .with_for_update()
+            ).all()
+        }
+        
+        results: List[Union[Product, HTTPException, None]] = [None] * len(updates)
+        running = {product_id: row.stock for product_id, row in current.items()}
+        deltas: Dict[UUID, int] = {}
+        movements = []
+        
+        # Additions first, so every removal the final stock can cover is accepted
+        for index in sorted(range(len(updates)), key=lambda i: updates[i][1].quantity < 0):
+            product_id, stock_update = updates[index]
+            if product_id not in current:
+                results[index] = HTTPException(status_code=404, detail="Product not found")
+                continue
+            
+            new_stock = running[product_id] + stock_update.quantity
+            if new_stock < current[product_id].reserved_stock:
+                limit = "zero" if new_stock < 0 else "reserved stock"
+                results[index] = HTTPException(
+                    status_code=400,
+                    detail=f"Cannot reduce stock below {limit}. Current stock: {running[product_id]}, Requested reduction: {abs(stock_update.quantity)}"
+                )
+                continue
+            
+            running[product_id] = new_stock
+            deltas[product_id] = deltas.get(product_id, 0) + stock_update.quantity
+            movements.append(StockMovement(
+                product_id=product_id,
+                delta=stock_update.quantity,
+                resulting_stock=new_stock,
+                reason=stock_update.reason
+            ))
+        
+        products = {}
+        if deltas:
+            delta_values = values(
+                column("product_id", PG_UUID(as_uuid=True)),
+                column("delta", Integer),
+                name="deltas"
+            ).data(list(deltas.items()))
+            
+            products = {
+                product.id: product for product in db.execute(
+                    update(Product)
+                    .where(Product.id == delta_values.c.product_id)
+                    .values(stock=Product.stock + delta_values.c.delta, version=Product.version + 1)
+                    .returning(Product)
+                    .execution_options(synchronize_session=False)
+                ).scalars().all()
+            }
+            
+            LedgerService.record_movements(db, movements)
+            for product_id, product in products.items():
+                db.expunge(product)
+                stock_update = StockUpdate(quantity=deltas[product_id], reason="Coalesced stock updates")
+                StockService._add_stock_updated_event(db, product, product.stock - deltas[product_id], stock_update)
+        db.commit()
+        
+        return [
+            result if result is not None else products[updates[index][0]]
+            for index, result in enumerate(results)
+        ]
+    
     @staticmethod
     def handle_product_received_event(db: Session, product_id: UUID, quantity: int) -> Product:
         """
@@ -49,3 +436,22 @@ class StockService:
         """
         stock_update = StockUpdate(quantity=-quantity, reason="Product sold")
         return StockService.update_stock(db, product_id, stock_update)
+    
+    @staticmethod
+    def _add_stock_updated_event(db: Session, product: Product, previous_stock: int, stock_update: StockUpdate) -> None:
+        """
+        Add a stock updated event to the outbox, to be published once the current transaction commits
+        """
+        message = {
+            "event_type": "stock_updated",
+            "product_id": str(product.id),
+            "previous_stock": previous_stock,
+            "new_stock": product.stock,
+            "reserved_stock": product.reserved_stock,
+            "change_amount": stock_update.quantity,
+            "reason": stock_update.reason,
+            "version": product.version,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        
+        db.add(OutboxEvent(routing_key=settings.STOCK_UPDATED_TOPIC, payload=message))
@@ -0,0 +1,86 @@
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.coalescer import HotProductDetector, StockWriteCoalescer
+from app.schemas.product import StockUpdate
+
+
+class TestHotProductDetector:
+    def test_product_becomes_hot_at_threshold(self):
+        detector = HotProductDetector(threshold_per_s=3, hot_ttl_s=10)
+        product_id = uuid.uuid4()
+        
+        # Assertions
+        assert [detector.record(product_id) for _ in range(4)] == [False, False, True, True]
+        assert detector.record(uuid.uuid4()) is False
+    
+    def test_product_cools_down_after_ttl(self):
+        detector = HotProductDetector(threshold_per_s=2, hot_ttl_s=10)
+        product_id = uuid.uuid4()
+        
+        with patch('app.core.coalescer.time.monotonic', return_value=100.0):
+            detector.record(product_id)
+            assert detector.record(product_id) is True
+        # A single update in a later window does not reach the threshold again
+        with patch('app.core.coalescer.time.monotonic', return_value=105.0):
+            assert detector.record(product_id) is True
+        with patch('app.core.coalescer.time.monotonic', return_value=111.0):
+            assert detector.record(product_id) is False
+
+
+class TestStockWriteCoalescer:
+    def test_flush_completes_each_future(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_product = MagicMock()
+        rejected = HTTPException(status_code=400, detail="Cannot reduce stock below zero")
+        
+        coalescer = StockWriteCoalescer()
+        product_id = uuid.uuid4()
+        accepted_future = coalescer.submit(product_id, StockUpdate(quantity=5))
+        rejected_future = coalescer.submit(product_id, StockUpdate(quantity=-50))
+        
+        with patch('app.core.coalescer.SessionLocal', return_value=mock_db), \
+             patch('app.core.coalescer.StockService.apply_coalesced_updates',
+                   return_value=[mock_product, rejected]) as mock_apply:
+            coalescer.flush()
+        
+        # Assertions
+        assert len(mock_apply.call_args[0][1]) == 2
+        assert accepted_future.result(timeout=0) == mock_product
+        with pytest.raises(HTTPException):
+            rejected_future.result(timeout=0)
+        mock_db.close.assert_called_once()
+    
+    def test_flush_fails_every_future_when_the_transaction_fails(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        coalescer = StockWriteCoalescer()
+        futures = [coalescer.submit(uuid.uuid4(), StockUpdate(quantity=1)) for _ in range(2)]
+        
+        with patch('app.core.coalescer.SessionLocal', return_value=mock_db), \
+             patch('app.core.coalescer.StockService.apply_coalesced_updates',
+                   side_effect=Exception("deadlock detected")):
+            coalescer.flush()
+        
+        # Assertions
+        mock_db.rollback.assert_called_once()
+        for future in futures:
+            with pytest.raises(Exception, match="deadlock detected"):
+                future.result(timeout=0)
+    
+    def test_stop_flushes_pending_updates(self):
+        coalescer = StockWriteCoalescer()
+        
+        with patch.object(coalescer, 'flush') as mock_flush:
+            coalescer.start()
+            coalescer.stop()
+        
+        # Assertions
+        assert mock_flush.called
+        with pytest.raises(RuntimeError):
+            coalescer.submit(uuid.uuid4(), StockUpdate(quantity=1))
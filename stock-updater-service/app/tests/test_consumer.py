@@ -0,0 +1,465 @@
+import asyncio
+import json
+import uuid
+import msgspec
+import pytest
+from datetime import datetime, timedelta, timezone
+from prometheus_client import REGISTRY
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.consumer import (
+    ConsumerSupervisor,
+    RecentEventIds,
+    StockEventConsumer,
+    StockEventRouter,
+    decode_stock_event,
+    event_product_id,
+    partition_for,
+    partition_queue,
+    retry_queue,
+)
+
+
+def _message(tag, routing_key, product_id, quantity, event_id=None):
+    message = MagicMock()
+    message.delivery_tag = tag
+    message.routing_key = partition_queue(0)
+    message.headers = {"event_type": routing_key}
+    message.content_type = "application/json"
+    message.message_id = None
+    message.timestamp = None
+    message.body = json.dumps({
+        "event_id": event_id or f"event-{tag}",
+        "product_id": str(product_id),
+        "quantity": quantity
+    }).encode()
+    message.ack = AsyncMock()
+    message.nack = AsyncMock()
+    return message
+
+
+def _consumer(*messages):
+    consumer = StockEventConsumer(partition=0)
+    consumer.channel = MagicMock()
+    consumer.channel.default_exchange.publish = AsyncMock()
+    for message in messages:
+        consumer._outstanding.append(message.delivery_tag)
+        consumer._buffer.append(message)
+    return consumer
+
+
+def _published(consumer):
+    return [
+        (call[0][0], call[1]["routing_key"]) for call in consumer.channel.default_exchange.publish.call_args_list
+    ]
+
+
+@pytest.fixture(autouse=True)
+def recent_event_ids():
+    recent = RecentEventIds(max_entries=100)
+    with patch('app.core.consumer.recent_event_ids', recent):
+        yield recent
+
+
+class TestStockEventConsumer:
+    def test_decode_stock_event_signs_quantity_by_topic(self):
+        product_id = uuid.uuid4()
+        body = json.dumps({"event_id": "e1", "product_id": str(product_id), "quantity": 3}).encode()
+        
+        received = decode_stock_event(settings.PRODUCT_RECEIVED_TOPIC, body)
+        sold = decode_stock_event(settings.PRODUCT_SOLD_TOPIC, body)
+        
+        # Assertions
+        assert received.product_id == product_id
+        assert received.quantity == 3
+        assert sold.quantity == -3
+        assert sold.reason == "Product sold"
+        assert sold.event_id == "e1"
+    
+    def test_decode_stock_event_requires_event_id(self):
+        body = json.dumps({"product_id": str(uuid.uuid4()), "quantity": 3}).encode()
+        
+        with pytest.raises(ValueError):
+            decode_stock_event(settings.PRODUCT_SOLD_TOPIC, body)
+    
+    def test_decode_stock_event_reads_msgpack_by_content_type(self):
+        product_id = uuid.uuid4()
+        body = msgspec.msgpack.encode({"event_id": "e1", "product_id": str(product_id), "quantity": 0})
+        
+        sold = decode_stock_event(settings.PRODUCT_SOLD_TOPIC, body, "application/msgpack")
+        
+        # Assertions: a zero quantity is a value, not a missing field
+        assert sold.product_id == product_id
+        assert sold.quantity == 0
+        assert event_product_id(body, "application/msgpack") == str(product_id)
+    
+    @pytest.mark.parametrize("payload", [
+        {"event_id": "e1", "product_id": "not-a-uuid", "quantity": 1},
+        {"event_id": "e1", "product_id": str(uuid.UUID(int=1)), "quantity": -1},
+        {"event_id": "e1", "product_id": str(uuid.UUID(int=1)), "quantity": "1"},
+        {"event_id": "e1", "product_id": str(uuid.UUID(int=1))},
+        {"event_id": "e1", "product_id": str(uuid.UUID(int=1)), "quantity": 1, "schema_version": 2},
+    ])
+    def test_decode_stock_event_rejects_invalid_payloads(self, payload):
+        with pytest.raises(msgspec.ValidationError):
+            decode_stock_event(settings.PRODUCT_SOLD_TOPIC, json.dumps(payload).encode())
+    
+    def test_messages_are_buffered_until_batch_size(self):
+        consumer = _consumer()
+        product_id = uuid.uuid4()
+        
+        async def receive():
+            with patch('app.core.consumer.settings') as mock_settings, \
+                 patch.object(consumer, '_schedule_flush') as mock_flush:
+                mock_settings.CONSUMER_BATCH_SIZE = 3
+                mock_settings.CONSUMER_BATCH_MAX_WAIT_MS = 50
+                await consumer._on_message(_message(1, settings.PRODUCT_SOLD_TOPIC, product_id, 1))
+                timer = consumer._timer
+                await consumer._on_message(_message(2, settings.PRODUCT_SOLD_TOPIC, product_id, 1))
+                
+                # Assertions: one flush timer armed for the first message only
+                assert timer is not None
+                assert consumer._timer is timer
+                mock_flush.assert_not_called()
+                
+                await consumer._on_message(_message(3, settings.PRODUCT_SOLD_TOPIC, product_id, 1))
+                mock_flush.assert_called_once()
+                timer.cancel()
+        
+        asyncio.run(receive())
+    
+    def test_flush_applies_batch_in_one_call_and_acks_together(self):
+        product_id = uuid.uuid4()
+        messages = [_message(tag, settings.PRODUCT_RECEIVED_TOPIC, product_id, tag) for tag in (1, 2, 3)]
+        consumer = _consumer(*messages)
+        consumer._timer = MagicMock()
+        timer = consumer._timer
+        
+        with patch('app.core.consumer.SessionLocal') as mock_session, \
+             patch('app.core.consumer.StockService') as mock_service:
+            mock_service.apply_stock_changes.return_value = [None, None, None]
+            asyncio.run(consumer.flush())
+        
+        # Assertions
+        changes = mock_service.apply_stock_changes.call_args[0][1]
+        assert [change.quantity for change in changes] == [1, 2, 3]
+        timer.cancel.assert_called_once()
+        messages[2].ack.assert_awaited_once_with(multiple=True)
+        messages[0].ack.assert_not_awaited()
+        assert not any(message.nack.called for message in messages)
+        mock_session().close.assert_called_once()
+        assert consumer._outstanding == []
+    
+    def test_flush_retries_or_dead_letters_failed_messages(self):
+        product_id = uuid.uuid4()
+        messages = [
+            _message(1, settings.PRODUCT_SOLD_TOPIC, product_id, 1),
+            _message(2, settings.PRODUCT_SOLD_TOPIC, product_id, 100),
+            _message(3, settings.PRODUCT_SOLD_TOPIC, "not-a-uuid", 1),
+            _message(4, settings.PRODUCT_SOLD_TOPIC, product_id, 1),
+            _message(5, settings.PRODUCT_SOLD_TOPIC, uuid.uuid4(), 1),
+        ]
+        consumer = _consumer(*messages)
+        
+        with patch('app.core.consumer.SessionLocal'), \
+             patch('app.core.consumer.StockService') as mock_service:
+            mock_service.apply_stock_changes.return_value = [
+                None,
+                HTTPException(status_code=400, detail="Cannot reduce stock below zero"),
+                None,
+                HTTPException(status_code=404, detail="Product not found"),
+            ]
+            asyncio.run(consumer.flush())
+        
+        # Assertions: insufficient stock is retried, bad payloads and missing products are dead-lettered
+        published = _published(consumer)
+        retried = [message for message, routing_key in published if ".retry." in routing_key]
+        dead = [message for message, routing_key in published if routing_key == settings.DEAD_LETTER_QUEUE]
+        assert len(retried) == 1
+        assert (retried[0], retry_queue(0, settings.consumer_retry_delays[0])) in published
+        assert retried[0].headers["x-retry-count"] == 1
+        assert retried[0].body == messages[1].body
+        assert len(dead) == 2
+        assert all(message.headers["x-source-queue"] == partition_queue(0) for message in dead)
+        
+        # Every message has been handed off, so the whole batch is acked at once
+        assert not any(message.nack.called for message in messages)
+        messages[4].ack.assert_awaited_once_with(multiple=True)
+        assert consumer._outstanding == []
+    
+    def test_flush_retries_whole_batch_on_database_error(self):
+        product_id = uuid.uuid4()
+        messages = [_message(tag, settings.PRODUCT_SOLD_TOPIC, product_id, 1) for tag in (1, 2)]
+        consumer = _consumer(*messages)
+        
+        with patch('app.core.consumer.SessionLocal') as mock_session, \
+             patch('app.core.consumer.StockService') as mock_service:
+            mock_service.apply_stock_changes.side_effect = Exception("connection lost")
+            asyncio.run(consumer.flush())
+        
+        # Assertions
+        mock_session().rollback.assert_called_once()
+        routing_keys = [routing_key for _, routing_key in _published(consumer)]
+        assert routing_keys == [retry_queue(0, settings.consumer_retry_delays[0])] * 2
+        messages[1].ack.assert_awaited_once_with(multiple=True)
+    
+    def test_retry_dead_letters_once_retries_are_exhausted(self):
+        consumer = _consumer()
+        message = _message(1, settings.PRODUCT_SOLD_TOPIC, uuid.uuid4(), 1)
+        message.headers = {"x-retry-count": len(settings.consumer_retry_delays)}
+        
+        assert asyncio.run(consumer.retry(message, "Cannot reduce stock below zero")) == True
+        
+        # Assertions
+        published, routing_key = _published(consumer)[0]
+        assert routing_key == settings.DEAD_LETTER_QUEUE
+        assert published.headers["x-last-error"].startswith("Retries exhausted")
+    
+    def test_flush_requeues_when_retry_publish_fails(self):
+        messages = [_message(tag, settings.PRODUCT_SOLD_TOPIC, uuid.uuid4(), 1) for tag in (1, 2)]
+        consumer = _consumer(*messages)
+        consumer.channel.default_exchange.publish.side_effect = Exception("connection lost")
+        
+        with patch('app.core.consumer.SessionLocal'), \
+             patch('app.core.consumer.StockService') as mock_service:
+            mock_service.apply_stock_changes.return_value = [
+                HTTPException(status_code=400, detail="Cannot reduce stock below zero"), None
+            ]
+            asyncio.run(consumer.flush())
+        
+        # Assertions
+        messages[0].nack.assert_awaited_once_with(requeue=True)
+        messages[0].ack.assert_not_awaited()
+        messages[1].ack.assert_awaited_once_with(multiple=True)
+    
+    def test_stop_cancels_consumer_then_flushes_buffer(self):
+        messages = [_message(tag, settings.PRODUCT_SOLD_TOPIC, uuid.uuid4(), 1) for tag in (1, 2)]
+        consumer = _consumer(*messages)
+        consumer.queue = MagicMock()
+        consumer.queue.cancel = AsyncMock()
+        consumer._consumer_tag = "ctag"
+        
+        with patch('app.core.consumer.SessionLocal'), \
+             patch('app.core.consumer.StockService') as mock_service:
+            mock_service.apply_stock_changes.return_value = [None, None]
+            asyncio.run(consumer.stop())
+        
+        # Assertions
+        consumer.queue.cancel.assert_awaited_once_with("ctag")
+        mock_service.apply_stock_changes.assert_called_once()
+        messages[1].ack.assert_awaited_once_with(multiple=True)
+        assert consumer._buffer == []
+    
+    def test_partition_for_is_stable_per_product(self):
+        product_id = uuid.uuid4()
+        
+        # Assertions: same partition however the ID is written
+        partition = partition_for(str(product_id), 8)
+        assert 0 <= partition < 8
+        assert partition_for(str(product_id).upper(), 8) == partition
+        assert partition_for(None, 8) == partition_for(None, 8)
+    
+    def test_router_publishes_to_product_partition_then_acks(self):
+        router = StockEventRouter(partitions=4)
+        router.exchange = MagicMock()
+        router.exchange.publish = AsyncMock()
+        product_id = uuid.uuid4()
+        message = _message(7, settings.PRODUCT_SOLD_TOPIC, product_id, 1)
+        message.routing_key = settings.PRODUCT_SOLD_TOPIC
+        message.headers = None
+        
+        asyncio.run(router._on_message(message))
+        
+        # Assertions
+        published = router.exchange.publish.call_args
+        assert published[1]["routing_key"] == partition_queue(partition_for(str(product_id), 4))
+        assert published[1]["mandatory"] is True
+        assert published[0][0].headers == {"event_type": settings.PRODUCT_SOLD_TOPIC}
+        assert published[0][0].body == message.body
+        message.ack.assert_awaited_once()
+        assert router._in_flight == set()
+    
+    def test_router_nacks_when_publish_fails(self):
+        router = StockEventRouter(partitions=4)
+        router.exchange = MagicMock()
+        router.exchange.publish = AsyncMock(side_effect=Exception("unroutable"))
+        message = _message(7, settings.PRODUCT_SOLD_TOPIC, uuid.uuid4(), 1)
+        message.body = b"not json"
+        
+        asyncio.run(router._on_message(message))
+        
+        # Assertions
+        message.nack.assert_awaited_once()
+        message.ack.assert_not_awaited()
+    
+    def test_flush_acks_recently_processed_events_without_applying(self, recent_event_ids):
+        product_id = uuid.uuid4()
+        recent_event_ids.add("e1")
+        messages = [
+            _message(1, settings.PRODUCT_SOLD_TOPIC, product_id, 1, "e1"),
+            _message(2, settings.PRODUCT_SOLD_TOPIC, product_id, 1, "e2"),
+        ]
+        consumer = _consumer(*messages)
+        
+        with patch('app.core.consumer.SessionLocal'), \
+             patch('app.core.consumer.StockService') as mock_service:
+            mock_service.apply_stock_changes.return_value = [None]
+            asyncio.run(consumer.flush())
+        
+        # Assertions
+        changes = mock_service.apply_stock_changes.call_args[0][1]
+        assert [change.event_id for change in changes] == ["e2"]
+        messages[1].ack.assert_awaited_once_with(multiple=True)
+        assert "e2" in recent_event_ids
+    
+    def test_flush_records_outcomes_and_event_age(self):
+        product_id = uuid.uuid4()
+        messages = [
+            _message(1, settings.PRODUCT_RECEIVED_TOPIC, product_id, 1),
+            _message(2, settings.PRODUCT_RECEIVED_TOPIC, "not-a-uuid", 1),
+        ]
+        messages[0].timestamp = datetime.now(timezone.utc) - timedelta(seconds=2)
+        consumer = _consumer(*messages)
+        
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+        
+        queue = partition_queue(0)
+        applied = sample("stock_events_processed_total", queue=queue, outcome="applied")
+        dead_lettered = sample("stock_events_processed_total", queue=queue, outcome="dead_lettered")
+        aged = sample("stock_event_age_seconds_count")
+        age_total = sample("stock_event_age_seconds_sum")
+        
+        with patch('app.core.consumer.SessionLocal'), \
+             patch('app.core.consumer.StockService') as mock_service:
+            mock_service.apply_stock_changes.return_value = [None]
+            asyncio.run(consumer.flush())
+        
+        # Assertions
+        assert sample("stock_events_processed_total", queue=queue, outcome="applied") == applied + 1
+        assert sample("stock_events_processed_total", queue=queue, outcome="dead_lettered") == dead_lettered + 1
+        assert sample("stock_event_age_seconds_count") == aged + 1
+        assert sample("stock_event_age_seconds_sum") - age_total >= 2
+    
+    def test_recent_event_ids_is_bounded(self):
+        recent = RecentEventIds(max_entries=2)
+        recent.add("e1")
+        recent.add("e2")
+        assert "e1" in recent
+        recent.add("e3")
+        
+        # Assertions: e2 was the least recently used
+        assert "e2" not in recent
+        assert "e1" in recent
+        assert "e3" in recent
+
+
+class TestConsumerSupervisor:
+    def test_reconnects_with_backoff_and_drains_on_stop(self):
+        supervisor = ConsumerSupervisor(partitions=2)
+        connection = MagicMock()
+        connection.is_closed = False
+        connection.close = AsyncMock()
+        attempts = []
+        
+        async def connect():
+            attempts.append(len(attempts))
+            if len(attempts) < 3:
+                raise ConnectionError("Connection refused")
+            return connection
+        
+        async def wait_until(condition):
+            while not condition():
+                await asyncio.sleep(0.001)
+        
+        async def lifecycle():
+            with patch('app.core.consumer.connect', connect), \
+                 patch.object(settings, 'CONSUMER_RECONNECT_MIN_DELAY_MS', 1), \
+                 patch.object(settings, 'CONSUMER_RECONNECT_MAX_DELAY_MS', 2), \
+                 patch.object(StockEventRouter, 'start', AsyncMock()), \
+                 patch.object(StockEventRouter, 'stop', AsyncMock()) as router_stop, \
+                 patch.object(StockEventConsumer, 'start', AsyncMock()) as consumer_start, \
+                 patch.object(StockEventConsumer, 'stop', AsyncMock()) as consumer_stop:
+                supervisor.start()
+                await asyncio.wait_for(wait_until(lambda: supervisor.connection is not None), 1)
+                
+                # Assertions: connected on the third attempt, with a consumer per partition
+                assert len(attempts) == 3
+                assert consumer_start.await_count == 2
+                
+                # A lost connection is reopened
+                supervisor._on_connection_closed(connection, ConnectionError("Connection reset"))
+                await asyncio.wait_for(wait_until(lambda: len(attempts) == 4 and supervisor.connection is not None), 1)
+                
+                await supervisor.stop(timeout=1)
+                router_stop.assert_awaited_once()
+                assert consumer_stop.await_count == 2
+                assert supervisor.connection is None
+        
+        asyncio.run(lifecycle())
+        
+        # Assertions
+        assert connection.close.await_count >= 1
+    
+    def test_update_queue_depths_reads_every_queue(self):
+        supervisor = ConsumerSupervisor(partitions=2)
+        supervisor.connection = MagicMock()
+        supervisor.connection.is_closed = False
+        channel = MagicMock()
+        channel.is_closed = False
+        channel.close = AsyncMock()
+        supervisor.connection.channel = AsyncMock(return_value=channel)
+        
+        async def declare_queue(name, passive):
+            queue = MagicMock()
+            queue.declaration_result.message_count = 7 if name == settings.DEAD_LETTER_QUEUE else 3
+            return queue
+        channel.declare_queue = AsyncMock(side_effect=declare_queue)
+        
+        asyncio.run(supervisor.update_queue_depths())
+        
+        # Assertions: source, partition, retry and dead-letter queues
+        declared = [call[0][0] for call in channel.declare_queue.call_args_list]
+        assert len(declared) == 2 + 2 * (1 + len(settings.consumer_retry_delays)) + 1
+        assert all(call[1]["passive"] for call in channel.declare_queue.call_args_list)
+        assert REGISTRY.get_sample_value("stock_events_queue_messages", {"queue": settings.DEAD_LETTER_QUEUE}) == 7
+        assert REGISTRY.get_sample_value("stock_events_queue_messages", {"queue": partition_queue(1)}) == 3
+        supervisor.connection.channel.assert_awaited_once()
+        channel.close.assert_awaited_once()
+    
+    def test_update_queue_depths_reopens_channel_after_missing_queue(self):
+        import aio_pika
+        
+        supervisor = ConsumerSupervisor(partitions=2)
+        supervisor.connection = MagicMock()
+        supervisor.connection.is_closed = False
+        channels = []
+        
+        async def open_channel():
+            channel = MagicMock()
+            channel.is_closed = False
+            channel.close = AsyncMock()
+            
+            async def declare_queue(name, passive):
+                # A passive declare of a missing queue closes the channel
+                if name == partition_queue(0):
+                    channel.is_closed = True
+                    raise aio_pika.exceptions.ChannelNotFoundEntity()
+                queue = MagicMock()
+                queue.declaration_result.message_count = 5
+                return queue
+            channel.declare_queue = AsyncMock(side_effect=declare_queue)
+            channels.append(channel)
+            return channel
+        supervisor.connection.channel = AsyncMock(side_effect=open_channel)
+        
+        asyncio.run(supervisor.update_queue_depths())
+        
+        # Assertions: the queues after the missing one are still read
+        assert len(channels) == 2
+        assert REGISTRY.get_sample_value("stock_events_queue_messages", {"queue": settings.DEAD_LETTER_QUEUE}) == 5
+        assert REGISTRY.get_sample_value("stock_events_queue_messages", {"queue": partition_queue(1)}) == 5
+        channels[0].close.assert_not_awaited()
+        channels[1].close.assert_awaited_once()
@@ -0,0 +1,63 @@
+import json
+import uuid
+from unittest.mock import MagicMock, patch
+
+from app.core.config import settings
+from app.core.consumer import partition_for, partition_queue
+from app.services.dead_letter_service import DeadLetterService
+
+
+def _dead_letter(tag, product_id):
+    method = MagicMock()
+    method.delivery_tag = tag
+    properties = MagicMock()
+    properties.message_id = f"message-{tag}"
+    properties.headers = {
+        "event_type": settings.PRODUCT_SOLD_TOPIC,
+        "x-retry-count": 3,
+        "x-last-error": "Retries exhausted: Cannot reduce stock below zero",
+        "x-source-queue": partition_queue(0),
+    }
+    body = json.dumps({"event_id": f"e{tag}", "product_id": str(product_id), "quantity": 1}).encode()
+    return method, properties, body
+
+
+class TestDeadLetterService:
+    def test_list_messages_leaves_messages_in_queue(self):
+        # Mock RabbitMQ channel
+        mock_channel = MagicMock()
+        mock_channel.queue_declare().method.message_count = 5
+        mock_channel.basic_get.side_effect = [_dead_letter(1, uuid.uuid4()), _dead_letter(2, uuid.uuid4())]
+        
+        with patch('app.services.dead_letter_service.pika.BlockingConnection') as mock_connection:
+            mock_connection().channel.return_value = mock_channel
+            result = DeadLetterService.list_messages(2)
+        
+        # Assertions
+        assert result.total == 5
+        assert [message.body["event_id"] for message in result.messages] == ["e1", "e2"]
+        assert result.messages[0].retry_count == 3
+        assert result.messages[0].event_type == settings.PRODUCT_SOLD_TOPIC
+        mock_channel.basic_ack.assert_not_called()
+        mock_connection().close.assert_called_once()
+    
+    def test_replay_republishes_to_product_partition(self):
+        product_id = uuid.uuid4()
+        
+        # Mock RabbitMQ channel: one dead letter, then an empty queue
+        mock_channel = MagicMock()
+        mock_channel.queue_declare().method.message_count = 0
+        mock_channel.basic_get.side_effect = [_dead_letter(1, product_id), (None, None, None)]
+        
+        with patch('app.services.dead_letter_service.pika.BlockingConnection') as mock_connection:
+            mock_connection().channel.return_value = mock_channel
+            result = DeadLetterService.replay(10)
+        
+        # Assertions
+        assert result.replayed == 1
+        assert result.remaining == 0
+        publish = mock_channel.basic_publish.call_args[1]
+        assert publish["exchange"] == settings.STOCK_EVENTS_PARTITION_EXCHANGE
+        assert publish["routing_key"] == partition_queue(partition_for(str(product_id), settings.CONSUMER_WORKERS))
+        assert publish["properties"].headers == {"event_type": settings.PRODUCT_SOLD_TOPIC}
+        mock_channel.basic_ack.assert_called_once_with(delivery_tag=1)
@@ -0,0 +1,71 @@
+import uuid
+from datetime import date
+from unittest.mock import MagicMock
+
+from app.models.stock_movement import StockMovement
+from app.services.ledger_service import LedgerService, partition_name
+
+
+class TestLedgerService:
+    def test_record_movements_copies_rows_in_one_statement(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_cursor = mock_db.connection().connection.cursor()
+        copied = {}
+        mock_cursor.copy_expert.side_effect = lambda sql, buffer: copied.update(sql=sql, data=buffer.read())
+        
+        product_id = uuid.uuid4()
+        movements = [
+            StockMovement(product_id=product_id, delta=5, resulting_stock=15, reason="Restock\tbatch 1", event_id="e1"),
+            StockMovement(product_id=product_id, delta=-2, resulting_stock=13, reason=None, event_id=None),
+        ]
+        
+        LedgerService.record_movements(mock_db, movements)
+        
+        # Assertions
+        assert copied["sql"] == "COPY stock_movements (product_id, delta, resulting_stock, reason, event_id) FROM STDIN"
+        assert copied["data"] == (
+            f"{product_id}\t5\t15\tRestock\\tbatch 1\te1\n"
+            f"{product_id}\t-2\t13\t\\N\t\\N\n"
+        )
+        mock_cursor.close.assert_called_once()
+    
+    def test_record_movements_skips_empty_batches(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        LedgerService.record_movements(mock_db, [])
+        
+        # Assertions
+        mock_db.connection.assert_not_called()
+    
+    def test_ensure_partitions_creates_monthly_ranges(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        names = LedgerService.ensure_partitions(mock_db, months_ahead=2, today=date(2024, 11, 20))
+        
+        # Assertions: ranges roll over the year
+        assert names == ["stock_movements_2024_11", "stock_movements_2024_12", "stock_movements_2025_01"]
+        statements = [str(c[0][0]) for c in mock_db.execute.call_args_list]
+        assert "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')" in statements[1]
+        mock_db.commit.assert_called_once()
+    
+    def test_drop_expired_partitions_keeps_retention_window(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        partitions = []
+        for name in ["stock_movements_2023_12", "stock_movements_2024_01", "stock_movements_2024_02", "stock_movements_2024_03"]:
+            row = MagicMock()
+            row.relname = name
+            partitions.append(row)
+        mock_db.execute().all.return_value = partitions
+        mock_db.execute.reset_mock()
+        
+        dropped = LedgerService.drop_expired_partitions(mock_db, retention_months=1, today=date(2024, 3, 5))
+        
+        # Assertions
+        assert dropped == ["stock_movements_2023_12", "stock_movements_2024_01"]
+        assert partition_name(date(2024, 2, 1)) == "stock_movements_2024_02"
+        drops = [str(c[0][0]) for c in mock_db.execute.call_args_list[1:]]
+        assert drops == ["DROP TABLE IF EXISTS stock_movements_2023_12", "DROP TABLE IF EXISTS stock_movements_2024_01"]
@@ -0,0 +1,102 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core.outbox import OutboxRelay
+
+
+def _outbox_event(event_id):
+    event = MagicMock()
+    event.id = event_id
+    event.routing_key = "stock-updated"
+    event.payload = {"product_id": f"product-{event_id}"}
+    return event
+
+
+class TestOutboxRelay:
+    def test_relay_batch_publishes_and_deletes_events(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.execute().scalars().all.return_value = [_outbox_event(1), _outbox_event(2)]
+        mock_db.execute.reset_mock()
+        
+        with patch('app.core.outbox.SessionLocal', return_value=mock_db), \
+             patch('app.core.outbox.event_publisher') as mock_publisher:
+            mock_publisher.publish_batch = AsyncMock(return_value=[True, True])
+            relayed = OutboxRelay().relay_batch()
+        
+        # Assertions: the whole batch is published at once
+        assert relayed == 2
+        mock_publisher.publish_batch.assert_awaited_once_with([
+            ("stock-updated", {"product_id": "product-1"}),
+            ("stock-updated", {"product_id": "product-2"}),
+        ])
+        
+        # Rows are claimed with SKIP LOCKED, then deleted in the same transaction
+        select_statement = str(mock_db.execute.call_args_list[0][0][0])
+        assert "FOR UPDATE" in select_statement
+        delete_statement = mock_db.execute.call_args_list[1][0][0]
+        assert "DELETE FROM outbox_events" in str(delete_statement)
+        mock_db.commit.assert_called_once()
+        mock_db.close.assert_called_once()
+    
+    def test_relay_batch_deletes_only_confirmed_events(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.execute().scalars().all.return_value = [_outbox_event(1), _outbox_event(2), _outbox_event(3)]
+        mock_db.execute.reset_mock()
+        
+        with patch('app.core.outbox.SessionLocal', return_value=mock_db), \
+             patch('app.core.outbox.event_publisher') as mock_publisher:
+            mock_publisher.publish_batch = AsyncMock(return_value=[True, False, True])
+            relayed = OutboxRelay().relay_batch()
+        
+        # Assertions: only the confirmed events are deleted, the other stays for the next batch
+        assert relayed == 2
+        mock_publisher.publish_batch.assert_awaited_once()
+        delete_statement = mock_db.execute.call_args_list[1][0][0]
+        assert delete_statement.compile().params == {"id_1": [1, 3]}
+        mock_db.commit.assert_called_once()
+    
+    def test_relay_batch_with_empty_outbox(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.execute().scalars().all.return_value = []
+        mock_db.execute.reset_mock()
+        
+        with patch('app.core.outbox.SessionLocal', return_value=mock_db), \
+             patch('app.core.outbox.event_publisher') as mock_publisher:
+            relayed = OutboxRelay().relay_batch()
+        
+        # Assertions
+        assert relayed == 0
+        mock_publisher.publish_batch.assert_not_called()
+        mock_db.execute.assert_called_once()
+
+
+class TestEventPublisher:
+    def test_publish_batch_waits_for_all_confirms(self):
+        import asyncio
+        from pamqp.commands import Basic
+        from app.core.publisher import EventPublisher
+        
+        # Mock exchange: the second message is nacked, the third times out
+        mock_exchange = MagicMock()
+        mock_exchange.publish = AsyncMock(side_effect=[Basic.Ack(delivery_tag=1), Basic.Nack(delivery_tag=2), asyncio.TimeoutError()])
+        publisher = EventPublisher()
+        
+        with patch.object(publisher, '_get_exchange', AsyncMock(return_value=mock_exchange)):
+            loop = asyncio.new_event_loop()
+            try:
+                confirmed = loop.run_until_complete(publisher.publish_batch([
+                    ("stock-updated", {"n": 1}),
+                    ("stock-updated", {"n": 2}),
+                    ("stock-updated", {"n": 3}),
+                ]))
+            finally:
+                loop.close()
+        
+        # Assertions
+        assert confirmed == [True, False, False]
+        assert mock_exchange.publish.await_count == 3
+        message = mock_exchange.publish.call_args_list[0][0][0]
+        assert message.body == b'{"n": 1}'
+        assert message.delivery_mode == 2
@@ -0,0 +1,211 @@
+import pytest
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app.models.supplier import Supplier  # registers the mapper used by Product.supplier
+from app.models.outbox_event import OutboxEvent
+from app.models.reservation import StockReservation
+from app.schemas.reservation import ReservationCreate
+from app.services.reservation_service import ReservationService
+
+
+def _product(product_id, stock, reserved_stock):
+    product = MagicMock()
+    product.id = product_id
+    product.stock = stock
+    product.reserved_stock = reserved_stock
+    product.version = 1
+    return product
+
+
+def _reservation(product_id, quantity):
+    reservation = MagicMock()
+    reservation.id = uuid.uuid4()
+    reservation.product_id = product_id
+    reservation.quantity = quantity
+    reservation.expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)
+    return reservation
+
+
+def _added(mock_db, model):
+    return [c[0][0] for c in mock_db.add.call_args_list if isinstance(c[0][0], model)]
+
+
+class TestReservationService:
+    def test_reserve_holds_available_stock(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        product_id = uuid.uuid4()
+        mock_db.execute().first.return_value = _product(product_id, 10, 4)
+        mock_db.execute.reset_mock()
+        
+        result = ReservationService.reserve(mock_db, ReservationCreate(product_id=product_id, quantity=4, ttl_seconds=60))
+        
+        # Assertions
+        assert result.status == "active"
+        assert result.stock == 10
+        assert result.available_stock == 6
+        mock_db.commit.assert_called_once()
+        
+        # The availability check happens in the UPDATE's WHERE clause
+        compiled = str(mock_db.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+        assert "products.stock - products.reserved_stock >=" in compiled
+        assert "reserved_stock=(products.reserved_stock +" in compiled
+        
+        # The reservation and the stock event are written in the same transaction
+        reservation = _added(mock_db, StockReservation)[0]
+        assert reservation.quantity == 4
+        assert reservation.expires_at > datetime.now(timezone.utc)
+        assert _added(mock_db, OutboxEvent)[0].payload["reserved_stock"] == 4
+    
+    def test_reserve_insufficient_available_stock(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.execute().first.return_value = None
+        mock_current = MagicMock()
+        mock_current.stock = 10
+        mock_current.reserved_stock = 8
+        mock_db.query().filter().first.return_value = mock_current
+        
+        with pytest.raises(HTTPException) as excinfo:
+            ReservationService.reserve(mock_db, ReservationCreate(product_id=uuid.uuid4(), quantity=5))
+        
+        # Assertions
+        assert excinfo.value.status_code == 409
+        assert "Available: 2" in str(excinfo.value.detail)
+        mock_db.rollback.assert_called_once()
+        mock_db.add.assert_not_called()
+    
+    def test_reserve_rejects_long_ttl(self):
+        mock_db = MagicMock()
+        
+        with pytest.raises(HTTPException) as excinfo:
+            ReservationService.reserve(mock_db, ReservationCreate(product_id=uuid.uuid4(), quantity=1, ttl_seconds=10 ** 6))
+        
+        # Assertions
+        assert excinfo.value.status_code == 400
+        mock_db.execute.assert_not_called()
+    
+    def test_commit_removes_stock_and_reservation(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        product_id = uuid.uuid4()
+        mock_db.execute().first.side_effect = [_reservation(product_id, 3), _product(product_id, 7, 0)]
+        mock_db.execute.reset_mock()
+        
+        result = ReservationService.commit(mock_db, uuid.uuid4())
+        
+        # Assertions
+        assert result.status == "committed"
+        assert result.stock == 7
+        assert result.available_stock == 7
+        product_update = str(mock_db.execute.call_args_list[1][0][0].compile(dialect=postgresql.dialect()))
+        assert "stock=(products.stock - %(stock_1)s)" in product_update
+        assert "reserved_stock=(products.reserved_stock - %(reserved_stock_1)s)" in product_update
+        
+        # The sale is in the ledger and the event carries the stock change
+        message = _added(mock_db, OutboxEvent)[0].payload
+        assert message["change_amount"] == -3
+        assert message["previous_stock"] == 10
+        mock_db.connection().connection.cursor().copy_expert.assert_called_once()
+        mock_db.commit.assert_called_once()
+    
+    def test_commit_without_enough_stock(self):
+        # Mock DB session: the stock was reduced below the reservation outside of it
+        mock_db = MagicMock()
+        product_id = uuid.uuid4()
+        mock_db.execute().first.side_effect = [_reservation(product_id, 3), None]
+        mock_db.execute.reset_mock()
+        mock_current = MagicMock()
+        mock_current.stock = 2
+        mock_current.reserved_stock = 3
+        mock_db.query().filter().first.return_value = mock_current
+        
+        with pytest.raises(HTTPException) as excinfo:
+            ReservationService.commit(mock_db, uuid.uuid4())
+        
+        # Assertions
+        assert excinfo.value.status_code == 400
+        assert "Cannot reduce stock below zero" in excinfo.value.detail
+        product_update = str(mock_db.execute.call_args_list[1][0][0].compile(dialect=postgresql.dialect()))
+        assert "products.stock >= %(stock_2)s AND products.reserved_stock >= %(reserved_stock_2)s" in product_update
+        mock_db.rollback.assert_called_once()
+        mock_db.commit.assert_not_called()
+    
+    def test_release_returns_reserved_stock(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        product_id = uuid.uuid4()
+        mock_db.execute().first.side_effect = [_reservation(product_id, 3), _product(product_id, 10, 0)]
+        mock_db.execute.reset_mock()
+        
+        result = ReservationService.release(mock_db, uuid.uuid4())
+        
+        # Assertions
+        assert result.status == "released"
+        assert result.available_stock == 10
+        mock_db.connection.assert_not_called()
+        mock_db.commit.assert_called_once()
+    
+    def test_commit_expired_reservation(self):
+        # Mock DB session: the reservation is past its expiry but not swept yet
+        mock_db = MagicMock()
+        mock_db.execute().first.return_value = None
+        mock_current = MagicMock()
+        mock_current.status = "active"
+        mock_db.query().filter().first.return_value = mock_current
+        
+        with pytest.raises(HTTPException) as excinfo:
+            ReservationService.commit(mock_db, uuid.uuid4())
+        
+        # Assertions
+        assert excinfo.value.status_code == 409
+        assert excinfo.value.detail == "Reservation is expired"
+        mock_db.commit.assert_not_called()
+    
+    def test_release_unknown_reservation(self):
+        mock_db = MagicMock()
+        mock_db.execute().first.return_value = None
+        mock_db.query().filter().first.return_value = None
+        
+        with pytest.raises(HTTPException) as excinfo:
+            ReservationService.release(mock_db, uuid.uuid4())
+        
+        # Assertions
+        assert excinfo.value.status_code == 404
+    
+    def test_expire_reservations_nets_released_stock_per_product(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        product_id = uuid.uuid4()
+        mock_db.execute().all.side_effect = [
+            [_reservation(product_id, 2), _reservation(product_id, 3)],
+            [_product(product_id, 10, 1)],
+        ]
+        mock_db.execute.reset_mock()
+        
+        expired = ReservationService.expire_reservations(mock_db, limit=100)
+        
+        # Assertions
+        assert expired == 2
+        sweep = str(mock_db.execute.call_args_list[0][0][0].compile(dialect=postgresql.dialect()))
+        assert "stock_reservations.status = %(status_1)s AND stock_reservations.expires_at <= now()" in sweep
+        assert "FOR UPDATE SKIP LOCKED" in sweep
+        lock = str(mock_db.execute.call_args_list[1][0][0].compile(dialect=postgresql.dialect()))
+        assert "ORDER BY products.id" in lock
+        release = mock_db.execute.call_args_list[2][0][0].compile(dialect=postgresql.dialect())
+        assert 5 in release.params.values()
+        assert len(_added(mock_db, OutboxEvent)) == 1
+        mock_db.commit.assert_called_once()
+    
+    def test_expire_reservations_with_nothing_due(self):
+        mock_db = MagicMock()
+        mock_db.execute().all.return_value = []
+        mock_db.execute.reset_mock()
+        
+        # Assertions
+        assert ReservationService.expire_reservations(mock_db, limit=100) == 0
+        mock_db.execute.assert_called_once()
@@ -0,0 +1,29 @@
+import pytest
+
+from fastapi import HTTPException
+from app.api.routes import _parse_if_match
+
+
+class TestParseIfMatch:
+    def test_absent_or_any(self):
+        # Assertions
+        assert _parse_if_match(None) is None
+        assert _parse_if_match("*") is None
+    
+    def test_list_of_version_tags(self):
+        # Assertions
+        assert _parse_if_match('"3"') == [3]
+        assert _parse_if_match('"3", "4" ,"5"') == [3, 4, 5]
+    
+    def test_weak_and_foreign_tags_never_match(self):
+        # Assertions: strong comparison, so these leave no version to match (412)
+        assert _parse_if_match('W/"3"') == []
+        assert _parse_if_match('W/"3", "abc"') == []
+        assert _parse_if_match('W/"3", "4"') == [4]
+    
+    def test_malformed_header(self):
+        # Assertions
+        for if_match in ("3", '"3", ', 'W/3'):
+            with pytest.raises(HTTPException) as excinfo:
+                _parse_if_match(if_match)
+            assert excinfo.value.status_code == 400
@@ -2,7 +2,9 @@ import pytest
 import uuid
 from unittest.mock import MagicMock, patch
 from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
 
+from app.models.supplier import Supplier  # registers the mapper used by Product.supplier
 from app.services.stock_service import StockService
 from app.schemas.product import StockUpdate
 
@@ -12,13 +14,14 @@ class TestStockService:
         # Mock DB session
         mock_db = MagicMock()
         
-        # Mock product
+        # Mock product as returned by the UPDATE ... RETURNING
         mock_product = MagicMock()
         mock_product.id = uuid.uuid4()
-        mock_product.stock = 10
+        mock_product.stock = 15
         
-        # Mock query result
-        mock_db.query().filter().first.return_value = mock_product
+        # Mock statement result
+        mock_db.execute().scalars().first.return_value = mock_product
+        mock_db.execute.reset_mock()
         
         # Test data
         product_id = mock_product.id
@@ -29,40 +32,63 @@ class TestStockService:
         
         # Assertions
         assert result == mock_product
-        assert mock_product.stock == 15
+        mock_db.execute.assert_called_once()
         mock_db.commit.assert_called_once()
-        mock_db.refresh.assert_called_once_with(mock_product)
+        mock_db.refresh.assert_not_called()
+        mock_db.query.assert_not_called()
+        
+        # Check the stock updated event
+        event = self._outbox_events(mock_db)[0]
+        assert event.routing_key == "stock-updated"
+        message = event.payload
+        
+        # The event is written in the same transaction as the stock change
+        call_names = [c[0] for c in mock_db.mock_calls]
+        assert call_names.index("add") < call_names.index("commit")
+        
+        # And so is the ledger movement
+        movements = mock_db.connection().connection.cursor().copy_expert.call_args[0][1].getvalue()
+        assert movements == f"{product_id}\t5\t15\tTest update\t\\N\n"
+        assert message["product_id"] == str(product_id)
+        assert message["previous_stock"] == 10
+        assert message["new_stock"] == 15
     
     def test_update_stock_negative_quantity(self):
         # Mock DB session
         mock_db = MagicMock()
         
-        # Mock product
+        # Mock product as returned by the UPDATE ... RETURNING
         mock_product = MagicMock()
         mock_product.id = uuid.uuid4()
-        mock_product.stock = 10
-        
-        # Mock query result
-        mock_db.query().filter().first.return_value = mock_product
+        mock_product.stock = 5
+        mock_db.execute().scalars().first.return_value = mock_product
+        mock_db.execute.reset_mock()
         
         # Test data
-        product_id = mock_product.id
         stock_update = StockUpdate(quantity=-5, reason="Test reduction")
         
         # Call the service
-        result = StockService.update_stock(mock_db, product_id, stock_update)
+        result = StockService.update_stock(mock_db, mock_product.id, stock_update)
         
         # Assertions
         assert result == mock_product
-        assert mock_product.stock == 5
         mock_db.commit.assert_called_once()
-        mock_db.refresh.assert_called_once_with(mock_product)
+        
+        # The stock check happens in the UPDATE's WHERE clause
+        statement = mock_db.execute.call_args[0][0]
+        compiled = str(statement.compile(dialect=postgresql.dialect()))
+        assert compiled.startswith("UPDATE products SET stock=(products.stock +")
+        assert "WHERE products.id =" in compiled
+        # Stock held by reservations can't be removed
+        assert ">= products.reserved_stock" in compiled
+        assert "RETURNING" in compiled
     
     def test_update_stock_product_not_found(self):
         # Mock DB session
         mock_db = MagicMock()
         
-        # Mock query result - product not found
+        # Mock statement result - no row updated, and no row exists
+        mock_db.execute().scalars().first.return_value = None
         mock_db.query().filter().first.return_value = None
         
         # Test data
@@ -77,21 +103,20 @@ class TestStockService:
         assert excinfo.value.status_code == 404
         assert "Product not found" in str(excinfo.value.detail)
         mock_db.commit.assert_not_called()
+        mock_db.rollback.assert_called_once()
     
     def test_update_stock_negative_result(self):
         # Mock DB session
         mock_db = MagicMock()
         
-        # Mock product
-        mock_product = MagicMock()
-        mock_product.id = uuid.uuid4()
-        mock_product.stock = 10
-        
-        # Mock query result
-        mock_db.query().filter().first.return_value = mock_product
+        # Mock statement result - no row updated, but the product exists
+        mock_db.execute().scalars().first.return_value = None
+        mock_current = MagicMock()
+        mock_current.stock = 10
+        mock_db.query().filter().first.return_value = mock_current
         
         # Test data
-        product_id = mock_product.id
+        product_id = uuid.uuid4()
         stock_update = StockUpdate(quantity=-15, reason="Test excessive reduction")
         
         # Call the service and check exception
@@ -101,7 +126,70 @@ class TestStockService:
         # Assertions
         assert excinfo.value.status_code == 400
         assert "Cannot reduce stock below zero" in str(excinfo.value.detail)
+        assert "Current stock: 10" in str(excinfo.value.detail)
+        mock_db.commit.assert_not_called()
+    
+    def test_update_stock_below_reserved_stock(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        # Enough stock on hand, but most of it is reserved
+        mock_db.execute().scalars().first.return_value = None
+        mock_current = MagicMock()
+        mock_current.stock = 10
+        mock_current.reserved_stock = 8
+        mock_db.query().filter().first.return_value = mock_current
+        
+        with pytest.raises(HTTPException) as excinfo:
+            StockService.update_stock(mock_db, uuid.uuid4(), StockUpdate(quantity=-5))
+        
+        # Assertions
+        assert excinfo.value.status_code == 400
+        assert "Cannot reduce stock below reserved stock" in str(excinfo.value.detail)
+        assert "Reserved: 8" in str(excinfo.value.detail)
+    
+    def test_update_stock_with_expected_version(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_product = MagicMock()
+        mock_product.id = uuid.uuid4()
+        mock_product.stock = 15
+        mock_product.version = 4
+        mock_db.execute().scalars().first.return_value = mock_product
+        mock_db.execute.reset_mock()
+        
+        result = StockService.update_stock(
+            mock_db, mock_product.id, StockUpdate(quantity=5), expected_versions=[3, 4]
+        )
+        
+        # Assertions: the version is checked in the same UPDATE
+        assert result == mock_product
+        statement = mock_db.execute.call_args_list[0][0][0]
+        compiled = statement.compile(dialect=postgresql.dialect())
+        assert "AND products.version IN (__[POSTCOMPILE_version_2])" in str(compiled)
+        assert compiled.params["version_2"] == [3, 4]
+        mock_db.commit.assert_called_once()
+    
+    def test_update_stock_version_mismatch(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        # Mock statement result - no row updated, the product has moved on
+        mock_db.execute().scalars().first.return_value = None
+        mock_current = MagicMock()
+        mock_current.stock = 10
+        mock_current.reserved_stock = 0
+        mock_current.version = 5
+        mock_db.query().filter().first.return_value = mock_current
+        
+        with pytest.raises(HTTPException) as excinfo:
+            StockService.update_stock(mock_db, uuid.uuid4(), StockUpdate(quantity=-1), expected_versions=[3])
+        
+        # Assertions
+        assert excinfo.value.status_code == 412
+        assert "Current version: 5" in str(excinfo.value.detail)
         mock_db.commit.assert_not_called()
+        mock_db.rollback.assert_called_once()
     
     def test_handle_product_received_event(self):
         # Mock DB session
@@ -154,3 +242,303 @@ class TestStockService:
             stock_update = mock_update.call_args[0][2]
             assert stock_update.quantity == -5
             assert "Product sold" in stock_update.reason
+    
+    def _bulk_request(self, items, mode):
+        from app.schemas.product import BulkStockUpdateRequest
+        return BulkStockUpdateRequest(
+            items=[{"product_id": product_id, "quantity": quantity} for product_id, quantity in items],
+            mode=mode
+        )
+    
+    def test_bulk_update_stock_nets_items_per_product(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        product_id = uuid.uuid4()
+        mock_row = MagicMock()
+        mock_row.id = product_id
+        mock_row.stock = 12
+        mock_row.version = 3
+        mock_db.execute().all.return_value = [mock_row]
+        mock_db.execute.reset_mock()
+        
+        # Call the service
+        bulk_update = self._bulk_request([(product_id, 5), (product_id, -3)], "all_or_nothing")
+        result = StockService.bulk_update_stock(mock_db, bulk_update)
+        
+        # Assertions
+        assert result.committed == True
+        assert result.applied == 2
+        assert all(r.status == "applied" and r.stock == 12 for r in result.results)
+        assert mock_db.execute.call_count == 2
+        mock_db.commit.assert_called_once()
+        
+        # The rows are locked in product ID order before the update, so concurrent
+        # batches can't deadlock
+        lock = str(mock_db.execute.call_args_list[0][0][0].compile(dialect=postgresql.dialect()))
+        assert "ORDER BY products.id" in lock
+        assert "FOR UPDATE" in lock
+        
+        # One set-based statement with one netted row per product
+        statement = mock_db.execute.call_args_list[1][0][0]
+        compiled = statement.compile(dialect=postgresql.dialect())
+        assert "FROM (VALUES" in str(compiled)
+        assert 2 in compiled.params.values()
+        
+        # One event per product
+        message = self._outbox_events(mock_db)[0].payload
+        assert message["change_amount"] == 2
+        assert message["previous_stock"] == 10
+    
+    def test_bulk_update_stock_all_or_nothing_rolls_back(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        ok_id, missing_id, short_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        mock_row = MagicMock()
+        mock_row.id = ok_id
+        mock_row.stock = 7
+        
+        # UPDATE applies only ok_id; short_id exists but has too little stock, reserved_id
+        # has enough stock but most of it is reserved
+        reserved_id = uuid.uuid4()
+        mock_db.execute().all.return_value = [mock_row]
+        mock_short = MagicMock()
+        mock_short.id = short_id
+        mock_short.stock = 10
+        mock_short.reserved_stock = 0
+        mock_reserved = MagicMock()
+        mock_reserved.id = reserved_id
+        mock_reserved.stock = 10
+        mock_reserved.reserved_stock = 8
+        mock_db.query().filter().all.return_value = [mock_short, mock_reserved]
+        
+        # Call the service
+        bulk_update = self._bulk_request(
+            [(ok_id, 2), (missing_id, 1), (short_id, -100), (reserved_id, -5)], "all_or_nothing"
+        )
+        result = StockService.bulk_update_stock(mock_db, bulk_update)
+        
+        # Assertions
+        assert result.committed == False
+        assert [r.status for r in result.results] == ["rolled_back", "not_found", "insufficient_stock", "insufficient_stock"]
+        assert result.results[2].error.startswith("Cannot reduce stock below zero")
+        assert result.results[3].error.startswith("Cannot reduce stock below reserved stock")
+        assert result.applied == 0
+        assert result.failed == 4
+        mock_db.rollback.assert_called_once()
+        mock_db.commit.assert_not_called()
+        assert self._outbox_events(mock_db) == []
+    
+    def test_bulk_update_stock_best_effort_commits_successes(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        ok_id, missing_id = uuid.uuid4(), uuid.uuid4()
+        mock_row = MagicMock()
+        mock_row.id = ok_id
+        mock_row.stock = 7
+        mock_db.execute().all.return_value = [mock_row]
+        mock_db.query().filter().all.return_value = []
+        
+        # Call the service
+        bulk_update = self._bulk_request([(ok_id, 2), (missing_id, 1)], "best_effort")
+        result = StockService.bulk_update_stock(mock_db, bulk_update)
+        
+        # Assertions
+        assert result.committed == True
+        assert [r.status for r in result.results] == ["applied", "not_found"]
+        assert result.applied == 1
+        assert result.failed == 1
+        mock_db.commit.assert_called_once()
+    
+    def test_apply_stock_changes_falls_back_for_failed_products(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        ok_id, short_id = uuid.uuid4(), uuid.uuid4()
+        mock_row = MagicMock()
+        mock_row.id = ok_id
+        mock_row.stock = 8
+        mock_db.execute().all.return_value = [mock_row]
+        mock_db.execute.reset_mock()
+        
+        changes = [
+            self._stock_event("e1", ok_id, 5),
+            self._stock_event("e2", short_id, 2),
+            self._stock_event("e3", short_id, -50),
+            self._stock_event("e4", ok_id, -1),
+        ]
+        
+        # short_id's net change fails, so its changes are replayed one by one
+        not_enough = HTTPException(status_code=400, detail="Cannot reduce stock below zero")
+        with patch.object(StockService, 'record_processed_events', return_value={"e1", "e2", "e3", "e4"}), \
+             patch.object(StockService, 'update_stock', side_effect=[MagicMock(), not_enough]) as mock_update:
+            errors = StockService.apply_stock_changes(mock_db, changes)
+        
+        # Assertions
+        assert errors == [None, None, not_enough, None]
+        assert mock_update.call_count == 2
+        assert [c[0][2].quantity for c in mock_update.call_args_list] == [2, -50]
+        assert [c[1]["event_id"] for c in mock_update.call_args_list] == ["e2", "e3"]
+        mock_db.commit.assert_called_once()
+        
+        # The replayed events are un-recorded from the batch transaction
+        delete_statement = mock_db.execute.call_args_list[-1][0][0]
+        assert "DELETE FROM processed_events" in str(delete_statement)
+        
+        # One event for the netted batch update of ok_id
+        message = self._outbox_events(mock_db)[0].payload
+        assert message["change_amount"] == 4
+        assert message["previous_stock"] == 4
+        
+        # One ledger movement per applied event, with the stock it left
+        movements = mock_db.connection().connection.cursor().copy_expert.call_args[0][1].getvalue().splitlines()
+        assert [line.split("\t")[1:3] for line in movements] == [["5", "9"], ["-1", "8"]]
+        assert [line.split("\t")[4] for line in movements] == ["e1", "e4"]
+    
+    def test_apply_stock_changes_skips_processed_events(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        product_id = uuid.uuid4()
+        mock_row = MagicMock()
+        mock_row.id = product_id
+        mock_row.stock = 13
+        mock_db.execute().all.return_value = [mock_row]
+        
+        # e1 was processed before and e2 is delivered twice in the batch
+        changes = [
+            self._stock_event("e1", product_id, 5),
+            self._stock_event("e2", product_id, 3),
+            self._stock_event("e2", product_id, 3),
+        ]
+        with patch.object(StockService, 'record_processed_events', return_value={"e2"}):
+            errors = StockService.apply_stock_changes(mock_db, changes)
+        
+        # Assertions
+        assert errors == [None, None, None]
+        message = self._outbox_events(mock_db)[0].payload
+        assert message["change_amount"] == 3
+    
+    def test_record_processed_events_inserts_on_conflict_do_nothing(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_row = MagicMock()
+        mock_row.event_id = "e1"
+        mock_db.execute().all.return_value = [mock_row]
+        mock_db.execute.reset_mock()
+        
+        new_ids = StockService.record_processed_events(mock_db, ["e1", "e2", "e1"])
+        
+        # Assertions
+        assert new_ids == {"e1"}
+        statement = mock_db.execute.call_args[0][0]
+        compiled = statement.compile(dialect=postgresql.dialect())
+        assert "ON CONFLICT (event_id) DO NOTHING" in str(compiled)
+        assert sorted(compiled.params.values()) == ["e1", "e2"]
+    
+    def test_update_stock_rejects_processed_event(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        
+        with patch.object(StockService, 'record_processed_events', return_value=set()):
+            with pytest.raises(HTTPException) as excinfo:
+                StockService.update_stock(mock_db, uuid.uuid4(), StockUpdate(quantity=1), event_id="e1")
+        
+        # Assertions
+        assert excinfo.value.status_code == 409
+        mock_db.rollback.assert_called_once()
+        mock_db.commit.assert_not_called()
+    
+    def _outbox_events(self, mock_db):
+        from app.models.outbox_event import OutboxEvent
+        return [c[0][0] for c in mock_db.add.call_args_list if isinstance(c[0][0], OutboxEvent)]
+    
+    def _stock_event(self, event_id, product_id, quantity):
+        from app.schemas.product import StockEvent
+        return StockEvent(event_id=event_id, product_id=product_id, quantity=quantity)
+    
+    def _locked_row(self, product_id, stock, reserved_stock=0):
+        row = MagicMock()
+        row.id = product_id
+        row.stock = stock
+        row.reserved_stock = reserved_stock
+        return row
+    
+    def test_apply_coalesced_updates_applies_additions_before_removals(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        product_id = uuid.uuid4()
+        
+        # Mock product as returned by the UPDATE ... RETURNING
+        mock_product = MagicMock()
+        mock_product.id = product_id
+        mock_product.stock = 2
+        
+        select_result, update_result = MagicMock(), MagicMock()
+        select_result.all.return_value = [self._locked_row(product_id, 5)]
+        update_result.scalars().all.return_value = [mock_product]
+        mock_db.execute.side_effect = [select_result, update_result]
+        
+        # The removal of 8 only fits once the addition of 5 is applied
+        updates = [
+            (product_id, StockUpdate(quantity=-8)),
+            (product_id, StockUpdate(quantity=5)),
+            (product_id, StockUpdate(quantity=-4)),
+        ]
+        with patch('app.services.stock_service.LedgerService.record_movements') as mock_record:
+            results = StockService.apply_coalesced_updates(mock_db, updates)
+        
+        # Assertions
+        assert results[0] == mock_product
+        assert results[1] == mock_product
+        assert isinstance(results[2], HTTPException)
+        assert results[2].status_code == 400
+        
+        # The products are locked in product ID order
+        lock = str(mock_db.execute.call_args_list[0][0][0].compile(dialect=postgresql.dialect()))
+        assert "ORDER BY products.id" in lock
+        
+        # One UPDATE for the product with the net delta
+        update_statement = mock_db.execute.call_args_list[1][0][0]
+        compiled = update_statement.compile(dialect=postgresql.dialect())
+        assert "UPDATE products SET stock=(products.stock + deltas.delta)" in str(compiled)
+        assert [movement.delta for movement in mock_record.call_args[0][1]] == [5, -8]
+        mock_db.commit.assert_called_once()
+        
+        message = self._outbox_events(mock_db)[0].payload
+        assert message["change_amount"] == -3
+        assert message["previous_stock"] == 5
+    
+    def test_apply_coalesced_updates_rejects_unknown_products(self):
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.execute().all.return_value = []
+        mock_db.execute.reset_mock()
+        
+        results = StockService.apply_coalesced_updates(mock_db, [(uuid.uuid4(), StockUpdate(quantity=1))])
+        
+        # Assertions
+        assert results[0].status_code == 404
+        mock_db.execute.assert_called_once()
+        mock_db.commit.assert_called_once()
+    
+    def test_purge_processed_events_deletes_in_batches(self):
+        # Mock DB session: a full batch, then a partial one
+        mock_db = MagicMock()
+        full, partial = MagicMock(), MagicMock()
+        full.rowcount = 2
+        partial.rowcount = 1
+        mock_db.execute.side_effect = [full, partial]
+        
+        deleted = StockService.purge_processed_events(mock_db, retention_hours=24, batch_size=2)
+        
+        # Assertions
+        assert deleted == 3
+        assert mock_db.execute.call_count == 2
+        assert mock_db.commit.call_count == 2
+        sql = str(mock_db.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+        assert "DELETE FROM processed_events WHERE processed_events.event_id IN" in sql
+        assert "processed_events.processed_at <" in sql
+        assert "LIMIT" in sql
@@ -12,13 +12,73 @@ CREATE TABLE IF NOT EXISTS products (
     id UUID PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     stock INTEGER NOT NULL DEFAULT 0,
+    reserved_stock INTEGER NOT NULL DEFAULT 0,
     supplier_id UUID REFERENCES suppliers(id),
-    is_active BOOLEAN NOT NULL DEFAULT TRUE
+    external_id VARCHAR(255),
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    version INTEGER NOT NULL DEFAULT 0
 );
 
+-- Create stock reservations table (stock held during checkout until committed, released or expired)
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id UUID PRIMARY KEY,
+    product_id UUID NOT NULL REFERENCES products(id),
+    quantity INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'active',
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Create processed events table (event IDs already applied, for idempotent consumption)
+CREATE TABLE IF NOT EXISTS processed_events (
+    event_id VARCHAR(255) PRIMARY KEY,
+    processed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Create outbox table (events committed with their stock change, published by the outbox relay)
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id BIGSERIAL PRIMARY KEY,
+    routing_key VARCHAR(255) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Create stock movements ledger, partitioned by month (retention drops whole partitions)
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id BIGSERIAL NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    product_id UUID NOT NULL,
+    delta INTEGER NOT NULL,
+    resulting_stock INTEGER NOT NULL,
+    reason TEXT,
+    event_id VARCHAR(255),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Partitions for the current and next two months; the service creates later ones
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR i IN 0..2 LOOP
+        month_start := (date_trunc('month', NOW()) + make_interval(months => i))::date;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF stock_movements FOR VALUES FROM (%L) TO (%L)',
+            'stock_movements_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::date
+        );
+    END LOOP;
+END $$;
+
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_products_supplier_id ON products(supplier_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_products_supplier_external_id ON products(supplier_id, external_id);
 CREATE INDEX IF NOT EXISTS idx_products_is_active ON products(is_active);
+CREATE INDEX IF NOT EXISTS idx_products_active_stock ON products(stock) WHERE is_active;
+CREATE INDEX IF NOT EXISTS ix_processed_events_processed_at ON processed_events(processed_at);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_active_expires ON stock_reservations(expires_at) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_stock_movements_product_created ON stock_movements(product_id, created_at);
 
 -- Insert some sample data
 INSERT INTO suppliers (id, name, contact_email) VALUES 
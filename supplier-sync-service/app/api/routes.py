@@ -9,7 +9,7 @@ from app.schemas.supplier import SupplierResponse, SyncResult, SyncRequest
 from app.schemas.sync_log import SyncLogResponse
 from app.models.supplier import Supplier
 from app.models.sync_log import SupplierSyncLog
-from app.tasks import sync_supplier as celery_sync_supplier
+from app.tasks import sync_supplier as celery_sync_supplier, sync_all_suppliers as celery_sync_all_suppliers
 
 supplier_router = APIRouter()
 
@@ -68,7 +68,7 @@ async def sync_suppliers(
         return results
     else:
         # Queue sync task for all suppliers
-        celery_sync_supplier.delay("all", sync_request.force)
+        celery_sync_all_suppliers.delay(sync_request.force)
         
         # Return immediate response
         suppliers = db.query(Supplier).all()
@@ -81,12 +81,14 @@ async def sync_suppliers(
 @supplier_router.post("/{supplier_id}/sync", response_model=SyncResult)
 async def sync_supplier(
     supplier_id: UUID,
-    force: bool = False,
     background_tasks: BackgroundTasks,
+    force: bool = False,
     db: Session = Depends(get_db)
 ):
     """
-    Trigger synchronization for a specific supplier
+    Trigger synchronization for a specific supplier.
+    
+    With force, the supplier is synced even if it was synced recently or its catalog is unchanged.
     """
     # Verify supplier exists
     supplier = db.query(Supplier).filter(Supplier.id == supplier_id).first()
@@ -49,31 +49,65 @@ class Settings(BaseSettings):
     )
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "rpc://")
     
-    # Supplier API endpoints
+    # Supplier API HTTP clients (one pooled client per base URL and process)
+    SUPPLIER_API_MAX_CONNECTIONS: int = int(os.getenv("SUPPLIER_API_MAX_CONNECTIONS", "20"))
+    SUPPLIER_API_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("SUPPLIER_API_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    SUPPLIER_API_KEEPALIVE_EXPIRY_S: float = float(os.getenv("SUPPLIER_API_KEEPALIVE_EXPIRY_S", "30"))
+    SUPPLIER_API_HTTP2: bool = os.getenv("SUPPLIER_API_HTTP2", "False").lower() == "true"
+    # Defaults for suppliers without their own "timeout" / "connect_timeout"
+    SUPPLIER_API_TIMEOUT_S: float = float(os.getenv("SUPPLIER_API_TIMEOUT_S", "30"))
+    SUPPLIER_API_CONNECT_TIMEOUT_S: float = float(os.getenv("SUPPLIER_API_CONNECT_TIMEOUT_S", "10"))
+    
+    # Catalog page size for suppliers with "pagination" that don't set their own "page_size"
+    SUPPLIER_CATALOG_PAGE_SIZE: int = int(os.getenv("SUPPLIER_CATALOG_PAGE_SIZE", "500"))
+    
+    # Supplier API endpoints. Optional keys: "items_keys" (fields holding the products
+    # in a catalog response), "pagination" (see SupplierApiClient.iter_catalog),
+    # "timeout" and "connect_timeout"
     SUPPLIER_APIS: Dict[str, Dict[str, Any]] = {
         "supplier1": {
             "name": "ABC Suppliers",
             "base_url": "https://api.abcsuppliers.com/v1",
             "api_key": os.getenv("SUPPLIER1_API_KEY", ""),
             "catalog_endpoint": "/catalog",
+            "items_keys": ["products"],
             "auth_type": "header",  # header, query, basic
             "auth_header": "X-API-Key",
+            "timeout": 30.0,
         },
         "supplier2": {
             "name": "XYZ Distributors",
             "base_url": "https://api.xyzdist.com/v2",
             "api_key": os.getenv("SUPPLIER2_API_KEY", ""),
             "catalog_endpoint": "/products",
+            "items_keys": ["items"],
             "auth_type": "query",
             "auth_param": "api_key",
+            "timeout": 60.0,
         }
     }
     
     # Sync schedule (cron format)
     SYNC_SCHEDULE: str = os.getenv("SYNC_SCHEDULE", "0 0 * * *")  # Default: daily at midnight
+    # Suppliers synced at the same time by sync_all_suppliers, each with its own DB connection
+    SYNC_MAX_CONCURRENCY: int = int(os.getenv("SYNC_MAX_CONCURRENCY", "8"))
+    # Time limit of one supplier sync, after which it is recorded as failed
+    SYNC_SUPPLIER_TIMEOUT_S: int = int(os.getenv("SYNC_SUPPLIER_TIMEOUT_S", "600"))
+    # Suppliers synced successfully less than this ago are skipped unless the sync is forced
+    SYNC_MIN_INTERVAL_S: int = int(os.getenv("SYNC_MIN_INTERVAL_S", "300"))
+    # Downloaded catalogs are kept in memory up to this size, then spooled to disk
+    SYNC_SPOOL_MAX_MEMORY_BYTES: int = int(os.getenv("SYNC_SPOOL_MAX_MEMORY_BYTES", str(16 * 1024 * 1024)))
+    # Catalog products applied to the database at a time during a sync (one upsert
+    # statement, 7 parameters per product; PostgreSQL allows 65535 per statement)
+    SYNC_CHUNK_SIZE: int = int(os.getenv("SYNC_CHUNK_SIZE", "1000"))
     
     # Event topics
     SUPPLIER_DATA_UPDATED_TOPIC: str = "supplier-data-updated"
+    # Exchange and topic of the stock-updated events consumed by stock-checker
+    STOCK_EVENTS_EXCHANGE: str = "inventory_events"
+    STOCK_UPDATED_TOPIC: str = "stock-updated"
+    # application/json, or application/msgpack for compact binary events
+    EVENTS_CONTENT_TYPE: str = os.getenv("EVENTS_CONTENT_TYPE", "application/json")
     
     class Config:
         case_sensitive = True
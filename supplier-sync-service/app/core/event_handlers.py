@@ -6,6 +6,7 @@ from sqlalchemy import text
 
 from app.core.config import settings
 from app.db.database import engine, Base
+from app.services.supplier_api_client import supplier_http_clients
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +63,6 @@ def stop_app_handler(app: FastAPI) -> Callable:
     """
     async def shutdown() -> None:
         logger.info("Running app shutdown handler.")
-        # Add cleanup tasks here
+        await supplier_http_clients.close()
     
     return shutdown
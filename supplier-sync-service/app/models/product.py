@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -8,12 +8,19 @@ from app.db.database import Base
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Conflict target of the catalog upsert
+        Index("uq_products_supplier_external_id", "supplier_id", "external_id", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     stock = Column(Integer, nullable=False, default=0)
+    reserved_stock = Column(Integer, nullable=False, default=0)  # Held by stock-updater reservations
     supplier_id = Column(UUID(as_uuid=True), ForeignKey("suppliers.id"))
+    external_id = Column(String, nullable=True)  # Product ID in the supplier's catalog
     is_active = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every change readers can see
 
     # Relationship
     supplier = relationship("Supplier", back_populates="products")
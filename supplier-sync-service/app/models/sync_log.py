@@ -13,14 +13,15 @@ class SupplierSyncLog(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     supplier_id = Column(UUID(as_uuid=True), ForeignKey("suppliers.id"), nullable=False)
     sync_type = Column(String, nullable=False)  # 'scheduled', 'manual'
-    status = Column(String, nullable=False)  # 'success', 'failed', 'partial'
+    status = Column(String, nullable=False)  # 'in_progress', 'success', 'unchanged', 'failed', 'partial'
     started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     completed_at = Column(DateTime, nullable=True)
     products_added = Column(Integer, default=0)
     products_updated = Column(Integer, default=0)
     products_deactivated = Column(Integer, default=0)
     error_message = Column(String, nullable=True)
-    metadata = Column(JSON, nullable=True)
+    # "metadata" is reserved by the declarative API, so the column is mapped under another name
+    sync_metadata = Column("metadata", JSON, nullable=True)
     
     # Relationship
     supplier = relationship("Supplier")
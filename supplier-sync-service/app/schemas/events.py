@@ -0,0 +1,43 @@
+from datetime import datetime
+from uuid import UUID
+
+import msgspec
+
+
+# Content types encoded as MessagePack; anything else is sent as JSON
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+class SupplierDataUpdatedV1(msgspec.Struct, frozen=True, tag_field="schema_version", tag=1):
+    supplier_id: UUID
+    timestamp: datetime
+    event_type: str = "supplier_data_updated"
+
+
+class StockUpdated(msgspec.Struct, frozen=True):
+    """
+    Same shape as the stock-updated events of stock-updater, plus the name and
+    active state a sync can change; always sent as JSON
+    """
+    product_id: UUID
+    name: str
+    new_stock: int
+    reserved_stock: int
+    is_active: bool
+    version: int
+    timestamp: datetime
+    reason: str = "Supplier sync"
+    event_type: str = "stock_updated"
+
+
+_json_encoder = msgspec.json.Encoder()
+_msgpack_encoder = msgspec.msgpack.Encoder()
+
+
+def encode_event(event: msgspec.Struct, content_type: str) -> bytes:
+    """
+    Encode an event for the given content type
+    """
+    if content_type in MSGPACK_CONTENT_TYPES:
+        return _msgpack_encoder.encode(event)
+    return _json_encoder.encode(event)
@@ -35,7 +35,7 @@ class SupplierResponse(SupplierBase):
 
 class SyncResult(BaseModel):
     supplier_id: UUID
-    status: str = Field(..., description="Status of the sync operation: success, failed, partial")
+    status: str = Field(..., description="Status of the sync operation: success, unchanged, skipped, failed, partial")
     products_added: int = 0
     products_updated: int = 0
     products_deactivated: int = 0
@@ -45,4 +45,4 @@ class SyncResult(BaseModel):
 
 class SyncRequest(BaseModel):
     supplier_ids: Optional[List[UUID]] = Field(default=None, description="List of supplier IDs to sync. If empty, all suppliers will be synced.")
-    force: bool = Field(default=False, description="Force sync even if recently synced")
+    force: bool = Field(default=False, description="Force sync even if recently synced or the catalog is unchanged")
@@ -1,7 +1,7 @@
 from uuid import UUID
 from typing import Optional, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class SyncLogBase(BaseModel):
@@ -33,6 +33,8 @@ class SyncLogUpdate(BaseModel):
 
 class SyncLogResponse(SyncLogBase):
     id: UUID
+    # Read from the model's sync_metadata attribute (the "metadata" column)
+    metadata: Optional[Dict[str, Any]] = Field(default=None, validation_alias="sync_metadata")
     
     class Config:
         from_attributes = True
@@ -1,6 +1,9 @@
+import asyncio
 import logging
+import threading
 import httpx
-from typing import Dict, Any, List, Optional, Union
+import ijson
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple, Union
 from datetime import datetime
 
 from app.core.config import settings
@@ -9,6 +12,61 @@ from app.schemas.product import SupplierProductData
 logger = logging.getLogger(__name__)
 
 
+class SupplierHttpClients:
+    """
+    One pooled, keep-alive HTTP client per supplier base URL, shared by every
+    SupplierApiClient in the process so connections (and their TLS sessions) are reused
+    """
+    
+    def __init__(self):
+        self._clients: Dict[str, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, base_url: str) -> httpx.AsyncClient:
+        """
+        Client for a base URL, created on first use in the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(base_url)
+            # Connections belong to the loop they were opened in, so a new loop needs a new client
+            if entry is None or entry[0] is not loop:
+                entry = (loop, self._create_client(base_url))
+                self._clients[base_url] = entry
+            return entry[1]
+    
+    async def close(self) -> None:
+        """
+        Close the clients of the running event loop and forget all of them
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        for client_loop, client in entries:
+            if client_loop is loop:
+                await client.aclose()
+    
+    @staticmethod
+    def _create_client(base_url: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            http2=settings.SUPPLIER_API_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.SUPPLIER_API_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPPLIER_API_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.SUPPLIER_API_KEEPALIVE_EXPIRY_S,
+            ),
+            timeout=httpx.Timeout(
+                settings.SUPPLIER_API_TIMEOUT_S,
+                connect=settings.SUPPLIER_API_CONNECT_TIMEOUT_S
+            ),
+        )
+
+
+supplier_http_clients = SupplierHttpClients()
+
+
 class SupplierApiClient:
     """Client for interacting with supplier APIs"""
 
@@ -30,22 +88,23 @@ class SupplierApiClient:
         self.base_url = self.config["base_url"]
         self.api_key = self.config["api_key"]
         self.auth_type = self.config["auth_type"]
+        self.timeout = httpx.Timeout(
+            self.config.get("timeout", settings.SUPPLIER_API_TIMEOUT_S),
+            connect=self.config.get("connect_timeout", settings.SUPPLIER_API_CONNECT_TIMEOUT_S)
+        )
         
-    async def _make_request(self, endpoint: str, method: str = "GET", params: Dict = None) -> Dict[str, Any]:
-        """
-        Make authenticated request to supplier API
+        # Validators and result of the last conditional catalog fetch (see iter_catalog)
+        self.catalog_etag: Optional[str] = None
+        self.catalog_last_modified: Optional[str] = None
+        self.catalog_not_modified = False
         
-        Args:
-            endpoint: API endpoint (will be appended to base_url)
-            method: HTTP method
-            params: Query parameters
-            
-        Returns:
-            API response as dictionary
+    def _prepare_request(self, endpoint: str, params: Dict = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """
+        URL, headers and query parameters of an authenticated request
         """
         url = f"{self.base_url}{endpoint}"
         headers = {}
-        query_params = params or {}
+        query_params = dict(params or {})
         
         # Add authentication
         if self.auth_type == "header":
@@ -56,18 +115,34 @@ class SupplierApiClient:
             # Basic auth would be handled by the client
             pass
         
+        return url, headers, query_params
+    
+    async def _make_request(self, endpoint: str, method: str = "GET", params: Dict = None) -> Dict[str, Any]:
+        """
+        Make authenticated request to supplier API
+        
+        Args:
+            endpoint: API endpoint (will be appended to base_url)
+            method: HTTP method
+            params: Query parameters
+            
+        Returns:
+            API response as dictionary
+        """
+        url, headers, query_params = self._prepare_request(endpoint, params)
+        
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.request(
-                    method=method,
-                    url=url,
-                    headers=headers,
-                    params=query_params,
-                    timeout=30.0
-                )
-                
-                response.raise_for_status()
-                return response.json()
+            client = supplier_http_clients.get(self.base_url)
+            response = await client.request(
+                method=method,
+                url=url,
+                headers=headers,
+                params=query_params,
+                timeout=self.timeout
+            )
+            
+            response.raise_for_status()
+            return response.json()
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error for {url}: {e.response.status_code} - {e.response.text}")
             raise
@@ -78,76 +153,236 @@ class SupplierApiClient:
             logger.error(f"Unexpected error for {url}: {str(e)}")
             raise
     
-    async def get_catalog(self, params: Dict = None) -> List[SupplierProductData]:
+    async def _stream_items(
+        self,
+        endpoint: str,
+        params: Dict,
+        page: Dict[str, Any],
+        extra_headers: Dict[str, str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Get product catalog from supplier
+        Stream the product objects of one catalog response, parsing the body incrementally
+        
+        Args:
+            endpoint: API endpoint (will be appended to base_url)
+            params: Query parameters
+            page: Receives the next page cursor ("cursor"), "has_more" flag and catalog
+                "total" if the response has them, the response's "etag" and
+                "last_modified", and "not_modified" on a 304
+            extra_headers: Additional request headers
+            
+        Yields:
+            Raw product objects, one at a time
+        """
+        url, headers, query_params = self._prepare_request(endpoint, params)
+        headers.update(extra_headers or {})
+        item_prefixes = {f"{key}.item" for key in self.config.get("items_keys", ["products", "items"])}
+        pagination = self.config.get("pagination", {})
+        cursor_field = pagination.get("cursor_field", "next_cursor")
+        has_more_field = pagination.get("has_more_field", "has_more")
+        total_field = pagination.get("total_field", "total")
+        
+        try:
+            client = supplier_http_clients.get(self.base_url)
+            async with client.stream("GET", url, headers=headers, params=query_params, timeout=self.timeout) as response:
+                if response.status_code == 304:
+                    page["not_modified"] = True
+                    return
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+                page["etag"] = response.headers.get("ETag")
+                page["last_modified"] = response.headers.get("Last-Modified")
+                
+                builder = None
+                events = ijson.parse_async(_ByteStreamReader(response.aiter_bytes()), use_float=True)
+                async for prefix, event, value in events:
+                    if builder is not None:
+                        builder.event(event, value)
+                        if prefix in item_prefixes and event == "end_map":
+                            yield builder.value
+                            builder = None
+                    elif prefix in item_prefixes and event == "start_map":
+                        builder = ijson.ObjectBuilder()
+                        builder.event(event, value)
+                    elif prefix == cursor_field and event in ("string", "number"):
+                        page["cursor"] = value
+                    elif prefix == has_more_field and event == "boolean":
+                        page["has_more"] = value
+                    elif prefix == total_field and event == "number":
+                        page["total"] = int(value)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error for {url}: {e.response.status_code} - {e.response.text}")
+            raise
+        except httpx.RequestError as e:
+            logger.error(f"Request error for {url}: {str(e)}")
+            raise
+    
+    async def iter_catalog(
+        self,
+        params: Dict = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> AsyncIterator[SupplierProductData]:
+        """
+        Stream the product catalog from supplier, page by page
+        
+        The paging style is set by "pagination" in the supplier config: "page"
+        (page number and size), "offset" (offset and limit) or "cursor" (cursor
+        returned in each response). Page and offset catalogs end with an empty page,
+        or as told by a has_more flag or total count in the responses; a short page
+        is not the last one, as suppliers may cap the page size. A catalog that ends
+        before its total raises, so a sync never treats the rest as removed.
+        Without pagination the catalog is a single response,
+        which is requested conditionally with the given validators: on a 304
+        nothing is yielded and catalog_not_modified is set. The validators of the
+        response are kept in catalog_etag and catalog_last_modified.
         
         Args:
             params: Additional query parameters
+            etag: ETag of the catalog from a previous fetch
+            last_modified: Last-Modified of the catalog from a previous fetch
             
-        Returns:
-            List of products from supplier
+        Yields:
+            Products from supplier, normalized to our schema
         """
         endpoint = self.config["catalog_endpoint"]
+        pagination = self.config.get("pagination", {})
+        style = pagination.get("style")
+        page_size = pagination.get("page_size", settings.SUPPLIER_CATALOG_PAGE_SIZE)
+        page_number = pagination.get("first_page", 1)
+        offset = 0
+        cursor = None
+        total = None
         
-        try:
-            response = await self._make_request(endpoint, params=params)
+        # A page can't tell whether the rest of a paginated catalog changed, so only whole catalogs are conditional
+        conditional_headers = {}
+        if style is None:
+            if etag:
+                conditional_headers["If-None-Match"] = etag
+            if last_modified:
+                conditional_headers["If-Modified-Since"] = last_modified
+        self.catalog_etag = None
+        self.catalog_last_modified = None
+        self.catalog_not_modified = False
+        
+        while True:
+            page_params = dict(params or {})
+            if style == "page":
+                page_params[pagination.get("page_param", "page")] = page_number
+                page_params[pagination.get("size_param", "per_page")] = page_size
+            elif style == "offset":
+                page_params[pagination.get("offset_param", "offset")] = offset
+                page_params[pagination.get("limit_param", "limit")] = page_size
+            elif style == "cursor":
+                page_params[pagination.get("size_param", "limit")] = page_size
+                if cursor is not None:
+                    page_params[pagination.get("cursor_param", "cursor")] = cursor
             
-            # Different suppliers might have different response formats
-            # Here we normalize the data to our schema
-            products_data = []
+            page = {}
+            count = 0
+            try:
+                async for item in self._stream_items(endpoint, page_params, page, conditional_headers):
+                    count += 1
+                    yield self._normalize(item)
+            except Exception as e:
+                logger.error(f"Error fetching catalog from {self.name}: {str(e)}")
+                raise
             
-            # Handle different response formats based on supplier
-            if self.supplier_code == "supplier1":
-                # ABC Suppliers format
-                for item in response.get("products", []):
-                    products_data.append(
-                        SupplierProductData(
-                            external_id=str(item.get("id")),
-                            name=item.get("name"),
-                            stock=item.get("inventory", 0),
-                            price=item.get("price"),
-                            description=item.get("description"),
-                            metadata={
-                                "category": item.get("category"),
-                                "sku": item.get("sku"),
-                                "last_updated": item.get("updated_at")
-                            }
-                        )
-                    )
-            elif self.supplier_code == "supplier2":
-                # XYZ Distributors format
-                for item in response.get("items", []):
-                    products_data.append(
-                        SupplierProductData(
-                            external_id=str(item.get("product_id")),
-                            name=item.get("product_name"),
-                            stock=item.get("stock_count", 0),
-                            price=item.get("wholesale_price"),
-                            description=item.get("product_description"),
-                            metadata={
-                                "category": item.get("category"),
-                                "manufacturer": item.get("manufacturer"),
-                                "updated": item.get("last_update")
-                            }
-                        )
-                    )
-            else:
-                # Generic format - try to map fields
-                items = response.get("products", []) or response.get("items", []) or []
-                for item in items:
-                    products_data.append(
-                        SupplierProductData(
-                            external_id=str(item.get("id", "")),
-                            name=item.get("name", "Unknown Product"),
-                            stock=item.get("stock", 0) or item.get("inventory", 0) or 0,
-                            price=item.get("price"),
-                            description=item.get("description"),
-                            metadata=item
-                        )
-                    )
+            if style is None:
+                self.catalog_etag = page.get("etag")
+                self.catalog_last_modified = page.get("last_modified")
+                self.catalog_not_modified = page.get("not_modified", False)
+                return
+            if style == "cursor":
+                cursor = page.get("cursor")
+                if count == 0 or not cursor:
+                    return
+                continue
             
-            return products_data
-        except Exception as e:
-            logger.error(f"Error fetching catalog from {self.name}: {str(e)}")
-            raise
+            total = page.get("total", total)
+            offset += count
+            if count == 0 or page.get("has_more") is False or (total is not None and offset >= total):
+                if total is not None and offset < total:
+                    raise Exception(f"Catalog from {self.name} ended after {offset} of {total} products")
+                return
+            page_number += 1
+    
+    async def get_catalog(self, params: Dict = None) -> List[SupplierProductData]:
+        """
+        Get product catalog from supplier
+        
+        Loads the whole catalog in memory; use iter_catalog for large catalogs.
+        
+        Args:
+            params: Additional query parameters
+            
+        Returns:
+            List of products from supplier
+        """
+        return [product async for product in self.iter_catalog(params)]
+    
+    def _normalize(self, item: Dict[str, Any]) -> SupplierProductData:
+        """
+        Map a product in the supplier's format to our schema
+        """
+        # Handle different response formats based on supplier
+        if self.supplier_code == "supplier1":
+            # ABC Suppliers format
+            return SupplierProductData(
+                external_id=str(item.get("id")),
+                name=item.get("name"),
+                stock=item.get("inventory", 0),
+                price=item.get("price"),
+                description=item.get("description"),
+                metadata={
+                    "category": item.get("category"),
+                    "sku": item.get("sku"),
+                    "last_updated": item.get("updated_at")
+                }
+            )
+        elif self.supplier_code == "supplier2":
+            # XYZ Distributors format
+            return SupplierProductData(
+                external_id=str(item.get("product_id")),
+                name=item.get("product_name"),
+                stock=item.get("stock_count", 0),
+                price=item.get("wholesale_price"),
+                description=item.get("product_description"),
+                metadata={
+                    "category": item.get("category"),
+                    "manufacturer": item.get("manufacturer"),
+                    "updated": item.get("last_update")
+                }
+            )
+        else:
+            # Generic format - try to map fields
+            return SupplierProductData(
+                external_id=str(item.get("id", "")),
+                name=item.get("name", "Unknown Product"),
+                stock=item.get("stock", 0) or item.get("inventory", 0) or 0,
+                price=item.get("price"),
+                description=item.get("description"),
+                metadata=item
+            )
+
+
+class _ByteStreamReader:
+    """
+    File-like view of an async byte stream, as read by ijson
+    """
+    
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+        self._buffer = b""
+    
+    async def read(self, size: int = -1) -> bytes:
+        while not self._buffer:
+            try:
+                self._buffer = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return b""
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
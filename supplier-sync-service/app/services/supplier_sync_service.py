@@ -1,33 +1,52 @@
+import asyncio
+import hashlib
 import logging
-import json
-from typing import List, Dict, Any, Optional, Tuple
+import tempfile
+import threading
+import uuid
+from typing import IO, Callable, Iterator, List, Dict, Any, Optional, Tuple, TypeVar
 from uuid import UUID
 from datetime import datetime
+from sqlalchemy import Column, MetaData, String, Table, exists, func, literal_column, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 import pika
 
 from app.models.supplier import Supplier
 from app.models.product import Product
 from app.models.sync_log import SupplierSyncLog
+from app.schemas.events import StockUpdated, SupplierDataUpdatedV1, encode_event
 from app.schemas.supplier import SyncResult
 from app.schemas.sync_log import SyncLogCreate, SyncLogUpdate
 from app.schemas.product import SupplierProductData
 from app.services.supplier_api_client import SupplierApiClient
 from app.core.config import settings
+from app.db.database import SessionLocal
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Temporary table of the external IDs in the catalog being synced (see _create_seen_staging_table)
+SYNC_SEEN_PRODUCTS = Table("sync_seen_products", MetaData(), Column("external_id", String, primary_key=True))
+
 
 class SupplierSyncService:
     @staticmethod
-    async def sync_supplier(db: Session, supplier_id: UUID, force: bool = False) -> SyncResult:
+    async def sync_supplier(
+        db: Session,
+        supplier_id: UUID,
+        force: bool = False,
+        session_factory: Callable[[], Session] = SessionLocal
+    ) -> SyncResult:
         """
         Synchronize products from a specific supplier
         
         Args:
             db: Database session
             supplier_id: ID of the supplier to sync
-            force: Force sync even if recently synced
+            force: Force sync even if recently synced or the catalog is unchanged
+            session_factory: Creates the session the catalog is written with, in a worker thread
             
         Returns:
             SyncResult with sync status and statistics
@@ -49,6 +68,10 @@ class SupplierSyncService:
                 error_message=f"Supplier has no valid API code configured"
             )
         
+        # Skip suppliers synced less than SYNC_MIN_INTERVAL_S ago
+        if not force and SupplierSyncService._synced_recently(supplier):
+            return SyncResult(supplier_id=supplier_id, status="skipped")
+        
         # Create sync log entry
         sync_log = SupplierSyncLog(
             supplier_id=supplier_id,
@@ -60,90 +83,56 @@ class SupplierSyncService:
         db.commit()
         db.refresh(sync_log)
         
+        catalog = None
         try:
             # Initialize API client
             api_client = SupplierApiClient(supplier.api_code)
+            sync_metadata = dict(supplier.sync_metadata or {})
             
-            # Fetch products from supplier API
-            supplier_products = await api_client.get_catalog()
-            
-            # Process products
-            products_added = 0
-            products_updated = 0
-            products_deactivated = 0
-            
-            # Get existing products for this supplier
-            existing_products = {
-                p.external_id: p for p in 
-                db.query(Product).filter(Product.supplier_id == supplier_id).all()
-                if p.external_id  # Only include products with external_id
-            }
-            
-            # Track processed external IDs
-            processed_external_ids = set()
+            # Download the catalog, conditionally unless forced, and hash it
+            catalog, catalog_hash = await SupplierSyncService._spool_catalog(
+                api_client,
+                etag=None if force else sync_metadata.get("catalog_etag"),
+                last_modified=None if force else sync_metadata.get("catalog_last_modified")
+            )
             
-            # Process each product from supplier
-            for product_data in supplier_products:
-                external_id = product_data.external_id
-                processed_external_ids.add(external_id)
+            # Nothing to write when the catalog hasn't changed since the last sync
+            if api_client.catalog_not_modified or (not force and catalog_hash == sync_metadata.get("catalog_hash")):
+                unchanged_sync_metadata = {**sync_metadata, "last_sync_status": "unchanged"}
+                # A catalog with the same content may still come with new validators, to be sent next time
+                if not api_client.catalog_not_modified:
+                    unchanged_sync_metadata["catalog_etag"] = api_client.catalog_etag
+                    unchanged_sync_metadata["catalog_last_modified"] = api_client.catalog_last_modified
+                supplier.last_sync_at = datetime.utcnow().isoformat()
+                supplier.sync_metadata = unchanged_sync_metadata
+                sync_log.status = "unchanged"
+                sync_log.completed_at = datetime.utcnow()
+                db.commit()
                 
-                if external_id in existing_products:
-                    # Update existing product
-                    product = existing_products[external_id]
-                    product.name = product_data.name
-                    product.stock = product_data.stock
-                    product.is_active = True
-                    products_updated += 1
-                else:
-                    # Create new product
-                    product = Product(
-                        name=product_data.name,
-                        stock=product_data.stock,
-                        supplier_id=supplier_id,
-                        external_id=external_id,
-                        is_active=True
-                    )
-                    db.add(product)
-                    products_added += 1
+                return SyncResult(supplier_id=supplier_id, status="unchanged", sync_log_id=sync_log.id)
             
-            # Deactivate products not in supplier data
-            for external_id, product in existing_products.items():
-                if external_id not in processed_external_ids and product.is_active:
-                    product.is_active = False
-                    products_deactivated += 1
-            
-            # Update supplier sync info
-            supplier.last_sync_at = datetime.utcnow().isoformat()
-            supplier.sync_metadata = {
-                "products_count": len(supplier_products),
-                "last_sync_status": "success"
+            # The worker thread writing the catalog takes over the file and closes it
+            spooled_catalog, catalog = catalog, None
+            sync_log_id = sync_log.id
+            new_sync_metadata = {
+                **sync_metadata,
+                "catalog_hash": catalog_hash,
+                "catalog_etag": api_client.catalog_etag,
+                "catalog_last_modified": api_client.catalog_last_modified,
             }
-            
-            # Update sync log
-            sync_log.status = "success"
-            sync_log.completed_at = datetime.utcnow()
-            sync_log.products_added = products_added
-            sync_log.products_updated = products_updated
-            sync_log.products_deactivated = products_deactivated
-            
-            # Commit changes
-            db.commit()
-            
-            # Publish event
-            SupplierSyncService._publish_supplier_updated_event(supplier_id)
-            
-            return SyncResult(
-                supplier_id=supplier_id,
-                status="success",
-                products_added=products_added,
-                products_updated=products_updated,
-                products_deactivated=products_deactivated,
-                sync_log_id=sync_log.id
+            return await SupplierSyncService._run_in_worker_session(
+                session_factory,
+                lambda session, cancelled: SupplierSyncService._apply_catalog(
+                    session, supplier_id, sync_log_id, spooled_catalog, new_sync_metadata, cancelled
+                )
             )
             
         except Exception as e:
             logger.error(f"Error syncing supplier {supplier_id}: {str(e)}")
             
+            # Discard the partly applied catalog
+            db.rollback()
+            
             # Update sync log with error
             sync_log.status = "failed"
             sync_log.completed_at = datetime.utcnow()
@@ -151,6 +140,7 @@ class SupplierSyncService:
             
             # Update supplier sync info
             supplier.sync_metadata = {
+                **(supplier.sync_metadata or {}),
                 "last_sync_status": "failed",
                 "last_error": str(e)
             }
@@ -164,28 +154,452 @@ class SupplierSyncService:
                 error_message=str(e),
                 sync_log_id=sync_log.id
             )
+        finally:
+            if catalog is not None:
+                catalog.close()
+    
+    @staticmethod
+    async def _run_in_worker_session(
+        session_factory: Callable[[], Session],
+        work: Callable[[Session, threading.Event], T]
+    ) -> T:
+        """
+        Run blocking database work in a worker thread, with a session owned by that thread,
+        so the event loop keeps serving the other syncs meanwhile
+        
+        If the awaiting task is cancelled (e.g. by SYNC_SUPPLIER_TIMEOUT_S), the work is
+        asked to stop through the event it is given and its running statement is cancelled
+        on the server, so it rolls back rather than finishing after the sync was failed.
+        """
+        cancelled = threading.Event()
+        connections = []
+        
+        def run() -> T:
+            session = session_factory()
+            try:
+                connections.append(session.connection().connection.dbapi_connection)
+                return work(session, cancelled)
+            except BaseException:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+        
+        try:
+            return await asyncio.to_thread(run)
+        except asyncio.CancelledError:
+            cancelled.set()
+            for connection in connections:
+                try:
+                    # psycopg2 allows cancelling a statement from another thread
+                    connection.cancel()
+                except Exception as e:
+                    logger.error(f"Error cancelling sync statement: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _raise_if_cancelled(cancelled: threading.Event) -> None:
+        if cancelled.is_set():
+            raise Exception("Sync cancelled")
+    
+    @staticmethod
+    def _apply_catalog(
+        db: Session,
+        supplier_id: UUID,
+        sync_log_id: UUID,
+        catalog: IO[bytes],
+        sync_metadata: Dict[str, Any],
+        cancelled: threading.Event
+    ) -> SyncResult:
+        """
+        Write a changed catalog to the products of a supplier and record the sync as successful
+        
+        Runs in a worker thread with its own session (see _run_in_worker_session), and
+        closes the spooled catalog when done.
+        """
+        with catalog:
+            # Process products
+            products_added = 0
+            products_updated = 0
+            
+            # Stock-updated events of the rewritten products, published once committed
+            stock_events = []
+            
+            # Seen external IDs are staged in the database for the deactivation below
+            SupplierSyncService._create_seen_staging_table(db)
+            
+            # Apply the catalog in chunks, so only one chunk of products is held at a time
+            chunk = []
+            for product_data in SupplierSyncService._read_spooled_catalog(catalog):
+                chunk.append(product_data)
+                if len(chunk) >= settings.SYNC_CHUNK_SIZE:
+                    SupplierSyncService._raise_if_cancelled(cancelled)
+                    added, updated = SupplierSyncService._apply_catalog_chunk(db, supplier_id, chunk, stock_events)
+                    products_added += added
+                    products_updated += updated
+                    chunk = []
+            if chunk:
+                SupplierSyncService._raise_if_cancelled(cancelled)
+                added, updated = SupplierSyncService._apply_catalog_chunk(db, supplier_id, chunk, stock_events)
+                products_added += added
+                products_updated += updated
+        
+        SupplierSyncService._raise_if_cancelled(cancelled)
+        
+        # Deactivate products not in supplier data
+        deactivated = db.execute(
+            update(Product)
+            .where(
+                Product.supplier_id == supplier_id,
+                Product.is_active.is_(True),
+                Product.external_id.isnot(None),
+                ~exists().where(SYNC_SEEN_PRODUCTS.c.external_id == Product.external_id)
+            )
+            # Readers (stock-checker ETags) only see a new state with a new version
+            .values(is_active=False, version=Product.version + 1)
+            .returning(Product.id, Product.name, Product.stock, Product.reserved_stock, Product.is_active, Product.version)
+        ).all()
+        products_deactivated = len(deactivated)
+        stock_events.extend(SupplierSyncService._stock_updated_event(row) for row in deactivated)
+        products_count = db.execute(select(func.count()).select_from(SYNC_SEEN_PRODUCTS)).scalar()
+        
+        # Update sync log, unless a timeout already marked it failed; the row lock makes
+        # that update wait for this transaction
+        logged = db.execute(
+            update(SupplierSyncLog)
+            .where(SupplierSyncLog.id == sync_log_id, SupplierSyncLog.status == "in_progress")
+            .values(
+                status="success",
+                completed_at=datetime.utcnow(),
+                products_added=products_added,
+                products_updated=products_updated,
+                products_deactivated=products_deactivated
+            )
+        ).rowcount
+        if not logged:
+            raise Exception("Sync cancelled")
+        
+        # Update supplier sync info
+        supplier = db.get(Supplier, supplier_id)
+        supplier.last_sync_at = datetime.utcnow().isoformat()
+        supplier.sync_metadata = {
+            **sync_metadata,
+            "products_count": products_count,
+            "last_sync_status": "success"
+        }
+        
+        # Commit changes
+        db.commit()
+        
+        # Publish events
+        SupplierSyncService._publish_stock_updated_events(stock_events)
+        SupplierSyncService._publish_supplier_updated_event(supplier_id)
+        
+        return SyncResult(
+            supplier_id=supplier_id,
+            status="success",
+            products_added=products_added,
+            products_updated=products_updated,
+            products_deactivated=products_deactivated,
+            sync_log_id=sync_log_id
+        )
+    
+    @staticmethod
+    def _synced_recently(supplier: Supplier) -> bool:
+        """
+        Whether the supplier was synced successfully less than SYNC_MIN_INTERVAL_S ago
+        """
+        sync_status = (supplier.sync_metadata or {}).get("last_sync_status")
+        if not supplier.last_sync_at or sync_status not in ("success", "unchanged"):
+            return False
+        try:
+            last_sync_at = datetime.fromisoformat(supplier.last_sync_at)
+        except ValueError:
+            return False
+        return (datetime.utcnow() - last_sync_at).total_seconds() < settings.SYNC_MIN_INTERVAL_S
+    
+    @staticmethod
+    async def _spool_catalog(
+        api_client: SupplierApiClient,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> Tuple[IO[bytes], str]:
+        """
+        Download the normalized catalog to a spooled temporary file and hash it
+        
+        The file stays in memory up to SYNC_SPOOL_MAX_MEMORY_BYTES and moves to disk
+        beyond that, so the catalog can be compared before anything is written without
+        holding it all in memory. It is empty if the catalog was not modified.
+        
+        Returns:
+            The file, positioned at its start, and the SHA-256 of its content
+        """
+        catalog = tempfile.SpooledTemporaryFile(max_size=settings.SYNC_SPOOL_MAX_MEMORY_BYTES)
+        catalog_hash = hashlib.sha256()
+        try:
+            async for product_data in api_client.iter_catalog(etag=etag, last_modified=last_modified):
+                line = product_data.model_dump_json().encode() + b"\n"
+                catalog_hash.update(line)
+                catalog.write(line)
+        except Exception:
+            catalog.close()
+            raise
+        
+        catalog.seek(0)
+        return catalog, catalog_hash.hexdigest()
+    
+    @staticmethod
+    def _read_spooled_catalog(catalog: IO[bytes]) -> Iterator[SupplierProductData]:
+        for line in catalog:
+            yield SupplierProductData.model_validate_json(line)
+    
+    @staticmethod
+    def _create_seen_staging_table(db: Session) -> None:
+        """
+        Create the temporary table of the external IDs seen by the current sync; it is dropped on commit
+        """
+        db.execute(text(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS sync_seen_products "
+            "(external_id VARCHAR(255) PRIMARY KEY) ON COMMIT DROP"
+        ))
+    
+    @staticmethod
+    def _upsert_statement(supplier_id: UUID, chunk: List[SupplierProductData]):
+        """
+        INSERT ... ON CONFLICT statement adding the new products of a chunk and updating
+        the changed ones, returning whether each written row was inserted and its new state
+        
+        Stock is never set below what stock-updater reservations hold, which would
+        leave reserved units that no longer exist.
+        """
+        # A statement can only write each row once, so the last entry of a repeated external ID wins
+        products = {product_data.external_id: product_data for product_data in chunk}
+        statement = insert(Product).values([
+            {
+                "id": uuid.uuid4(),
+                "name": product_data.name,
+                "stock": product_data.stock,
+                "supplier_id": supplier_id,
+                "external_id": external_id,
+                "is_active": True,
+                "version": 0,
+            }
+            for external_id, product_data in products.items()
+        ])
+        excluded = statement.excluded
+        stock = func.greatest(excluded.stock, Product.reserved_stock)
+        return statement.on_conflict_do_update(
+            index_elements=[Product.supplier_id, Product.external_id],
+            set_={
+                "name": excluded.name,
+                "stock": stock,
+                "is_active": True,
+                # Readers (stock-checker ETags) only see a new state with a new version
+                "version": Product.version + 1,
+            },
+            # Unchanged products are not written at all
+            where=or_(
+                Product.name.is_distinct_from(excluded.name),
+                Product.stock.is_distinct_from(stock),
+                Product.is_active.isnot(True)
+            )
+        ).returning(
+            literal_column("xmax = 0").label("inserted"),
+            Product.external_id,
+            Product.id,
+            Product.name,
+            Product.stock,
+            Product.reserved_stock,
+            Product.is_active,
+            Product.version
+        )
+    
+    @staticmethod
+    def _apply_catalog_chunk(
+        db: Session,
+        supplier_id: UUID,
+        chunk: List[SupplierProductData],
+        stock_events: List[StockUpdated]
+    ) -> Tuple[int, int]:
+        """
+        Upsert the products of one catalog chunk and stage their external IDs, within the sync transaction
+        
+        A stock-updated event is added to stock_events for each updated product; new
+        products can't be cached by stock-checker yet.
+        
+        Returns:
+            Number of products added and updated
+        """
+        db.execute(
+            text(
+                "INSERT INTO sync_seen_products (external_id) SELECT unnest(:external_ids) "
+                "ON CONFLICT DO NOTHING"
+            ),
+            {"external_ids": [product_data.external_id for product_data in chunk]}
+        )
+        
+        written = db.execute(SupplierSyncService._upsert_statement(supplier_id, chunk)).all()
+        products_added = sum(1 for row in written if row.inserted)
+        stock_events.extend(SupplierSyncService._stock_updated_event(row) for row in written if not row.inserted)
+        
+        # Rows whose catalog stock was below their reserved stock were written with the reserved stock
+        catalog_stock = {product_data.external_id: product_data.stock for product_data in chunk}
+        clamped = [row.external_id for row in written if row.stock > catalog_stock[row.external_id]]
+        if clamped:
+            logger.warning(
+                f"Supplier {supplier_id}: catalog stock of {len(clamped)} products is below their "
+                f"reserved stock, kept at the reserved stock: {', '.join(clamped[:10])}"
+            )
+        
+        return products_added, len(written) - products_added
+    
+    @staticmethod
+    def _stock_updated_event(row) -> StockUpdated:
+        return StockUpdated(
+            product_id=row.id,
+            name=row.name,
+            new_stock=row.stock,
+            reserved_stock=row.reserved_stock,
+            is_active=row.is_active,
+            version=row.version,
+            timestamp=datetime.utcnow()
+        )
     
     @staticmethod
-    async def sync_all_suppliers(db: Session, force: bool = False) -> List[SyncResult]:
+    async def sync_all_suppliers(
+        db: Session,
+        force: bool = False,
+        session_factory: Callable[[], Session] = SessionLocal
+    ) -> List[SyncResult]:
         """
         Synchronize products from all suppliers
         
+        Suppliers are synced concurrently, at most SYNC_MAX_CONCURRENCY at a time, each
+        with its own DB session and a SYNC_SUPPLIER_TIMEOUT_S time limit. A supplier that
+        fails or times out doesn't stop the others.
+        
         Args:
-            db: Database session
+            db: Database session, used to list the suppliers
             force: Force sync even if recently synced
+            session_factory: Creates the session each supplier is synced with
             
         Returns:
-            List of SyncResults for each supplier
+            List of SyncResults for each supplier, in the order they finished
         """
-        suppliers = db.query(Supplier).all()
-        results = []
+        supplier_ids = [supplier_id for (supplier_id,) in db.query(Supplier.id).all()]
+        semaphore = asyncio.Semaphore(settings.SYNC_MAX_CONCURRENCY)
         
-        for supplier in suppliers:
-            result = await SupplierSyncService.sync_supplier(db, supplier.id, force)
+        syncs = [
+            SupplierSyncService._sync_supplier_isolated(supplier_id, force, semaphore, session_factory)
+            for supplier_id in supplier_ids
+        ]
+        
+        results = []
+        for finished in asyncio.as_completed(syncs):
+            result = await finished
+            logger.info(f"Supplier {result.supplier_id} sync finished: {result.status}")
             results.append(result)
         
         return results
     
+    @staticmethod
+    async def _sync_supplier_isolated(
+        supplier_id: UUID,
+        force: bool,
+        semaphore: asyncio.Semaphore,
+        session_factory: Callable[[], Session]
+    ) -> SyncResult:
+        """
+        Sync one supplier in its own session and time limit, turning any error into a failed result
+        """
+        async with semaphore:
+            db = session_factory()
+            try:
+                return await asyncio.wait_for(
+                    SupplierSyncService.sync_supplier(db, supplier_id, force, session_factory),
+                    timeout=settings.SYNC_SUPPLIER_TIMEOUT_S
+                )
+            except asyncio.TimeoutError:
+                error_message = f"Sync timed out after {settings.SYNC_SUPPLIER_TIMEOUT_S}s"
+                logger.error(f"Error syncing supplier {supplier_id}: {error_message}")
+                SupplierSyncService._fail_in_progress_sync(db, supplier_id, error_message)
+                return SyncResult(supplier_id=supplier_id, status="failed", error_message=error_message)
+            except Exception as e:
+                logger.error(f"Error syncing supplier {supplier_id}: {str(e)}")
+                return SyncResult(supplier_id=supplier_id, status="failed", error_message=str(e))
+            finally:
+                db.close()
+    
+    @staticmethod
+    def _fail_in_progress_sync(db: Session, supplier_id: UUID, error_message: str) -> None:
+        """
+        Mark the sync log of an interrupted sync as failed, discarding its uncommitted changes
+        """
+        try:
+            db.rollback()
+            db.query(SupplierSyncLog)\
+                .filter(SupplierSyncLog.supplier_id == supplier_id, SupplierSyncLog.status == "in_progress")\
+                .update(
+                    {"status": "failed", "completed_at": datetime.utcnow(), "error_message": error_message},
+                    synchronize_session=False
+                )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error updating sync log of supplier {supplier_id}: {str(e)}")
+    
+    @staticmethod
+    def _connect_rabbitmq() -> pika.BlockingConnection:
+        return pika.BlockingConnection(
+            pika.ConnectionParameters(
+                host=settings.RABBITMQ_HOST,
+                port=settings.RABBITMQ_PORT,
+                virtual_host=settings.RABBITMQ_VHOST,
+                credentials=pika.PlainCredentials(
+                    settings.RABBITMQ_USER, 
+                    settings.RABBITMQ_PASSWORD
+                )
+            )
+        )
+    
+    @staticmethod
+    def _publish_stock_updated_events(stock_events: List[StockUpdated]) -> None:
+        """
+        Publish the stock-updated events of a sync to RabbitMQ, over one connection
+        
+        stock-checker updates or drops its cached entries from them; if they are lost,
+        its entries expire after their TTL.
+        """
+        if not stock_events:
+            return
+        
+        try:
+            connection = SupplierSyncService._connect_rabbitmq()
+            channel = connection.channel()
+            
+            channel.exchange_declare(
+                exchange=settings.STOCK_EVENTS_EXCHANGE,
+                exchange_type="topic",
+                durable=True
+            )
+            
+            # stock-checker decodes JSON only
+            for event in stock_events:
+                channel.basic_publish(
+                    exchange=settings.STOCK_EVENTS_EXCHANGE,
+                    routing_key=settings.STOCK_UPDATED_TOPIC,
+                    body=encode_event(event, "application/json"),
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,  # make message persistent
+                        content_type="application/json"
+                    )
+                )
+            
+            connection.close()
+            
+        except Exception as e:
+            logger.error(f"Error publishing stock updated events: {str(e)}")
+            # Don't raise exception, as this is a non-critical operation
+    
     @staticmethod
     def _publish_supplier_updated_event(supplier_id: UUID) -> None:
         """
@@ -196,17 +610,7 @@ class SupplierSyncService:
         """
         try:
             # Connect to RabbitMQ
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=settings.RABBITMQ_HOST,
-                    port=settings.RABBITMQ_PORT,
-                    virtual_host=settings.RABBITMQ_VHOST,
-                    credentials=pika.PlainCredentials(
-                        settings.RABBITMQ_USER, 
-                        settings.RABBITMQ_PASSWORD
-                    )
-                )
-            )
+            connection = SupplierSyncService._connect_rabbitmq()
             channel = connection.channel()
             
             # Declare exchange
@@ -217,20 +621,19 @@ class SupplierSyncService:
             )
             
             # Create message
-            message = {
-                "supplier_id": str(supplier_id),
-                "event_type": "supplier_data_updated",
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            event = SupplierDataUpdatedV1(
+                supplier_id=supplier_id,
+                timestamp=datetime.utcnow()
+            )
             
             # Publish message
             channel.basic_publish(
                 exchange="inventory",
                 routing_key=settings.SUPPLIER_DATA_UPDATED_TOPIC,
-                body=json.dumps(message),
+                body=encode_event(event, settings.EVENTS_CONTENT_TYPE),
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # make message persistent
-                    content_type="application/json"
+                    content_type=settings.EVENTS_CONTENT_TYPE
                 )
             )
             
@@ -1,16 +1,47 @@
+import asyncio
 import logging
 from uuid import UUID
-from typing import List, Optional
+from typing import Any, Coroutine, List, Optional
 
+from celery.signals import worker_process_shutdown, worker_shutdown
 from sqlalchemy.orm import Session
 
 from app.celery_app import celery_app
 from app.db.database import SessionLocal
+from app.services.supplier_api_client import supplier_http_clients
 from app.services.supplier_sync_service import SupplierSyncService
 from app.schemas.supplier import SyncResult
 
 logger = logging.getLogger(__name__)
 
+# Event loop of this worker process, kept open between tasks so the pooled
+# supplier API connections (bound to it) are reused
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _run(coroutine: Coroutine) -> Any:
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coroutine)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_http_clients(**kwargs) -> None:
+    """
+    Close the supplier API connections and the event loop when the worker stops
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        return
+    try:
+        _loop.run_until_complete(supplier_http_clients.close())
+    finally:
+        _loop.close()
+        _loop = None
+
 
 @celery_app.task(name="app.tasks.sync_supplier")
 def sync_supplier(supplier_id: str, force: bool = False) -> dict:
@@ -83,23 +114,11 @@ def sync_supplier_sync(db: Session, supplier_id: UUID, force: bool = False) -> S
     """
     Synchronous version of supplier sync for Celery task
     """
-    import asyncio
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(SupplierSyncService.sync_supplier(db, supplier_id, force))
-    finally:
-        loop.close()
+    return _run(SupplierSyncService.sync_supplier(db, supplier_id, force))
 
 
 def sync_all_suppliers_sync(db: Session, force: bool = False) -> List[SyncResult]:
     """
     Synchronous version of all suppliers sync for Celery task
     """
-    import asyncio
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(SupplierSyncService.sync_all_suppliers(db, force))
-    finally:
-        loop.close()
+    return _run(SupplierSyncService.sync_all_suppliers(db, force))
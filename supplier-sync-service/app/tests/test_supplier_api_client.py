@@ -0,0 +1,195 @@
+import asyncio
+import pytest
+
+from app.services.supplier_api_client import SupplierHttpClients
+
+
+class TestSupplierHttpClients:
+    def test_client_is_reused_per_base_url_and_loop(self):
+        clients = SupplierHttpClients()
+        
+        async def get_clients():
+            return (
+                clients.get("https://api.example.com"),
+                clients.get("https://api.example.com"),
+                clients.get("https://api.other.com"),
+            )
+        
+        loop = asyncio.new_event_loop()
+        try:
+            first, again, other = loop.run_until_complete(get_clients())
+            
+            # Assertions
+            assert first is again
+            assert first is not other
+            
+            loop.run_until_complete(clients.close())
+            assert first.is_closed
+            assert other.is_closed
+        finally:
+            loop.close()
+    
+    def test_new_loop_gets_new_client(self):
+        clients = SupplierHttpClients()
+        
+        async def get_client():
+            return clients.get("https://api.example.com")
+        
+        first_loop = asyncio.new_event_loop()
+        second_loop = asyncio.new_event_loop()
+        try:
+            first = first_loop.run_until_complete(get_client())
+            second = second_loop.run_until_complete(get_client())
+            
+            # Assertions
+            assert first is not second
+            second_loop.run_until_complete(clients.close())
+        finally:
+            first_loop.close()
+            second_loop.close()
+
+
+class TestSupplierApiClientCatalog:
+    def _client(self, pages, config):
+        """
+        Supplier client whose HTTP responses are the given JSON bodies, one per request
+        """
+        import httpx
+        from unittest.mock import patch
+        from app.services.supplier_api_client import SupplierApiClient
+        
+        requests = []
+        
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, content=pages[len(requests) - 1])
+        
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.dict('app.core.config.settings.SUPPLIER_APIS', {"test": config}):
+            client = SupplierApiClient("test")
+        return client, http_client, requests
+    
+    def _collect(self, client, http_client):
+        from unittest.mock import patch
+        
+        async def collect():
+            return [product async for product in client.iter_catalog()]
+        
+        with patch('app.services.supplier_api_client.supplier_http_clients') as mock_clients:
+            mock_clients.get.return_value = http_client
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(collect())
+            finally:
+                loop.close()
+    
+    def test_page_pagination_stops_at_empty_page(self):
+        config = {
+            "name": "Test", "base_url": "https://api.example.com", "api_key": "key",
+            "catalog_endpoint": "/catalog", "auth_type": "header", "auth_header": "X-API-Key",
+            "pagination": {"style": "page", "page_size": 2},
+        }
+        pages = [
+            b'{"products": [{"id": 1, "name": "A", "stock": 1}, {"id": 2, "name": "B", "stock": 2}]}',
+            b'{"products": [{"id": 3, "name": "C", "stock": 3, "tags": {"x": [1, 2]}}]}',
+            b'{"products": []}',
+        ]
+        client, http_client, requests = self._client(pages, config)
+        
+        products = self._collect(client, http_client)
+        
+        # Assertions: a short page is not taken as the last one
+        assert [product.external_id for product in products] == ["1", "2", "3"]
+        assert products[2].metadata["tags"] == {"x": [1, 2]}
+        assert [request.url.params["page"] for request in requests] == ["1", "2", "3"]
+        assert requests[0].headers["X-API-Key"] == "key"
+    
+    def test_offset_pagination_stops_at_total(self):
+        config = {
+            "name": "Test", "base_url": "https://api.example.com", "api_key": "key",
+            "catalog_endpoint": "/catalog", "auth_type": "header", "auth_header": "X-API-Key",
+            "pagination": {"style": "offset", "page_size": 100},
+        }
+        # The supplier caps pages at 2 products
+        pages = [
+            b'{"products": [{"id": 1, "name": "A"}, {"id": 2, "name": "B"}], "total": 3}',
+            b'{"products": [{"id": 3, "name": "C"}], "total": 3}',
+        ]
+        client, http_client, requests = self._client(pages, config)
+        
+        products = self._collect(client, http_client)
+        
+        # Assertions
+        assert [product.external_id for product in products] == ["1", "2", "3"]
+        assert [request.url.params["offset"] for request in requests] == ["0", "2"]
+    
+    def test_paginated_catalog_ending_before_total_raises(self):
+        config = {
+            "name": "Test", "base_url": "https://api.example.com", "api_key": "key",
+            "catalog_endpoint": "/catalog", "auth_type": "header", "auth_header": "X-API-Key",
+            "pagination": {"style": "page", "page_size": 2},
+        }
+        pages = [
+            b'{"products": [{"id": 1, "name": "A"}, {"id": 2, "name": "B"}], "total": 5}',
+            b'{"products": [], "total": 5}',
+        ]
+        client, http_client, requests = self._client(pages, config)
+        
+        # Assertions
+        with pytest.raises(Exception, match="ended after 2 of 5 products"):
+            self._collect(client, http_client)
+    
+    def test_cursor_pagination_follows_next_cursor(self):
+        config = {
+            "name": "Test", "base_url": "https://api.example.com", "api_key": "key",
+            "catalog_endpoint": "/catalog", "auth_type": "query", "auth_param": "api_key",
+            "items_keys": ["items"], "pagination": {"style": "cursor", "page_size": 100},
+        }
+        pages = [
+            b'{"items": [{"id": "a", "name": "A"}], "next_cursor": "c1"}',
+            b'{"items": [{"id": "b", "name": "B"}], "next_cursor": null}',
+        ]
+        client, http_client, requests = self._client(pages, config)
+        
+        products = self._collect(client, http_client)
+        
+        # Assertions
+        assert [product.external_id for product in products] == ["a", "b"]
+        assert "cursor" not in requests[0].url.params
+        assert requests[1].url.params["cursor"] == "c1"
+    
+    def test_unpaginated_catalog_is_fetched_conditionally(self):
+        import httpx
+        from unittest.mock import patch
+        from app.services.supplier_api_client import SupplierApiClient
+        
+        config = {
+            "name": "Test", "base_url": "https://api.example.com", "api_key": "key",
+            "catalog_endpoint": "/catalog", "auth_type": "header", "auth_header": "X-API-Key",
+        }
+        requests = []
+        
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(304)
+        
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.dict('app.core.config.settings.SUPPLIER_APIS', {"test": config}):
+            client = SupplierApiClient("test")
+        
+        async def collect():
+            return [product async for product in client.iter_catalog(etag='"v1"', last_modified="Mon, 01 Sep 2025 00:00:00 GMT")]
+        
+        with patch('app.services.supplier_api_client.supplier_http_clients') as mock_clients:
+            mock_clients.get.return_value = http_client
+            loop = asyncio.new_event_loop()
+            try:
+                products = loop.run_until_complete(collect())
+            finally:
+                loop.close()
+        
+        # Assertions
+        assert products == []
+        assert client.catalog_not_modified
+        assert requests[0].headers["If-None-Match"] == '"v1"'
+        assert requests[0].headers["If-Modified-Since"] == "Mon, 01 Sep 2025 00:00:00 GMT"
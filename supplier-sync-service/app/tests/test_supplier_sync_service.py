@@ -1,5 +1,8 @@
+import hashlib
+import json
 import pytest
 import uuid
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch, AsyncMock
 from datetime import datetime
 
@@ -63,31 +66,53 @@ class TestSupplierSyncService:
         mock_supplier = MagicMock()
         mock_supplier.id = supplier_id
         mock_supplier.api_code = "supplier1"
+        mock_supplier.last_sync_at = None
+        mock_supplier.sync_metadata = None
         
         # Mock DB session
         mock_db = MagicMock()
         mock_db.query().filter().first.return_value = mock_supplier
+        mock_db.get.return_value = mock_supplier
         
-        # Mock existing products
-        mock_product1 = MagicMock()
-        mock_product1.external_id = "ext1"
-        mock_product1.is_active = True
-        
-        mock_product2 = MagicMock()
-        mock_product2.external_id = "ext2"
-        mock_product2.is_active = True
-        
-        mock_db.query().filter().all.return_value = [mock_product1, mock_product2]
+        # Mock statement results: the upsert inserts ext3 and updates ext1, the
+        # deactivation hits ext2
+        product1_id = uuid.uuid4()
+        product2_id = uuid.uuid4()
+        mock_result = MagicMock()
+        mock_result.all.side_effect = [
+            [
+                SimpleNamespace(
+                    inserted=False, external_id="ext1", id=product1_id, name="Updated Product",
+                    stock=10, reserved_stock=0, is_active=True, version=2
+                ),
+                SimpleNamespace(
+                    inserted=True, external_id="ext3", id=uuid.uuid4(), name="New Product",
+                    stock=5, reserved_stock=0, is_active=True, version=0
+                )
+            ],
+            [
+                SimpleNamespace(
+                    id=product2_id, name="Old Product", stock=3, reserved_stock=1, is_active=False, version=5
+                )
+            ]
+        ]
+        mock_result.rowcount = 1
+        mock_result.scalar.return_value = 2
+        mock_db.execute.return_value = mock_result
         
         # Mock API client
         mock_api_client = AsyncMock()
         mock_api_client_class.return_value = mock_api_client
         
         # Mock supplier products from API
-        mock_api_client.get_catalog.return_value = [
-            SupplierProductData(external_id="ext1", name="Updated Product", stock=10),
-            SupplierProductData(external_id="ext3", name="New Product", stock=5)
-        ]
+        async def iter_catalog():
+            yield SupplierProductData(external_id="ext1", name="Updated Product", stock=10)
+            yield SupplierProductData(external_id="ext3", name="New Product", stock=5)
+        
+        mock_api_client.iter_catalog = MagicMock(return_value=iter_catalog())
+        mock_api_client.catalog_not_modified = False
+        mock_api_client.catalog_etag = '"v2"'
+        mock_api_client.catalog_last_modified = None
         
         # Mock sync log
         mock_sync_log = MagicMock()
@@ -109,7 +134,9 @@ class TestSupplierSyncService:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             try:
-                result = loop.run_until_complete(SupplierSyncService.sync_supplier(mock_db, supplier_id))
+                result = loop.run_until_complete(
+                    SupplierSyncService.sync_supplier(mock_db, supplier_id, session_factory=lambda: mock_db)
+                )
             finally:
                 loop.close()
             
@@ -123,11 +150,124 @@ class TestSupplierSyncService:
             # Verify DB operations
             mock_db.add.assert_called()
             assert mock_db.commit.call_count >= 1
+            assert mock_supplier.sync_metadata["products_count"] == 2
+            assert mock_supplier.sync_metadata["catalog_etag"] == '"v2"'
+            assert len(mock_supplier.sync_metadata["catalog_hash"]) == 64
+            # The worker thread's session is closed
+            mock_db.close.assert_called_once()
             
-            # Verify RabbitMQ publish
-            mock_channel.exchange_declare.assert_called_once()
-            mock_channel.basic_publish.assert_called_once()
-            mock_connection.close.assert_called_once()
+            # Verify RabbitMQ publish: stock-updated events for the updated and the
+            # deactivated product, then the supplier event
+            publishes = mock_channel.basic_publish.call_args_list
+            assert [call.kwargs["routing_key"] for call in publishes] == [
+                "stock-updated", "stock-updated", "supplier-data-updated"
+            ]
+            updated_event = json.loads(publishes[0].kwargs["body"])
+            assert updated_event["product_id"] == str(product1_id)
+            assert updated_event["new_stock"] == 10
+            assert updated_event["version"] == 2
+            deactivated_event = json.loads(publishes[1].kwargs["body"])
+            assert deactivated_event["product_id"] == str(product2_id)
+            assert deactivated_event["is_active"] is False
+            assert mock_connection.close.call_count == 2
+    
+    @patch('app.services.supplier_sync_service.SupplierApiClient')
+    def test_sync_supplier_unchanged_catalog(self, mock_api_client_class):
+        product = SupplierProductData(external_id="ext1", name="Product", stock=10)
+        catalog_hash = hashlib.sha256(product.model_dump_json().encode() + b"\n").hexdigest()
+        
+        # Mock supplier, last synced with the same catalog
+        supplier_id = uuid.uuid4()
+        mock_supplier = MagicMock()
+        mock_supplier.id = supplier_id
+        mock_supplier.api_code = "supplier1"
+        mock_supplier.last_sync_at = None
+        mock_supplier.sync_metadata = {"catalog_hash": catalog_hash, "catalog_etag": '"v1"'}
+        
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.query().filter().first.return_value = mock_supplier
+        
+        # Mock API client
+        async def iter_catalog():
+            yield product
+        
+        mock_api_client = AsyncMock()
+        mock_api_client_class.return_value = mock_api_client
+        mock_api_client.iter_catalog = MagicMock(return_value=iter_catalog())
+        mock_api_client.catalog_not_modified = False
+        # Same content, new validators
+        mock_api_client.catalog_etag = '"v2"'
+        mock_api_client.catalog_last_modified = "Tue, 02 Sep 2025 00:00:00 GMT"
+        
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            result = loop.run_until_complete(SupplierSyncService.sync_supplier(mock_db, supplier_id))
+        finally:
+            loop.close()
+        
+        # Assertions
+        assert result.status == "unchanged"
+        mock_api_client.iter_catalog.assert_called_once_with(etag='"v1"', last_modified=None)
+        mock_db.execute.assert_not_called()
+        assert mock_supplier.sync_metadata["last_sync_status"] == "unchanged"
+        assert mock_supplier.sync_metadata["catalog_etag"] == '"v2"'
+        assert mock_supplier.sync_metadata["catalog_last_modified"] == "Tue, 02 Sep 2025 00:00:00 GMT"
+        assert mock_supplier.sync_metadata["catalog_hash"] == catalog_hash
+    
+    def test_recent_sync_is_skipped_unless_forced(self):
+        # Mock supplier synced a moment ago
+        mock_supplier = MagicMock()
+        mock_supplier.id = uuid.uuid4()
+        mock_supplier.api_code = "supplier1"
+        mock_supplier.last_sync_at = datetime.utcnow().isoformat()
+        mock_supplier.sync_metadata = {"last_sync_status": "success"}
+        
+        # Mock DB session
+        mock_db = MagicMock()
+        mock_db.query().filter().first.return_value = mock_supplier
+        
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            result = loop.run_until_complete(SupplierSyncService.sync_supplier(mock_db, mock_supplier.id))
+        finally:
+            loop.close()
+        
+        # Assertions
+        assert result.status == "skipped"
+        mock_db.add.assert_not_called()
+        
+        # Only successful syncs count as recent
+        assert SupplierSyncService._synced_recently(mock_supplier)
+        mock_supplier.sync_metadata = {"last_sync_status": "failed"}
+        assert not SupplierSyncService._synced_recently(mock_supplier)
+    
+    def test_upsert_statement_only_writes_changed_products(self):
+        from sqlalchemy.dialects import postgresql
+        
+        statement = SupplierSyncService._upsert_statement(uuid.uuid4(), [
+            SupplierProductData(external_id="ext1", name="Old Name", stock=1),
+            SupplierProductData(external_id="ext2", name="Product", stock=2),
+            SupplierProductData(external_id="ext1", name="New Name", stock=3),
+        ])
+        compiled = statement.compile(dialect=postgresql.dialect())
+        sql = str(compiled)
+        
+        # Assertions
+        assert "ON CONFLICT (supplier_id, external_id) DO UPDATE" in sql
+        assert "products.name IS DISTINCT FROM excluded.name" in sql
+        # Stock is clamped to the reserved stock, in the update and in the change check
+        assert "stock = greatest(excluded.stock, products.reserved_stock)" in sql
+        assert "products.stock IS DISTINCT FROM greatest(excluded.stock, products.reserved_stock)" in sql
+        assert "version = (products.version +" in sql
+        assert "RETURNING xmax = 0 AS inserted, products.external_id, products.id, products.name, products.stock" in sql
+        # Repeated external IDs are written once, with their last values
+        assert [value for key, value in compiled.params.items() if key.startswith("external_id")] == ["ext1", "ext2"]
+        assert [value for key, value in compiled.params.items() if key.startswith("name")] == ["New Name", "Product"]
     
     @patch('app.services.supplier_sync_service.SupplierApiClient')
     def test_sync_supplier_api_error(self, mock_api_client_class):
@@ -136,6 +276,8 @@ class TestSupplierSyncService:
         mock_supplier = MagicMock()
         mock_supplier.id = supplier_id
         mock_supplier.api_code = "supplier1"
+        mock_supplier.last_sync_at = None
+        mock_supplier.sync_metadata = None
         
         # Mock DB session
         mock_db = MagicMock()
@@ -144,7 +286,14 @@ class TestSupplierSyncService:
         # Mock API client with error
         mock_api_client = AsyncMock()
         mock_api_client_class.return_value = mock_api_client
-        mock_api_client.get_catalog.side_effect = Exception("API connection error")
+        async def iter_catalog():
+            raise Exception("API connection error")
+            yield
+        
+        mock_api_client.iter_catalog = MagicMock(return_value=iter_catalog())
+        mock_api_client.catalog_not_modified = False
+        mock_api_client.catalog_etag = '"v2"'
+        mock_api_client.catalog_last_modified = None
         
         # Mock sync log
         mock_sync_log = MagicMock()
@@ -170,3 +319,97 @@ class TestSupplierSyncService:
         # Verify DB operations
         mock_db.add.assert_called()
         assert mock_db.commit.call_count >= 1
+        mock_db.rollback.assert_called_once()
+    
+    def test_sync_all_suppliers_isolates_failures(self):
+        ok_id, failing_id, slow_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        
+        # Mock DB session listing the suppliers
+        mock_db = MagicMock()
+        mock_db.query().all.return_value = [(ok_id,), (failing_id,), (slow_id,)]
+        sessions = []
+        
+        def session_factory():
+            sessions.append(MagicMock())
+            return sessions[-1]
+        
+        import asyncio
+        
+        synced_with = {}
+        
+        async def sync_supplier(db, supplier_id, force, session_factory):
+            synced_with[supplier_id] = db
+            if supplier_id == failing_id:
+                raise Exception("API connection error")
+            if supplier_id == slow_id:
+                await asyncio.sleep(10)
+            return SyncResult(supplier_id=supplier_id, status="success")
+        
+        with patch.object(SupplierSyncService, 'sync_supplier', side_effect=sync_supplier), \
+                patch('app.services.supplier_sync_service.settings') as mock_settings:
+            mock_settings.SYNC_MAX_CONCURRENCY = 2
+            mock_settings.SYNC_SUPPLIER_TIMEOUT_S = 0.05
+            
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                results = loop.run_until_complete(
+                    SupplierSyncService.sync_all_suppliers(mock_db, session_factory=session_factory)
+                )
+            finally:
+                loop.close()
+        
+        # Assertions
+        statuses = {result.supplier_id: result for result in results}
+        assert statuses[ok_id].status == "success"
+        assert statuses[failing_id].status == "failed"
+        assert "API connection error" in statuses[failing_id].error_message
+        assert statuses[slow_id].status == "failed"
+        assert "timed out" in statuses[slow_id].error_message
+        
+        # One session per supplier, all closed
+        assert len(sessions) == 3
+        for session in sessions:
+            session.close.assert_called_once()
+        assert len(set(map(id, synced_with.values()))) == 3
+        synced_with[slow_id].rollback.assert_called_once()
+    
+    def test_cancelled_db_phase_stops_and_cancels_statement(self):
+        import asyncio
+        import threading
+        
+        # Mock the worker thread's session
+        mock_session = MagicMock()
+        started = threading.Event()
+        stopped = []
+        
+        def work(session, cancelled):
+            started.set()
+            cancelled.wait(5)
+            stopped.append(cancelled.is_set())
+            raise Exception("Sync cancelled")
+        
+        async def run():
+            task = asyncio.ensure_future(
+                SupplierSyncService._run_in_worker_session(lambda: mock_session, work)
+            )
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(run())
+            # Let the worker thread finish
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            loop.close()
+        
+        # Assertions
+        assert stopped == [True]
+        mock_session.connection().connection.dbapi_connection.cancel.assert_called_once()
+        mock_session.rollback.assert_called_once()
+        mock_session.close.assert_called_once()